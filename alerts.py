@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+ERROR_SUMMARY = (
+    'Ошибка {} ({}) повторилась ещё {} раз за {} мин. Последняя: {}'
+)
+
+Summary = namedtuple('Summary', ('chat_id', 'fingerprint', 'started', 'text'))
+
+
+def fingerprint(error, stage=None):
+    """Отпечаток ошибки: тип исключения и место, где оно возникло.
+
+    Текст ошибки в отпечаток не входит: в нём бывают параметры запроса
+    и время, из-за которых одинаковые ошибки выглядели бы разными.
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    origin = stage or ''
+    if frames:
+        frame = frames[-1]
+        origin = f'{origin}/{os.path.basename(frame.filename)}:{frame.name}'
+    return type(error).__name__, origin
+
+
+class _Window:
+
+    __slots__ = ('started', 'count', 'last')
+
+    def __init__(self, started):
+        self.started = started
+        self.count = 0
+        self.last = ''
+
+
+class ErrorAlerter:
+    """Ограничивает оповещения об ошибках: одно на отпечаток за интервал.
+
+    Первая ошибка с новым отпечатком сообщается сразу и открывает окно.
+    Повторы внутри окна только считаются; когда окно истекает, по ним
+    отправляется одна сводка. Если ошибка повторилась после конца окна
+    раньше, чем вызван flush(), отдельного оповещения нет: повторы
+    уходят сводкой, а эта ошибка считается в следующем окне.
+    """
+
+    def __init__(self, interval=3600, clock=time.monotonic):
+        """Окно длится interval секунд по часам clock."""
+        self.interval = interval
+        self.clock = clock
+        self._windows = {}
+        self._summaries = []
+        self._lock = threading.Lock()
+
+    def record(self, chat_id, error, stage=None):
+        """Учитывает ошибку; возвращает отпечаток, если сообщить сразу."""
+        key = (chat_id, fingerprint(error, stage))
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window.started >= self.interval:
+                if not window.count:
+                    window = None
+                else:
+                    self._summaries.append(self._summary(key, window))
+                    window = self._windows[key] = _Window(now)
+            if window is None:
+                self._windows[key] = _Window(now)
+                return key[1]
+            window.count += 1
+            window.last = str(error)
+            return None
+
+    def flush(self):
+        """Закрывает истёкшие окна и возвращает сводки по повторам."""
+        now = self.clock()
+        with self._lock:
+            summaries, self._summaries = self._summaries, []
+            for key, window in list(self._windows.items()):
+                if now - window.started < self.interval:
+                    continue
+                if not window.count:
+                    del self._windows[key]
+                    continue
+                summaries.append(self._summary(key, window))
+                # Сводка открывает следующее окно, как первая ошибка.
+                self._windows[key] = _Window(now)
+        return summaries
+
+    def _summary(self, key, window):
+        chat_id, error_fingerprint = key
+        return Summary(
+            chat_id, error_fingerprint, window.started,
+            ERROR_SUMMARY.format(
+                *error_fingerprint, window.count,
+                round(self.interval / 60), window.last
+            )
+        )
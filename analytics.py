@@ -0,0 +1,144 @@
+from collections import namedtuple
+
+import numpy as np
+
+from history import ENTRY, KEY_OFFSET, NO_TIMESTAMP, HistoryReader
+
+HOUR = 60 * 60
+PERIODS = {'day': 24 * HOUR, 'week': 7 * 24 * HOUR}
+PERCENTILES = (50, 90, 95, 99)
+
+# Заголовок записи журнала истории (см. history.ENTRY) как тип NumPy.
+ENTRY_DTYPE = np.dtype({
+    'names': ['detected', 'updated', 'status', 'subscription', 'length'],
+    'formats': ['<f8', '<i8', 'u1', 'S8', '<u2'],
+    'offsets': [0, 8, 16, 17, 25],
+    'itemsize': ENTRY.size,
+})
+
+Columns = namedtuple('Columns', ('homework', 'status', 'time'))
+Period = namedtuple('Period', ('start', 'reviews', 'rejected', 'mean'))
+Report = namedtuple('Report', (
+    'transitions', 'homeworks', 'reviews', 'rejected', 'percentiles',
+    'periods'
+))
+
+
+def load_columns(path):
+    """Загружает журнал истории в массивы NumPy.
+
+    homework - номер работы, status - код статуса, time - время
+    обновления из API, а если его нет - время обнаружения. Записи одной
+    работы идут подряд и по времени. Файл открывается только на чтение:
+    в Python проходятся лишь смещения записей, а заголовки и ключи
+    работ собираются из файла через memmap.
+    """
+    end, offsets = HistoryReader(path).offsets()
+    if not offsets:
+        return Columns(
+            np.empty(0, np.int64), np.empty(0, np.uint8), np.empty(0)
+        )
+    offsets = np.frombuffer(offsets, dtype=np.uint64).astype(np.int64)
+    data = np.memmap(path, dtype=np.uint8, mode='r', shape=(end,))
+    rows = gather(data, offsets, ENTRY.size)
+    entries = rows.view(ENTRY_DTYPE)[:, 0]
+    homework = homework_numbers(data, offsets, rows[:, KEY_OFFSET:], entries)
+    order = np.argsort(homework, kind='stable')
+    entries = entries[order]
+    time = np.where(
+        entries['updated'] != NO_TIMESTAMP,
+        entries['updated'].astype(np.float64), entries['detected']
+    )
+    return Columns(homework[order], entries['status'].copy(), time)
+
+
+def gather(data, offsets, width, lengths=None):
+    """Собирает по width байт с каждого смещения в строки матрицы.
+
+    Если заданы lengths, у строки берётся не больше lengths байт,
+    остальные остаются нулями.
+    """
+    rows = np.zeros((len(offsets), width), dtype=np.uint8)
+    for byte in range(width):
+        present = slice(None) if lengths is None else lengths > byte
+        rows[present, byte] = data[offsets[present] + byte]
+    return rows
+
+
+def homework_numbers(data, offsets, keys, entries):
+    """Нумерует работы по ключу (подписка, длина имени, имя).
+
+    Номера идут в порядке первой записи работы в журнале - как в
+    индексе HistoryLog.
+    """
+    lengths = entries['length'].astype(np.int64)
+    names = gather(
+        data, offsets + ENTRY.size, int(lengths.max()), lengths
+    )
+    keys = np.ascontiguousarray(np.hstack((keys, names)))
+    _, first, inverse = np.unique(
+        keys.view(f'V{keys.shape[1]}')[:, 0],
+        return_index=True, return_inverse=True
+    )
+    numbers = np.empty(len(first), dtype=np.int64)
+    numbers[np.argsort(first)] = np.arange(len(first))
+    return numbers[inverse.ravel()]
+
+
+def review_durations(columns, statuses):
+    """Находит завершённые проверки в истории.
+
+    Проверка - переход работы из reviewing в approved или rejected.
+    Возвращает длительности, время завершения и признак отклонения.
+    """
+    reviewing = statuses.index('reviewing')
+    rejected = statuses.index('rejected')
+    finished = (statuses.index('approved'), rejected)
+    mask = (
+        (columns.homework[1:] == columns.homework[:-1])
+        & (columns.status[:-1] == reviewing)
+        & np.isin(columns.status[1:], finished)
+    )
+    ends = columns.time[1:][mask]
+    return (
+        ends - columns.time[:-1][mask], ends,
+        columns.status[1:][mask] == rejected
+    )
+
+
+def analyze(columns, statuses, period=PERIODS['day'], since=0):
+    """Считает перцентили времени проверки и долю отклонённых работ.
+
+    periods - проверки, завершённые в каждом периоде длиной period
+    секунд: число, отклонённые и среднее время проверки.
+    """
+    durations, ends, rejected = review_durations(columns, statuses)
+    recent = ends >= since
+    durations, ends, rejected = (
+        durations[recent], ends[recent], rejected[recent]
+    )
+    homeworks = len(np.unique(columns.homework))
+    if not len(durations):
+        return Report(len(columns.status), homeworks, 0, 0, {}, [])
+    buckets = (ends // period).astype(np.int64)
+    first = buckets.min()
+    buckets -= first
+    reviews = np.bincount(buckets)
+    rejected_per_period = np.bincount(buckets, weights=rejected)
+    total = np.bincount(buckets, weights=durations)
+    periods = [
+        Period(
+            int((first + number) * period), int(reviews[number]),
+            int(rejected_per_period[number]),
+            float(total[number] / reviews[number])
+        )
+        for number in np.flatnonzero(reviews)
+    ]
+    return Report(
+        len(columns.status), homeworks, len(durations),
+        int(rejected.sum()),
+        dict(zip(
+            PERCENTILES, np.percentile(durations, PERCENTILES).tolist()
+        )),
+        periods
+    )
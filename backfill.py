@@ -0,0 +1,147 @@
+import logging
+import threading
+
+from concurrency import RateLimiter
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+FETCH_FAILED = 'Не удалось догрузить историю чата {}: {}'
+BACKFILL_ABANDONED = 'Догрузка истории чата {} остановлена после {} ошибок'
+BACKFILL_DONE = 'История чата {} догружена: записей {}'
+
+# Как часто проверять, не кончилась ли перегрузка, во время паузы.
+PAUSE_CHECK_INTERVAL = 1.0
+
+
+class BackfillJob:
+    """Догрузка истории одной подписки: всё, что обновлено раньше upper."""
+
+    __slots__ = ('subscription', 'upper', 'failures')
+
+    def __init__(self, subscription, upper):
+        """Создаёт задание для subscription с верхней границей upper."""
+        self.subscription = subscription
+        self.upper = upper
+        self.failures = 0
+
+
+class Backfill:
+    """Фоновая догрузка старой истории подписок в журнал.
+
+    API не умеет ограничивать выборку сверху: запрос с from_date отдаёт
+    всё, что обновлено позже. Поэтому история подписки загружается
+    одним запросом с from_date = 0, а в журнал попадают только работы,
+    обновлённые раньше upper - остальные уже видел обычный опрос.
+    Подписки обслуживаются по очереди, запросы идут не чаще rate
+    в секунду и не идут вовсе, пока pause() возвращает True.
+    Уведомления при догрузке не отправляются.
+
+    fetch(subscription) возвращает HomeworkRecord всех работ подписки,
+    от новой к старой, или None, если подписку сейчас опрашивать нельзя.
+    latest(subscription, record) получает самую новую из них: если
+    последняя работа старше окна опроса, больше её никто не увидит.
+    """
+
+    def __init__(self, fetch, history, rate=None, pause=None,
+                 max_failures=3, latest=None):
+        """Догруженные записи пишутся в журнал history."""
+        self.fetch = fetch
+        self.history = history
+        self.latest = latest
+        self.pause = pause or (lambda: False)
+        self.max_failures = max_failures
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self.limiter = RateLimiter(rate, sleep=self._stopped.wait)
+        self._thread = threading.Thread(
+            target=self._run, name='history-backfill', daemon=True
+        )
+
+    @property
+    def pending(self):
+        """Число подписок, история которых ещё догружается."""
+        with self._lock:
+            return len(self._jobs)
+
+    def add(self, subscription, upper):
+        """Ставит в очередь догрузку истории подписки до момента upper."""
+        with self._lock:
+            self._jobs[subscription] = BackfillJob(subscription, upper)
+        self._wakeup.set()
+
+    def remove(self, subscription):
+        """Отменяет догрузку истории подписки."""
+        with self._lock:
+            self._jobs.pop(subscription, None)
+
+    def step(self):
+        """Догружает историю одной подписки; False, если очередь пуста."""
+        with self._lock:
+            if not self._jobs:
+                return False
+            subscription = next(iter(self._jobs))
+            job = self._jobs.pop(subscription)
+            # В конец очереди: если запрос не удастся, следующей будет
+            # другая подписка.
+            self._jobs[subscription] = job
+        try:
+            records = self.fetch(subscription)
+        except Exception as error:
+            job.failures += 1
+            logger.warning(FETCH_FAILED.format(subscription.chat_id, error))
+            if job.failures >= self.max_failures:
+                logger.error(BACKFILL_ABANDONED.format(
+                    subscription.chat_id, job.failures
+                ))
+                self._finish(job)
+            return True
+        if records is not None:
+            self._store(job, records)
+        return True
+
+    def _store(self, job, records):
+        """Пишет в журнал работы, обновлённые раньше job.upper."""
+        found = 0
+        for record in records:
+            if record.updated is None or record.updated < job.upper:
+                found += 1
+                self.history.append(job.subscription.id, record)
+        if records and self.latest is not None:
+            self.latest(job.subscription, records[0])
+        metrics.incr('backfill_requests')
+        metrics.incr('backfill_records', found)
+        logger.info(BACKFILL_DONE.format(job.subscription.chat_id, found))
+        self._finish(job)
+
+    def _finish(self, job):
+        with self._lock:
+            if self._jobs.get(job.subscription) is job:
+                del self._jobs[job.subscription]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if not self.pending:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            if self.pause():
+                self._stopped.wait(PAUSE_CHECK_INTERVAL)
+                continue
+            self.limiter.acquire()
+            if not self._stopped.is_set():
+                self.step()
+
+    def start(self):
+        """Запускает фоновый поток догрузки."""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает поток; начатый запрос дорабатывается."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(5)
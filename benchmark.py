@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from subscriptions import Subscription, SubscriptionState
+
+BenchmarkResult = namedtuple(
+    'BenchmarkResult',
+    ('workers', 'requests', 'elapsed', 'throughput', 'parallel')
+)
+
+
+class FakeApi:
+    """Локальный HTTP-сервер, отвечающий как API Практикума.
+
+    Каждый ответ задерживается на latency секунд, как при обращении
+    к удалённому API. Соединения поддерживаются (HTTP/1.1), поэтому
+    видно, переиспользует ли клиент сессию. served - число обслуженных
+    запросов, peak - наибольшее число запросов, обрабатывавшихся
+    одновременно.
+    """
+
+    def __init__(self, latency=0.05):
+        """Готовит ответ API; запросы задерживаются на latency секунд."""
+        body = json.dumps({
+            'homeworks': [{
+                'homework_name': 'hw.zip', 'status': 'reviewing',
+                'date_updated': '2024-01-31T10:00:00Z',
+            }],
+            'current_date': int(time.time()),
+        }).encode('utf-8')
+        self.connections = 0
+        self.served = 0
+        self.peak = 0
+        self._in_flight = 0
+        api = self
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят разными пакетами: без этого на
+            # каждом запросе поддерживаемого соединения терялось бы
+            # время на задержанное подтверждение TCP.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    api.connections += 1
+
+            def do_GET(self):
+                with lock:
+                    api._in_flight += 1
+                    api.peak = max(api.peak, api._in_flight)
+                time.sleep(latency)
+                with lock:
+                    api._in_flight -= 1
+                    api.served += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), name='fake-api',
+            daemon=True
+        )
+
+    @property
+    def url(self):
+        """Адрес сервера, подставляемый вместо ENDPOINT."""
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/'
+
+    def reset(self):
+        """Обнуляет счётчики запросов перед очередным замером."""
+        self.served = self.peak = 0
+
+    def start(self):
+        """Запускает сервер в отдельном потоке."""
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Останавливает сервер."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class NullBot:
+    """Бот, который ничего не отправляет."""
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Ничего не делает."""
+
+
+def run_engine(homework, subscriptions, workers, deadline=30):
+    """Прогоняет подписки через ThreadPoolEngine; возвращает время."""
+    from outbox import Outbox
+    poller = homework.Poller(NullBot(), {
+        subscription: SubscriptionState() for subscription in subscriptions
+    }, Outbox(':memory:'))
+    engine = poller.build_engine(workers, deadline).start()
+    try:
+        started = time.monotonic()
+        for subscription in subscriptions:
+            engine.submit((subscription, None))
+        engine.join()
+        return time.monotonic() - started
+    finally:
+        engine.close()
+        poller.outbox.close()
+
+
+def run(tenants=200, workers=(1, 2, 4, 8, 16), latency=0.05, deadline=30):
+    """Измеряет пропускную способность синхронного опроса по числу потоков.
+
+    Весь путь get_api_answer -> check_response -> parse_homework ->
+    журнал уведомлений выполняется по-настоящему, только API заменён
+    локальным сервером с задержкой latency. Для каждого размера пула
+    возвращает BenchmarkResult с числом обслуженных запросов и их
+    наибольшим параллелизмом.
+    """
+    import homework
+    homework.load_settings()
+    # Лимит параллельных запросов не должен быть уже самого большого пула.
+    homework.upstream.configure(
+        max(workers), homework.UPSTREAM_LIMIT_MIN, max(workers),
+        homework.UPSTREAM_LATENCY_TOLERANCE
+    )
+    api = FakeApi(latency).start()
+    endpoint = homework.ENDPOINT
+    homework.ENDPOINT = api.url
+    try:
+        results = []
+        for count in workers:
+            subscriptions = [
+                Subscription(str(number), f'bench-{count}-{number}')
+                for number in range(tenants)
+            ]
+            api.reset()
+            elapsed = run_engine(homework, subscriptions, count, deadline)
+            results.append(BenchmarkResult(
+                count, api.served, elapsed, api.served / elapsed, api.peak
+            ))
+        return results, api.connections
+    finally:
+        homework.ENDPOINT = endpoint
+        api.close()
@@ -0,0 +1,417 @@
+import argparse
+import sys
+
+import recorder
+import records
+import sharding
+import simulator
+from polling import PollingPolicy
+
+REPLAY_SUMMARY = (
+    'Записей: {}, сообщений: {}, ошибок: {}, время: {:.3f} с, '
+    'пропускная способность: {:.0f} записей/с'
+)
+
+
+def run_replay(args):
+    """Воспроизводит записанный трафик API."""
+    if args.quiet:
+        def sink(message):
+            pass
+    else:
+        sink = print
+    stats = recorder.replay(args.path, sink, realtime=args.realtime)
+    throughput = stats.records / stats.elapsed if stats.elapsed else 0
+    print(REPLAY_SUMMARY.format(
+        stats.records, stats.messages, stats.errors, stats.elapsed, throughput
+    ))
+    return 0
+
+
+SIMULATION_HEADER = (
+    'интервал  простой  запросов  уведомлений  средняя  p50  p95  макс. '
+    '(задержки в минутах)'
+)
+SIMULATION_ROW = (
+    '{:>8}  {:>7}  {:>8}  {:>11}  {:>7.1f}  {:>3.1f}  {:>3.1f}  {:>5.1f}'
+)
+
+
+def run_simulate(args):
+    """Сравнивает политики опроса на синтетической или записанной истории."""
+    duration = args.days * simulator.DAY
+    if args.records:
+        timelines = [simulator.timeline_from_records(args.records)]
+    else:
+        timelines = simulator.generate_timelines(
+            args.tenants, duration, seed=args.seed
+        )
+    print(SIMULATION_HEADER)
+    for interval in args.interval:
+        idle_interval = args.idle_interval or interval
+        policy = PollingPolicy(
+            interval, idle_interval, args.error_backoff, args.max_interval
+        )
+        report = simulator.simulate(
+            timelines, policy, duration, args.error_rate, seed=args.seed
+        )
+        print(SIMULATION_ROW.format(
+            interval, idle_interval, report.api_calls, report.notifications,
+            report.mean_delay / 60, report.p50_delay / 60,
+            report.p95_delay / 60, report.max_delay / 60
+        ))
+    return 0
+
+
+def run_supervise(args):
+    """Запускает процессы опроса и распределяет между ними подписки."""
+    import homework
+
+    def load_ids():
+        return [subscription.id for subscription in homework.load_registry()]
+
+    sharding.supervise(
+        args.workers, args.store, load_ids, args.interval, args.ttl
+    )
+    return 0
+
+
+def run_worker(args):
+    """Подключает к шарду процесс опроса с этой машины."""
+    sharding.run_worker(args.id, args.store)
+    return 0
+
+
+HISTORY_ROW = '{}  {}  {}  {}'
+
+
+def parse_since(value):
+    """Момент времени из секунд эпохи или строки вида 2024-01-31T10:00:00Z."""
+    try:
+        return float(value)
+    except ValueError:
+        timestamp = records.parse_timestamp(value)
+        if timestamp is None:
+            raise argparse.ArgumentTypeError(value)
+        return timestamp
+
+
+def run_history(args):
+    """Печатает историю статусов работы или все переходы после момента."""
+    from history import HistoryReader
+    import homework
+    for transition in HistoryReader(args.path).entries():
+        if (
+            transition.detected >= args.since
+            and args.subscription in (None, transition.subscription_id)
+            and args.homework in (None, transition.name)
+        ):
+            print(HISTORY_ROW.format(
+                records.format_timestamp(int(transition.detected)),
+                transition.subscription_id, transition.name,
+                homework.STATUSES[transition.status]
+            ))
+    return 0
+
+
+ANALYTICS_SUMMARY = (
+    'Переходов: {}, работ: {}, проверок: {}, отклонено: {} ({:.1%})'
+)
+ANALYTICS_PERCENTILES = 'Время проверки, ч: {}'
+ANALYTICS_HEADER = 'период      проверок  отклонено  среднее, ч'
+ANALYTICS_ROW = '{:<10}  {:>8}  {:>9}  {:>10.1f}'
+
+
+def run_analytics(args):
+    """Считает время проверки и долю отклонённых работ по истории."""
+    import analytics
+    import homework
+    report = analytics.analyze(
+        analytics.load_columns(args.path), homework.STATUSES,
+        analytics.PERIODS[args.period], args.since
+    )
+    print(ANALYTICS_SUMMARY.format(
+        report.transitions, report.homeworks, report.reviews,
+        report.rejected,
+        report.rejected / report.reviews if report.reviews else 0
+    ))
+    if not report.reviews:
+        return 0
+    print(ANALYTICS_PERCENTILES.format('  '.join(
+        f'p{percentile} {value / analytics.HOUR:.1f}'
+        for percentile, value in report.percentiles.items()
+    )))
+    print(ANALYTICS_HEADER)
+    for period in report.periods:
+        print(ANALYTICS_ROW.format(
+            records.format_timestamp(period.start)[:10], period.reviews,
+            period.rejected, period.mean / analytics.HOUR
+        ))
+    return 0
+
+
+EXPORT_SUMMARY = 'Выгружено переходов: {} (пачек: {}) в {}'
+
+
+def run_export(args):
+    """Выгружает историю статусов в Parquet или Arrow IPC."""
+    import export
+    import homework
+    from history import HistoryReader
+    stats = export.export(
+        HistoryReader(args.path), args.output, homework.STATUSES,
+        args.format, args.batch_size, export.read_watermark(args.watermark)
+    )
+    if args.watermark and stats.watermark is not None:
+        export.write_watermark(args.watermark, stats.watermark)
+    print(EXPORT_SUMMARY.format(stats.rows, stats.batches, args.output))
+    return 0
+
+
+TENANTS_HEADER = (
+    'подписка          запросов        байт  ошибок  сообщений  блокировка'
+)
+TENANTS_ROW = '{:<16}  {:>8}  {:>10}  {:>6}  {:>9}  {}'
+
+
+def run_tenants(args):
+    """Печатает подписки с наибольшим расходом запросов и трафика."""
+    import quotas
+    print(TENANTS_HEADER)
+    for tenant, usage in quotas.top_consumers(
+        quotas.read_usage(args.path), args.by, args.top
+    ):
+        blocked = ''
+        if usage['blocked_until'] is not None:
+            blocked = '{} до {}'.format(
+                usage['reason'],
+                records.format_timestamp(int(usage['blocked_until']))
+            )
+        print(TENANTS_ROW.format(
+            tenant, usage['requests'], usage['bytes'], usage['errors'],
+            usage['messages'], blocked
+        ))
+    return 0
+
+
+ONBOARDING_SUMMARY = (
+    'Проверено: {}, уже в реестре: {}, добавлено: {}, неверный токен: {}, '
+    'чат недоступен: {}, не удалось проверить: {}, время: {:.1f} с'
+)
+ONBOARDING_ROW = '{}  {}  {}'
+
+
+def run_onboard(args):
+    """Проверяет токены и чаты новых подписок и дописывает верные."""
+    import homework
+    import onboarding
+    from concurrency import RateLimiter
+    from telebot import TeleBot
+    homework.load_settings()
+    report = onboarding.onboard(
+        args.path, args.registry or homework.SUBSCRIPTIONS_FILE,
+        onboarding.practicum_probe(homework.ENDPOINT, args.timeout),
+        onboarding.telegram_probe(TeleBot(homework.TELEGRAM_TOKEN)),
+        args.workers, RateLimiter(args.rate),
+        RateLimiter(args.telegram_rate)
+    )
+    if args.report:
+        onboarding.write_report(args.report, report.checks)
+    for check in report.checks:
+        if check.errors:
+            print(ONBOARDING_ROW.format(
+                check.subscription.chat_id, check.subscription.id,
+                '; '.join(check.errors)
+            ))
+    print(ONBOARDING_SUMMARY.format(
+        len(report.checks), report.known, report.added,
+        sum(check.token_valid is False for check in report.checks),
+        sum(check.chat_valid is False for check in report.checks),
+        sum(
+            None in (check.token_valid, check.chat_valid)
+            and False not in (check.token_valid, check.chat_valid)
+            for check in report.checks
+        ),
+        report.elapsed
+    ))
+    return 0
+
+
+BENCH_HEADER = (
+    'потоков  запросов  время, с  запросов/с  ускорение  параллельно'
+)
+BENCH_ROW = '{:>7}  {:>8}  {:>8.2f}  {:>10.1f}  {:>9.1f}  {:>11}'
+BENCH_CONNECTIONS = 'Открыто соединений с API: {}'
+
+
+def run_bench(args):
+    """Измеряет масштабирование опроса в пуле потоков."""
+    import benchmark
+    results, connections = benchmark.run(
+        args.tenants, args.workers, args.latency, args.deadline
+    )
+    print(BENCH_HEADER)
+    for result in results:
+        print(BENCH_ROW.format(
+            result.workers, result.requests, result.elapsed,
+            result.throughput, result.throughput / results[0].throughput,
+            result.parallel
+        ))
+    print(BENCH_CONNECTIONS.format(connections))
+    return 0
+
+
+def build_parser():
+    """Собирает парсер аргументов командной строки."""
+    parser = argparse.ArgumentParser(
+        description='Служебные команды бота проверки домашних работ.'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = subparsers.add_parser(
+        'replay', help='воспроизвести записанные ответы API'
+    )
+    replay_parser.add_argument('path', help='файл, записанный рекордером')
+    replay_parser.add_argument(
+        '--realtime', action='store_true',
+        help='соблюдать исходные интервалы между ответами'
+    )
+    replay_parser.add_argument(
+        '--quiet', action='store_true', help='не печатать сообщения'
+    )
+    replay_parser.set_defaults(handler=run_replay)
+
+    simulate_parser = subparsers.add_parser(
+        'simulate', help='оценить политику опроса в виртуальном времени'
+    )
+    simulate_parser.add_argument('--tenants', type=int, default=1000)
+    simulate_parser.add_argument('--days', type=float, default=7)
+    simulate_parser.add_argument(
+        '--interval', type=int, nargs='+', default=[600],
+        help='один или несколько периодов опроса для сравнения'
+    )
+    simulate_parser.add_argument('--idle-interval', type=int)
+    simulate_parser.add_argument('--error-backoff', type=float, default=1)
+    simulate_parser.add_argument('--max-interval', type=int, default=3600)
+    simulate_parser.add_argument('--error-rate', type=float, default=0)
+    simulate_parser.add_argument('--seed', type=int, default=0)
+    simulate_parser.add_argument(
+        '--records', help='взять историю из файла рекордера'
+    )
+    simulate_parser.set_defaults(handler=run_simulate)
+
+    supervise_parser = subparsers.add_parser(
+        'supervise', help='запустить несколько процессов опроса'
+    )
+    supervise_parser.add_argument('--workers', type=int, default=2)
+    supervise_parser.add_argument('--store', default='shards.sqlite3')
+    supervise_parser.add_argument('--interval', type=int, default=10)
+    supervise_parser.add_argument('--ttl', type=int, default=30)
+    supervise_parser.set_defaults(handler=run_supervise)
+
+    worker_parser = subparsers.add_parser(
+        'worker', help='подключить процесс опроса к общему шарду'
+    )
+    worker_parser.add_argument('--id', required=True)
+    worker_parser.add_argument('--store', default='shards.sqlite3')
+    worker_parser.set_defaults(handler=run_worker)
+
+    history_parser = subparsers.add_parser(
+        'history', help='показать историю статусов работ'
+    )
+    history_parser.add_argument('path', help='файл HISTORY_FILE')
+    history_parser.add_argument(
+        '--since', type=parse_since, default=0,
+        help='только переходы после момента (секунды или ISO 8601)'
+    )
+    history_parser.add_argument(
+        '--subscription', help='идентификатор подписки'
+    )
+    history_parser.add_argument('--homework', help='имя работы')
+    history_parser.set_defaults(handler=run_history)
+
+    analytics_parser = subparsers.add_parser(
+        'analytics', help='время проверки работ по истории статусов'
+    )
+    analytics_parser.add_argument('path', help='файл HISTORY_FILE')
+    analytics_parser.add_argument(
+        '--period', choices=('day', 'week'), default='day'
+    )
+    analytics_parser.add_argument(
+        '--since', type=parse_since, default=0,
+        help='только проверки, завершённые после момента'
+    )
+    analytics_parser.set_defaults(handler=run_analytics)
+
+    export_parser = subparsers.add_parser(
+        'export', help='выгрузить историю статусов в колоночный файл'
+    )
+    export_parser.add_argument('path', help='файл HISTORY_FILE')
+    export_parser.add_argument('--output', required=True)
+    export_parser.add_argument(
+        '--format', choices=('parquet', 'arrow'), default='parquet'
+    )
+    export_parser.add_argument('--batch-size', type=int, default=10000)
+    export_parser.add_argument(
+        '--watermark',
+        help='файл отметки: выгрузить только новое с прошлого раза'
+    )
+    export_parser.set_defaults(handler=run_export)
+
+    tenants_parser = subparsers.add_parser(
+        'tenants', help='подписки с наибольшим расходом квот'
+    )
+    tenants_parser.add_argument('path', help='файл TENANT_USAGE_FILE')
+    tenants_parser.add_argument(
+        '--by', choices=('requests', 'bytes', 'errors', 'messages'),
+        default='requests'
+    )
+    tenants_parser.add_argument('--top', type=int, default=10)
+    tenants_parser.set_defaults(handler=run_tenants)
+
+    onboard_parser = subparsers.add_parser(
+        'onboard', help='проверить новые подписки и добавить в реестр'
+    )
+    onboard_parser.add_argument(
+        'path', help='JSON со списком {"chat_id": ..., "token": ...}'
+    )
+    onboard_parser.add_argument(
+        '--registry', help='реестр подписок (по умолчанию SUBSCRIPTIONS_FILE)'
+    )
+    onboard_parser.add_argument('--workers', type=int, default=16)
+    onboard_parser.add_argument(
+        '--rate', type=float, default=10,
+        help='запросов к API Практикума в секунду'
+    )
+    onboard_parser.add_argument(
+        '--telegram-rate', type=float, default=25,
+        help='запросов к Telegram в секунду'
+    )
+    onboard_parser.add_argument('--timeout', type=float, default=10)
+    onboard_parser.add_argument('--report', help='сохранить отчёт в JSON')
+    onboard_parser.set_defaults(handler=run_onboard)
+
+    bench_parser = subparsers.add_parser(
+        'bench', help='масштабирование опроса в пуле потоков'
+    )
+    bench_parser.add_argument('--tenants', type=int, default=200)
+    bench_parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32]
+    )
+    bench_parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help='задержка ответа локального API в секундах'
+    )
+    bench_parser.add_argument('--deadline', type=float, default=30)
+    bench_parser.set_defaults(handler=run_bench)
+    return parser
+
+
+def main(argv=None):
+    """Точка входа служебных команд."""
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
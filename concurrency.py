@@ -0,0 +1,122 @@
+import threading
+import time
+
+from metrics import registry as metrics
+
+# Коды ответа, означающие перегрузку вызываемого API.
+OVERLOAD_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class AdaptiveLimiter:
+    """Адаптивное ограничение числа одновременных запросов (AIMD).
+
+    Пока задержка ответа держится не выше tolerance базовой, а лимит
+    действительно выбирается, он растёт примерно на единицу за каждые
+    limit завершённых запросов. При всплеске задержки, ответе 429/5xx
+    или ошибке соединения лимит умножается на backoff. Уменьшение
+    вызывают только запросы, начатые после предыдущего уменьшения,
+    поэтому один всплеск не обрушивает лимит многократно. Базовая
+    задержка - сглаженный минимум: сразу опускается до меньшей
+    задержки и медленно подтягивается к текущей.
+    Текущий лимит и число запросов в работе выгружаются в метрики
+    {name}_limit и {name}_inflight.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64, tolerance=2.0,
+                 backoff=0.5, drift=0.01, name='upstream_concurrency',
+                 clock=time.monotonic):
+        """Лимит начинается с initial и держится между minimum и maximum.
+
+        За каждый запрос базовая задержка подтягивается к текущей
+        на долю drift.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.drift = drift
+        self.name = name
+        self.clock = clock
+        self.limit = float(initial)
+        self.baseline = None
+        self.inflight = 0
+        self._decreased = float('-inf')
+        self._condition = threading.Condition()
+        self._export()
+
+    def configure(self, initial, minimum, maximum, tolerance):
+        """Меняет границы и начальный лимит; базовая задержка забывается."""
+        with self._condition:
+            self.minimum = minimum
+            self.maximum = maximum
+            self.tolerance = tolerance
+            self.limit = float(min(max(initial, minimum), maximum))
+            self.baseline = None
+            self._decreased = float('-inf')
+            self._export()
+            self._condition.notify_all()
+
+    def acquire(self, timeout=None):
+        """Занимает место; возвращает момент начала или None по таймауту."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self.inflight < int(self.limit), timeout
+            ):
+                return None
+            self.inflight += 1
+            metrics.set(f'{self.name}_inflight', self.inflight)
+            return self.clock()
+
+    def release(self, started, overloaded=False):
+        """Освобождает место и подстраивает лимит по исходу запроса."""
+        now = self.clock()
+        latency = now - started
+        with self._condition:
+            saturated = self.inflight * 2 >= self.limit
+            self.inflight -= 1
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * self.drift
+            if overloaded or latency > self.baseline * self.tolerance:
+                if started >= self._decreased:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._decreased = now
+            elif saturated:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._export()
+            self._condition.notify_all()
+
+    def _export(self):
+        metrics.set(f'{self.name}_limit', int(self.limit))
+        metrics.set(f'{self.name}_inflight', self.inflight)
+
+
+limiter = AdaptiveLimiter()
+
+
+class RateLimiter:
+    """Пропускает не больше rate вызовов в секунду на все потоки.
+
+    Вызовы равномерно распределяются по времени; rate None или 0 -
+    без ограничения.
+    """
+
+    def __init__(self, rate=None, clock=time.monotonic, sleep=time.sleep):
+        """Часы clock и ожидание sleep заменяются в тестах."""
+        self.interval = 1 / rate if rate else 0
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def acquire(self):
+        """Ждёт, пока подойдёт очередь следующего вызова."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
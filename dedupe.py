@@ -0,0 +1,70 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DIGEST_SIZE = 8
+
+
+def digest(key):
+    """Сжимает ключ события до 8 байт."""
+    return hashlib.blake2b(
+        str(key).encode('utf-8'), digest_size=DIGEST_SIZE
+    ).digest()
+
+
+class DedupeStore:
+    """Ограниченное множество уже отправленных событий.
+
+    Хранит только короткие хеши ключей. Когда записей становится больше
+    max_entries, вытесняются давно не встречавшиеся; при заданном ttl
+    запись забывается через ttl секунд после последнего обращения.
+    Проверка и добавление выполняются за O(1).
+    """
+
+    def __init__(self, max_entries=100000, ttl=None, clock=time.monotonic):
+        """Без ttl записи вытесняются только по max_entries."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Число хранимых событий, включая ещё не проверенные на ttl."""
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Встречалось ли событие key; обращение продлевает запись."""
+        key_digest = digest(key)
+        with self._lock:
+            added = self._entries.get(key_digest)
+            if added is None:
+                return False
+            now = self.clock()
+            if self.ttl is not None and now - added > self.ttl:
+                del self._entries[key_digest]
+                return False
+            self._entries[key_digest] = now
+            self._entries.move_to_end(key_digest)
+            return True
+
+    def add(self, key):
+        """Запоминает событие как отправленное."""
+        key_digest = digest(key)
+        with self._lock:
+            now = self.clock()
+            self._entries[key_digest] = now
+            self._entries.move_to_end(key_digest)
+            self._evict(now)
+
+    def _evict(self, now):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self.ttl is None:
+            return
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if now - oldest <= self.ttl:
+                return
+            self._entries.popitem(last=False)
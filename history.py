@@ -0,0 +1,380 @@
+import bisect
+import contextlib
+import itertools
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HWHIST1\n'
+# Время обнаружения, время обновления работы (-1 - неизвестно), код
+# статуса, идентификатор подписки и длина имени работы; за ними имя.
+ENTRY = struct.Struct('<dqB8sH')
+# С этого байта идут подписка, длина имени и имя - ключ работы.
+KEY_OFFSET = 17
+NO_TIMESTAMP = -1
+
+BAD_HEADER = 'Файл {} не является журналом истории статусов'
+TRUNCATED_TAIL = 'Журнал {} обрезан после байта {}: неполная запись'
+COMPACTED = 'Журнал {} сжат: удалено записей {}'
+
+Transition = namedtuple(
+    'Transition', ('subscription_id', 'name', 'status', 'updated', 'detected')
+)
+
+
+def read_entry(data, offset):
+    """Разбирает запись журнала, начинающуюся с байта offset."""
+    detected, updated, status, subscription, length = ENTRY.unpack_from(
+        data, offset
+    )
+    start = offset + ENTRY.size
+    return Transition(
+        subscription.hex(),
+        bytes(data[start:start + length]).decode('utf-8'),
+        status,
+        None if updated == NO_TIMESTAMP else updated,
+        detected,
+    )
+
+
+class HistoryLog:
+    """Журнал переходов статусов работ в двоичном файле только на запись.
+
+    Файл читается через mmap. В памяти держатся только смещения записей:
+    по паре (подписка, работа) и по времени обнаружения, поэтому
+    история работы и изменения после момента T находятся без просмотра
+    файла. Фоновое сжатие удаляет записи старше retention секунд,
+    оставляя последний статус каждой работы.
+    """
+
+    def __init__(
+        self, path, retention=None, compact_interval=3600, clock=time.time
+    ):
+        """Открывает журнал path, создавая его при необходимости.
+
+        Без retention записи не удаляются; сжатие запускается раз
+        в compact_interval секунд.
+        """
+        self.path = path
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='history-compaction', daemon=True
+        )
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'a+b')
+        if not os.path.getsize(self.path):
+            self._file.write(MAGIC)
+            self._file.flush()
+        self._map = None
+        # (подписка, работа) -> (номер работы, смещения её записей).
+        self._index = {}
+        self._times = array('d')
+        self._offsets = array('Q')
+        self._numbers = array('I')
+        self._end = len(MAGIC)
+        self._remap()
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(BAD_HEADER.format(self.path))
+        self._end = self._scan()
+        if self._end < len(self._map):
+            logger.warning(TRUNCATED_TAIL.format(self.path, self._end))
+            self._map.close()
+            self._map = None
+            self._file.truncate(self._end)
+            self._remap()
+
+    def _scan(self):
+        # Выполняется на каждом открытии, поэтому цикл без вызовов методов
+        # и лишних объектов: ключ работы декодируется один раз на работу.
+        data = self._map
+        size = len(data)
+        unpack = ENTRY.unpack_from
+        index = self._index
+        homeworks = {}
+        add_time = self._times.append
+        add_offset = self._offsets.append
+        add_number = self._numbers.append
+        offset = self._end
+        while offset + ENTRY.size <= size:
+            detected, _, _, _, length = unpack(data, offset)
+            end = offset + ENTRY.size + length
+            if end > size:
+                break
+            raw = data[offset + KEY_OFFSET:end]
+            homework = homeworks.get(raw)
+            if homework is None:
+                key = (raw[:8].hex(), raw[10:].decode('utf-8'))
+                homework = homeworks[raw] = index[key] = (
+                    len(index), array('Q')
+                )
+            homework[1].append(offset)
+            add_time(detected)
+            add_offset(offset)
+            add_number(homework[0])
+            offset = end
+        return offset
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.flush()
+        self._map = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ
+        )
+
+    def _entry_at(self, offset):
+        if offset + ENTRY.size > len(self._map):
+            self._remap()
+        return read_entry(self._map, offset)
+
+    def append(self, subscription_id, record, detected=None):
+        """Дописывает переход статуса; повтор последнего не записывается.
+
+        record - HomeworkRecord, subscription_id - Subscription.id.
+        Возвращает True, если запись добавлена.
+        """
+        key = (subscription_id, record.name)
+        name = record.name.encode('utf-8')
+        with self._lock:
+            homework = self._index.get(key)
+            if homework is not None:
+                last = self._entry_at(homework[1][-1])
+                if (last.status, last.updated) == (
+                    record.status, record.updated
+                ):
+                    return False
+            else:
+                homework = self._index[key] = (len(self._index), array('Q'))
+            detected = self.clock() if detected is None else detected
+            if self._times and detected <= self._times[-1]:
+                # Время в индексе строго растёт: по нему работает bisect,
+                # и оно же однозначно задаёт место записи для выгрузки.
+                detected = math.nextafter(self._times[-1], math.inf)
+            self._file.write(ENTRY.pack(
+                detected,
+                NO_TIMESTAMP if record.updated is None else record.updated,
+                record.status, bytes.fromhex(subscription_id), len(name)
+            ) + name)
+            self._file.flush()
+            offset, self._end = self._end, self._end + ENTRY.size + len(name)
+            homework[1].append(offset)
+            self._times.append(detected)
+            self._offsets.append(offset)
+            self._numbers.append(homework[0])
+        return True
+
+    def _read(self, offsets):
+        with self._lock:
+            if self._end > len(self._map):
+                self._remap()
+            return [self._entry_at(offset) for offset in offsets]
+
+    def timeline(self, subscription_id, name):
+        """Возвращает переходы статуса одной работы по порядку."""
+        with self._lock:
+            homework = self._index.get((subscription_id, name))
+            return [] if homework is None else self._read(homework[1])
+
+    def since(self, timestamp):
+        """Возвращает все переходы, обнаруженные не раньше timestamp."""
+        with self._lock:
+            start = bisect.bisect_left(self._times, timestamp)
+            return self._read(self._offsets[start:])
+
+    def batches(self, after=None, size=10000):
+        """Выдаёт переходы, обнаруженные позже after, пачками по size.
+
+        В памяти одновременно только одна пачка. Место продолжения
+        ищется по времени обнаружения, поэтому обход переживает
+        сжатие журнала между пачками.
+        """
+        while True:
+            with self._lock:
+                start = 0 if after is None else bisect.bisect_right(
+                    self._times, after
+                )
+                batch = self._read(self._offsets[start:start + size])
+            if not batch:
+                return
+            yield batch
+            after = batch[-1].detected
+
+    def index(self):
+        """Снимок индекса для массовой обработки файла в обход журнала.
+
+        Возвращает конец записанных данных, смещения всех записей
+        в порядке файла и номер работы каждой записи.
+        """
+        with self._lock:
+            return self._end, array('Q', self._offsets), array(
+                'I', self._numbers
+            )
+
+    def __len__(self):
+        """Число записей в журнале."""
+        return len(self._offsets)
+
+    def compact(self):
+        """Переписывает журнал без записей старше retention секунд.
+
+        Последняя запись каждой работы сохраняется. Файл копируется без
+        блокировки, поэтому запись переходов не ждёт сжатия; дописанное
+        за это время переносится в конце под блокировкой. Возвращает
+        число удалённых записей.
+        """
+        if self.retention is None:
+            return 0
+        with self._compact_lock:
+            with self._lock:
+                end = self._end
+                offsets = self._offsets.tolist()
+                times = self._times.tolist()
+                latest = {
+                    entries[-1] for _, entries in self._index.values()
+                }
+            cutoff = self.clock() - self.retention
+            temporary = self.path + '.compact'
+            removed = 0
+            with open(self.path, 'rb') as source_file, mmap.mmap(
+                source_file.fileno(), end, access=mmap.ACCESS_READ
+            ) as source, open(temporary, 'wb') as target:
+                target.write(MAGIC)
+                for offset, detected in zip(offsets, times):
+                    size = ENTRY.size + ENTRY.unpack_from(source, offset)[-1]
+                    if detected < cutoff and offset not in latest:
+                        removed += 1
+                        continue
+                    target.write(source[offset:offset + size])
+                if not removed:
+                    target.close()
+                    os.remove(temporary)
+                    return 0
+                with self._lock:
+                    self._file.flush()
+                    if self._end > end:
+                        source_file.seek(end)
+                        target.write(source_file.read(self._end - end))
+                    target.flush()
+                    os.fsync(target.fileno())
+                    self._map.close()
+                    self._file.close()
+                    os.replace(temporary, self.path)
+                    self._open()
+        logger.info(COMPACTED.format(self.path, removed))
+        return removed
+
+    def start(self):
+        """Запускает фоновое сжатие, если задан срок хранения."""
+        if self.retention is not None:
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Останавливает сжатие и закрывает файл."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(5)
+        with self._lock:
+            self._map.close()
+            self._file.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as error:
+                logger.error(error, exc_info=True)
+
+
+class HistoryReader:
+    """Журнал истории только на чтение - для CLI и отчётов.
+
+    В отличие от HistoryLog файл не создаётся и не обрезается, а индекс
+    в памяти не строится: журнал может в это время писать живой бот,
+    и его недописанная последняя запись просто пропускается.
+    """
+
+    def __init__(self, path):
+        """Запоминает путь; файл открывается заново на каждый обход."""
+        self.path = path
+
+    @contextlib.contextmanager
+    def _data(self):
+        with open(self.path, 'rb') as history_file:
+            if not os.fstat(history_file.fileno()).st_size:
+                # Пустой файл HistoryLog считает новым журналом.
+                yield MAGIC
+                return
+            with mmap.mmap(
+                history_file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(BAD_HEADER.format(self.path))
+                yield data
+
+    def offsets(self):
+        """Возвращает конец полных записей и смещения всех записей.
+
+        Из заголовка читается только длина имени, чтобы перейти к
+        следующей записи, - этого хватает для разбора заголовков
+        массово, например через NumPy.
+        """
+        offsets = array('Q')
+        add_offset = offsets.append
+        with self._data() as data:
+            size = len(data)
+            last = size - ENTRY.size
+            offset = len(MAGIC)
+            while offset <= last:
+                # Длина имени - последние два байта заголовка.
+                end = offset + ENTRY.size + (
+                    data[offset + ENTRY.size - 2]
+                    | data[offset + ENTRY.size - 1] << 8
+                )
+                if end > size:
+                    break
+                add_offset(offset)
+                offset = end
+        return offset, offsets
+
+    def entries(self, after=None):
+        """Выдаёт переходы в порядке файла, обнаруженные позже after.
+
+        Файл читается последовательно, в памяти только текущая запись.
+        Записи до after не разбираются дальше заголовка.
+        """
+        with self._data() as data:
+            size = len(data)
+            offset = len(MAGIC)
+            while offset + ENTRY.size <= size:
+                detected, _, _, _, length = ENTRY.unpack_from(data, offset)
+                end = offset + ENTRY.size + length
+                if end > size:
+                    return
+                if after is None or detected > after:
+                    yield read_entry(data, offset)
+                offset = end
+
+    def batches(self, after=None, size=10000):
+        """Выдаёт переходы, обнаруженные позже after, пачками по size."""
+        entries = self.entries(after)
+        while True:
+            batch = list(itertools.islice(entries, size))
+            if not batch:
+                return
+            yield batch
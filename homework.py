@@ -1,28 +1,115 @@
 import os
 import sys
 import time
+import signal
 import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from http import HTTPStatus
+from typing import TYPE_CHECKING
 
-import requests
-from telebot import TeleBot
-from dotenv import load_dotenv
-
-load_dotenv()
-
-PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
-TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+from alerts import ErrorAlerter
+from backfill import Backfill
+from concurrency import OVERLOAD_STATUSES, limiter as upstream
+from dedupe import DedupeStore
+from metrics import registry as metrics
+from notifier import Notifier, parse_sinks
+from outbox import PRIORITY_ALERT, PRIORITY_STATUS, Outbox, make_key
+from pipeline import Pipeline, Stage, ThreadPoolEngine, current_deadline
+from polling import LoadShedder, PollingPolicy, Scheduler
+from quotas import Quota, ledger as usage
+from records import HomeworkRecord, format_timestamp, parse_timestamp
+from subscriptions import Subscription, SubscriptionState, load_subscriptions
+from tracing import SPAN_KIND_CLIENT, tracer
 
 RETRY_PERIOD = 600
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
-HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
+
+# Настройки из окружения и .env: имя -> (значение по умолчанию, тип).
+# Читаются не при импорте, а при первом обращении (см. load_settings).
+SETTINGS = {
+    'PRACTICUM_TOKEN': (None, str),
+    'TELEGRAM_TOKEN': (None, str),
+    'TELEGRAM_CHAT_ID': (None, str),
+    'IDLE_RETRY_PERIOD': (RETRY_PERIOD, int),
+    'MAX_RETRY_PERIOD': (3600, int),
+    'ERROR_BACKOFF': (1.0, float),
+    'API_RECORD_FILE': (None, str),
+    'SUBSCRIPTIONS_FILE': (None, str),
+    'PIPELINE_WORKERS': ('', str),
+    'PIPELINE_QUEUE_SIZE': (100, int),
+    'METRICS_FILE': (None, str),
+    'SHARD_WORKER_ID': (None, str),
+    'SHARD_STORE': (None, str),
+    'LEASE_BACKEND': (None, str),
+    'LEASE_TTL': (60, int),
+    'DEDUPE_MAX_ENTRIES': (100000, int),
+    'DEDUPE_TTL': (None, lambda value: float(value) or None),
+    'ERROR_ALERT_INTERVAL': (3600, int),
+    'OUTBOX_FILE': (
+        os.path.join(os.path.dirname(__file__), 'outbox.sqlite3'), str
+    ),
+    'HISTORY_FILE': (None, str),
+    'HISTORY_RETENTION': (None, lambda value: float(value) or None),
+    'STATUS_COMMAND': (False, lambda value: value.lower() in ('1', 'true')),
+    'STATUS_TTL': (600, int),
+    'NOTIFY_SINKS': ('telegram', str),
+    'TENANT_QUOTA_REQUESTS': (None, int),
+    'TENANT_QUOTA_BYTES': (None, int),
+    'TENANT_QUOTA_ERRORS': (None, int),
+    'TENANT_QUOTA_MESSAGES': (None, int),
+    'TENANT_QUOTA_WINDOW': (3600, int),
+    'TENANT_SUSPEND': (86400, int),
+    'TENANT_USAGE_FILE': (None, str),
+    'ENGINE': ('pipeline', str),
+    'ENGINE_WORKERS': (8, int),
+    'TASK_DEADLINE': (60.0, float),
+    'TELEGRAM_POOL_SIZE': (16, int),
+    'TELEGRAM_CONNECT_TIMEOUT': (5.0, float),
+    'TELEGRAM_READ_TIMEOUT': (30.0, float),
+    'OUTBOX_BACKLOG_LIMIT': (1000, int),
+    'OUTBOX_RETENTION': (7 * 86400, lambda value: float(value) or None),
+    'UPSTREAM_LIMIT_INITIAL': (8, int),
+    'UPSTREAM_LIMIT_MIN': (1, int),
+    'UPSTREAM_LIMIT_MAX': (64, int),
+    'UPSTREAM_LATENCY_TOLERANCE': (2.0, float),
+    'TRACE_SAMPLE_RATE': (0.0, float),
+    'TRACE_FILE': (None, str),
+    'SHED_LAG_THRESHOLD': (30.0, float),
+    'SHED_MAX_STRETCH': (8, int),
+    'BACKFILL_WINDOW': (7 * 86400, int),
+    'BACKFILL_RATE': (0.2, float),
+}
+
+if TYPE_CHECKING:
+    # Объявления для статических анализаторов, значения задаёт load_settings.
+    PRACTICUM_TOKEN = TELEGRAM_TOKEN = TELEGRAM_CHAT_ID = None
+    IDLE_RETRY_PERIOD = MAX_RETRY_PERIOD = ERROR_BACKOFF = None
+    API_RECORD_FILE = SUBSCRIPTIONS_FILE = METRICS_FILE = OUTBOX_FILE = None
+    PIPELINE_WORKERS = PIPELINE_QUEUE_SIZE = None
+    SHARD_WORKER_ID = SHARD_STORE = LEASE_BACKEND = LEASE_TTL = None
+    DEDUPE_MAX_ENTRIES = DEDUPE_TTL = ERROR_ALERT_INTERVAL = None
+    HISTORY_FILE = HISTORY_RETENTION = STATUS_COMMAND = STATUS_TTL = None
+    NOTIFY_SINKS = None
+    TENANT_QUOTA_REQUESTS = TENANT_QUOTA_BYTES = TENANT_QUOTA_ERRORS = None
+    TENANT_QUOTA_MESSAGES = TENANT_QUOTA_WINDOW = TENANT_SUSPEND = None
+    TENANT_USAGE_FILE = ENGINE = ENGINE_WORKERS = TASK_DEADLINE = None
+    TELEGRAM_POOL_SIZE = TELEGRAM_CONNECT_TIMEOUT = None
+    TELEGRAM_READ_TIMEOUT = OUTBOX_BACKLOG_LIMIT = OUTBOX_RETENTION = None
+    UPSTREAM_LIMIT_INITIAL = UPSTREAM_LIMIT_MIN = UPSTREAM_LIMIT_MAX = None
+    UPSTREAM_LATENCY_TOLERANCE = TRACE_SAMPLE_RATE = TRACE_FILE = None
+    SHED_LAG_THRESHOLD = SHED_MAX_STRETCH = None
+    BACKFILL_WINDOW = BACKFILL_RATE = None
+    HEADERS = None
 
 HOMEWORK_VERDICTS = {
     'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
+# Код статуса в HomeworkRecord - индекс в этом кортеже.
+STATUSES = tuple(HOMEWORK_VERDICTS)
 
 TOKEN_NAMES = ['PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID']
 
@@ -52,32 +139,118 @@ GENERIC_ERROR_MESSAGE = 'Произошла ошибка: {}'
 NO_CHANGES_IN_STATUS = 'Статус домашнего задания не изменился'
 ERROR_DURING_OPERATION = 'Ошибка при работе бота:'
 CRITICAL_TOKEN_ERROR = 'Критическая ошибка проверки токена:'
+STAGE_ERROR_MESSAGE = 'Ошибка на стадии {} для чата {}: {}'
+PIPELINE_STATS_MESSAGE = 'Очереди конвейера: {}'
+STAGE_STATS_MESSAGE = '{} - {}/{} (потоков {}, обработано {}, занято {:.3f} с)'
+STATUS_REPLY = '{}\nДанные на {}.'
+STATUS_UNKNOWN = 'Пока нет данных о ваших работах.'
+STATUS_NOT_SUBSCRIBED = 'Этот чат не подписан на уведомления о работах.'
+STATUS_REFRESH_ERROR = 'Не удалось обновить статус для чата {}: {}'
+STATUS_TIME_FORMAT = '%d.%m.%Y %H:%M'
+UPSTREAM_WAIT_TIMEOUT = 'Не дождались очереди на запрос к {}'
+SIGNAL_RECEIVED = 'Получен сигнал {}'
+REGISTRY_RELOADED = 'Реестр подписок обновлён: добавлено {}, удалено {}'
+LOAD_SHEDDING_STARTED = (
+    'Опрос отстаёт от расписания на {:.1f} с: паузы подписок без работ '
+    'на проверке увеличены в {} раз'
+)
+LOAD_SHEDDING_STOPPED = 'Опрос догнал расписание, паузы восстановлены'
+REGISTRY_RELOAD_ERROR = 'Не удалось перечитать реестр подписок: {}'
+
+LOG_HANDLER_NAMES = ('homework-file', 'homework-console')
+# Файлы, которые у каждого исполнителя шарда свои (см. sharding.worker_path).
+# Журнал уведомлений общий: его ключи не дают повторить уведомление, когда
+# подписка переезжает к другому исполнителю, а захват строк - отправить
+# одно сообщение дважды.
+WORKER_FILES = (
+    'HISTORY_FILE', 'METRICS_FILE', 'TENANT_USAGE_FILE', 'TRACE_FILE',
+    'API_RECORD_FILE',
+)
+
+current_subscription = ContextVar('current_subscription', default=None)
+_http = threading.local()
+send_timeout = ContextVar('send_timeout', default=None)
+logger = logging.getLogger(__name__)
+_settings_lock = threading.Lock()
+_settings_loaded = False
+
+
+def load_settings():
+    """Читает .env и переменные окружения в настройки модуля.
+
+    Вызывается не при импорте, а из main(), из функций и конструкторов,
+    читающих настройки, и при первом обращении к настройке как
+    к атрибуту модуля. Значения, уже заданные в модуле, не перезаписываются.
+    В процессе-исполнителе шарда к файлам из WORKER_FILES добавляется
+    SHARD_WORKER_ID, чтобы процессы не писали в одни и те же файлы.
+    """
+    global _settings_loaded
+    if _settings_loaded:
+        return
+    with _settings_lock:
+        if _settings_loaded:
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        settings = globals()
+        worker_id = os.getenv('SHARD_WORKER_ID')
+        for name, (default, cast) in SETTINGS.items():
+            value = os.getenv(name)
+            value = default if value is None else cast(value)
+            if worker_id and name in WORKER_FILES:
+                from sharding import worker_path
+                value = worker_path(value, worker_id)
+            settings.setdefault(name, value)
+        settings.setdefault('HEADERS', {
+            'Authorization': f'OAuth {settings["PRACTICUM_TOKEN"]}'
+        })
+        _settings_loaded = True
+
+
+def __getattr__(name):
+    """Загружает настройки при первом обращении к ним как к атрибутам."""
+    if name in SETTINGS or name == 'HEADERS':
+        load_settings()
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def setup_logger():
-    """Установка логгера."""
-    logger = logging.getLogger(__name__)
+    """Установка логгера.
+
+    Обработчики вешаются на корневой логгер один раз, чтобы в файл
+    и на консоль попадали и сообщения вспомогательных модулей.
+    """
     logger.setLevel(logging.DEBUG)
+    root = logging.getLogger()
+    if any(
+        handler.get_name() in LOG_HANDLER_NAMES for handler in root.handlers
+    ):
+        return logger
+    root.setLevel(logging.INFO)
 
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
     log_file_path = os.path.join(os.path.dirname(__file__), 'logfile.log')
+    if globals().get('SHARD_WORKER_ID'):
+        from sharding import worker_path
+        log_file_path = worker_path(log_file_path, SHARD_WORKER_ID)
     file_handler = logging.FileHandler(log_file_path)
+    file_handler.set_name(LOG_HANDLER_NAMES[0])
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    root.addHandler(file_handler)
 
     console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.set_name(LOG_HANDLER_NAMES[1])
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    root.addHandler(console_handler)
 
     return logger
 
 
-logger = setup_logger()
-
-
 def check_tokens():
     """Проверяет доступность переменных окружения и бросает исключение."""
+    load_settings()
     missing_tokens = [name for name in TOKEN_NAMES if not globals().get(name)]
     if missing_tokens:
         error_message = MISSING_ENV_VAR_ERROR
@@ -85,10 +258,29 @@ def check_tokens():
         raise EnvironmentError(error_message)
 
 
+@contextmanager
+def use_subscription(subscription):
+    """Выполняет запросы к API и отправку от имени подписки."""
+    token = current_subscription.set(subscription)
+    try:
+        yield subscription
+    finally:
+        current_subscription.reset(token)
+
+
 def send_message(bot, message):
     """Отправляет сообщение через бота в Telegram."""
+    load_settings()
+    subscription = current_subscription.get()
+    chat_id = TELEGRAM_CHAT_ID if subscription is None else (
+        subscription.chat_id
+    )
+    timeout = send_timeout.get()
     try:
-        bot.send_message(TELEGRAM_CHAT_ID, message)
+        if timeout is None:
+            bot.send_message(chat_id, message)
+        else:
+            bot.send_message(chat_id, message, timeout=timeout)
         success_message = SUCCESS_MESSAGE.format(message)
         logger.debug(success_message)
         return True
@@ -98,25 +290,118 @@ def send_message(bot, message):
         return False
 
 
+def open_session():
+    """Открывает requests.Session для текущего потока.
+
+    Вызывается при запуске потоков пула: сессия держит соединения
+    с API открытыми между запросами одного потока.
+    """
+    import requests
+    _http.session = requests.Session()
+
+
+def http_client():
+    """Возвращает сессию текущего потока или модуль requests."""
+    session = getattr(_http, 'session', None)
+    if session is not None:
+        return session
+    import requests
+    return requests
+
+
 class ApiError(Exception):
     """Custom exception to handle API errors."""
 
     pass
 
 
+class Wakeup(Exception):
+    """Прерывает паузу основного цикла по сигналу."""
+
+    pass
+
+
+def request_api(headers, params):
+    """Запрашивает API под адаптивным ограничением параллельности.
+
+    Ожидание места и сам запрос укладываются в срок задачи пула, если
+    он задан. Ответы 429/5xx и ошибки соединения уменьшают лимит.
+    Возвращает ответ и момент начала запроса.
+    """
+    deadline = current_deadline.get()
+    with tracer.span('upstream_wait'):
+        started = upstream.acquire(
+            None if deadline is None else max(deadline - time.monotonic(), 0)
+        )
+    if started is None:
+        raise ApiError(UPSTREAM_WAIT_TIMEOUT.format(ENDPOINT))
+    options = {}
+    if deadline is not None:
+        options['timeout'] = max(deadline - started, 0.001)
+    overloaded = True
+    try:
+        with tracer.span(
+            'http_request', kind=SPAN_KIND_CLIENT, **{'url.full': ENDPOINT}
+        ) as span:
+            response = http_client().get(
+                ENDPOINT, headers=headers, params=params, **options
+            )
+            if span is not None:
+                trace_response(span, response, time.monotonic() - started)
+        overloaded = response.status_code in OVERLOAD_STATUSES
+        return response, started
+    finally:
+        upstream.release(started, overloaded)
+
+
+def trace_response(span, response, elapsed):
+    """Дописывает в спан код ответа, размер и разбивку времени запроса.
+
+    requests не сообщает время DNS, соединения и TLS по отдельности;
+    response.elapsed - время до получения заголовков, остаток до
+    elapsed - передача тела.
+    """
+    span.set(**{
+        'http.response.status_code': response.status_code,
+        'http.response.body.size': len(response.content),
+    })
+    to_headers = getattr(response, 'elapsed', None)
+    if to_headers is not None:
+        to_headers = to_headers.total_seconds()
+        span.set(**{
+            'http.time_to_headers_ms': round(to_headers * 1000, 3),
+            'http.transfer_ms': round(max(elapsed - to_headers, 0) * 1000, 3),
+        })
+
+
 def get_api_answer(timestamp):
     """Делает запрос к API ЯндексПрактикум."""
+    import requests
+
+    load_settings()
     params = {'from_date': timestamp}
+    subscription = current_subscription.get()
+    headers = HEADERS if subscription is None else subscription.headers
     try:
-        response = requests.get(ENDPOINT, headers=HEADERS, params=params)
+        response, started = request_api(headers, params)
     except requests.exceptions.RequestException as error:
         raise ApiError(REQUEST_ERROR_MESSAGE.format(
-            ENDPOINT, HEADERS, params, error
+            ENDPOINT, headers, params, error
         ))
+    if subscription is not None:
+        usage.record(
+            subscription.id, requests=1,
+            bytes=len(response.text.encode('utf-8'))
+        )
+    if API_RECORD_FILE:
+        import recorder
+        recorder.get_recorder(API_RECORD_FILE).record(
+            params, response, time.monotonic() - started
+        )
     if response.status_code != HTTPStatus.OK:
         raise requests.exceptions.RequestException(
             RESPONSE_STATUS_ERROR_MESSAGE.format(
-                ENDPOINT, HEADERS, params, response.status_code,
+                ENDPOINT, headers, params, response.status_code,
                 response.reason
             ))
 
@@ -124,7 +409,7 @@ def get_api_answer(timestamp):
     for key in ['code', 'error']:
         if key in json_response:
             raise ApiError(API_ERROR_MESSAGE.format(
-                ENDPOINT, HEADERS, json_response.get(key), params, key
+                ENDPOINT, headers, json_response.get(key), params, key
             ))
     return json_response
 
@@ -141,8 +426,8 @@ def check_response(response):
     return homeworks
 
 
-def parse_status(homework):
-    """Получает статус домашней работы."""
+def parse_homework(homework):
+    """Проверяет запись о работе из ответа API и сжимает её."""
     if 'homework_name' not in homework:
         raise KeyError(MISSING_KEY_ERROR.format('homework_name'))
     name = homework['homework_name']
@@ -151,43 +436,788 @@ def parse_status(homework):
     status = homework['status']
     if status not in HOMEWORK_VERDICTS:
         raise ValueError(UNKNOWN_STATUS_ERROR.format(status, name))
-    return STATUS_CHANGE_MESSAGE.format(name, HOMEWORK_VERDICTS[status])
+    return HomeworkRecord(
+        name, STATUSES.index(status),
+        parse_timestamp(homework.get('date_updated'))
+    )
 
 
-def main():
-    """Основная логика работы бота."""
-    last_message_cache = ''
-    last_homework_time = 0
-    check_tokens()
-    bot = TeleBot(token=TELEGRAM_TOKEN)
+def render_status(record):
+    """Готовит текст уведомления о статусе работы."""
+    return STATUS_CHANGE_MESSAGE.format(
+        record.name, HOMEWORK_VERDICTS[STATUSES[record.status]]
+    )
 
-    while True:
-        try:
-            response = get_api_answer(last_homework_time)
+
+def parse_status(homework):
+    """Получает статус домашней работы."""
+    return render_status(parse_homework(homework))
+
+
+def parse_worker_counts(spec):
+    """Разбирает число потоков стадий из строки вида "fetch=4,deliver=2"."""
+    counts = {}
+    for part in filter(None, spec.split(',')):
+        name, _, count = part.partition('=')
+        counts[name.strip()] = int(count)
+    return counts
+
+
+class Poller:
+    """Стадии конвейера опроса: fetch -> validate -> diff -> render -> deliver.
+
+    Элементы конвейера - пары (подписка, данные стадии).
+    """
+
+    def __init__(
+        self, bot, states, outbox, owners=(), leases=None, history=None
+    ):
+        """Принимает состояния подписок states и журнал уведомлений.
+
+        owners - пары (шард, аренды), по которым проверяется, что
+        подписка обслуживается этим процессом; leases - LeaseKeeper
+        для ограждения доставки; history - журнал истории или None.
+        """
+        load_settings()
+        self.bot = bot
+        self.states = states
+        self.chats = {}
+        for subscription in states:
+            self.chats.setdefault(subscription.chat_id, []).append(
+                subscription
+            )
+        self.outbox = outbox
+        self.history = history
+        self.owners = [owner for owner in owners if owner is not None]
+        self.leases = leases
+        self.delivery = Notifier(
+            outbox, parse_sinks(NOTIFY_SINKS, self.send),
+            fence=None if leases is None else leases.backend.is_valid,
+            on_sent=None if leases is None else leases.backend.remember
+        )
+        self.sent = DedupeStore(DEDUPE_MAX_ENTRIES, DEDUPE_TTL)
+        self.alerts = ErrorAlerter(ERROR_ALERT_INTERVAL)
+        # Корневой спан текущего цикла опроса или None (см. App.poll).
+        self.cycle = None
+
+    def add(self, subscription):
+        """Начинает обслуживать подписку."""
+        self.states[subscription] = SubscriptionState()
+        self.chats.setdefault(subscription.chat_id, []).append(subscription)
+
+    def remove(self, subscription):
+        """Перестаёт обслуживать подписку.
+
+        Вызывается между циклами опроса, когда конвейер уже пуст.
+        """
+        self.states.pop(subscription, None)
+        subscriptions = self.chats.get(subscription.chat_id, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+        if not subscriptions:
+            self.chats.pop(subscription.chat_id, None)
+
+    def build_stages(self, workers):
+        """Возвращает стадии опроса с заданным числом потоков на стадию."""
+        return [
+            Stage(name, self.traced(name, handler), workers.get(name, 1))
+            for name, handler in (
+                ('fetch', self.fetch),
+                ('validate', self.validate),
+                ('diff', self.diff),
+                ('render', self.render),
+                ('deliver', self.deliver),
+            )
+        ]
+
+    def traced(self, name, handler):
+        """Оборачивает стадию в спан цикла опроса.
+
+        Стадии работают в потоках конвейера, поэтому родитель - корневой
+        спан цикла, а подписка записывается в атрибуты.
+        """
+        def run(item):
+            with tracer.span(
+                name, self.cycle, subscription=item[0].id,
+                chat_id=item[0].chat_id
+            ):
+                return handler(item)
+        return run
+
+    def build_pipeline(self, workers, maxsize):
+        """Собирает конвейер с заданным числом потоков на стадию."""
+        return Pipeline(
+            self.build_stages(workers), on_error=self.on_error,
+            maxsize=maxsize,
+        )
+
+    def build_engine(self, workers, deadline):
+        """Собирает пул, прогоняющий подписку через все стадии сразу.
+
+        У каждого потока пула своя сессия requests.
+        """
+        return ThreadPoolEngine(
+            self.build_stages({}), self.on_error, workers, deadline,
+            initializer=open_session
+        )
+
+    def fetch(self, item):
+        """Запрашивает статусы работ подписки."""
+        subscription, _ = item
+        with use_subscription(subscription):
+            from_date = self.states[subscription].from_date
+            with tracer.span('get_api_answer', from_date=from_date):
+                return subscription, get_api_answer(from_date)
+
+    def validate(self, item):
+        """Проверяет ответ API и сжимает последнюю работу в запись.
+
+        Дальше по конвейеру идут только запись и current_date, сам ответ
+        API не задерживается в очередях.
+        """
+        subscription, response = item
+        with tracer.span('check_response'):
             homeworks = check_response(response)
-            if homeworks:
-                latest_homework = homeworks[0]
-                message = parse_status(latest_homework)
-                if (
-                    message != last_message_cache
-                    and send_message(bot, message)
-                ):
-                    last_message_cache = message
-                    last_homework_time = response.get(
-                        'current_date', last_homework_time
-                    )
-            else:
-                logger.debug(NO_CHANGES_IN_STATUS)
-        except Exception as error:
-            error_message = GENERIC_ERROR_MESSAGE.format(error)
-            logger.error(error_message)
+        state = self.states[subscription]
+        state.consecutive_errors = 0
+        state.checked = time.time()
+        if not homeworks:
+            logger.debug(NO_CHANGES_IN_STATUS)
+            return None
+        state.active = homeworks[0].get('status') == 'reviewing'
+        with tracer.span('parse_status'):
+            record = state.last = parse_homework(homeworks[0])
+        return subscription, (response.get('current_date'), record)
+
+    def diff(self, item):
+        """Пропускает дальше только работу, статус которой ещё не отправлен.
+
+        Ключ события - чат, работа, статус и время обновления; он же
+        служит ключом идемпотентности журнала уведомлений. Реплика,
+        только что получившая подписку, сверяет его и с последним
+        уведомлением, которое доставил прежний владелец.
+        """
+        subscription, (current_date, record) = item
+        key = make_key(
+            subscription.chat_id, record.name, STATUSES[record.status],
+            format_timestamp(record.updated)
+        )
+        with tracer.span('dedupe_check') as span:
+            duplicate = key in self.sent or self.notified_before(
+                subscription, key
+            )
+            if span is not None:
+                span.set(duplicate=duplicate)
+        if duplicate:
+            logger.debug(NO_CHANGES_IN_STATUS)
+            return None
+        return subscription, (current_date, record, key)
+
+    def notified_before(self, subscription, key):
+        """Проверяет, доставлено ли событие по данным хранилища аренды."""
+        if self.leases is None:
+            return False
+        if self.leases.backend.last_notified(subscription.id) != key:
+            return False
+        self.sent.add(key)
+        return True
+
+    def render(self, item):
+        """Готовит текст уведомления, только когда его пора отправить."""
+        subscription, (current_date, record, key) = item
+        return subscription, (
+            current_date, record, key, render_status(record)
+        )
+
+    def deliver(self, item):
+        """Записывает уведомление в журнал и будит поток доставки.
+
+        Статус считается обработанным сразу после записи: дальше
+        за доставку отвечает журнал, и повторно опрашивать API ради
+        повторной отправки не нужно.
+        """
+        subscription, (current_date, record, key, message) = item
+        state = self.states[subscription]
+        self.notify(key, subscription.chat_id, message, subscription)
+        self.sent.add(key)
+        if self.history is not None:
+            self.history.append(subscription.id, record)
+        if current_date is not None:
+            state.from_date = current_date
+
+    def notify(self, key, chat_id, text, subscription=None,
+               priority=PRIORITY_STATUS):
+        """Ставит сообщение в журнал и будит поток доставки.
+
+        Уведомление о статусе подписки записывается с токеном аренды,
+        чтобы реплика, потерявшая подписку, его уже не отправила.
+        Оповещения об ошибках идут классом PRIORITY_ALERT: они
+        доставляются после статусов и первыми сокращаются при
+        переполнении журнала.
+        """
+        fence = None
+        if subscription is not None:
+            usage.record(subscription.id, messages=1)
+            if self.leases is not None:
+                fence = self.leases.token(subscription.id)
+        self.delivery.put(
+            key, chat_id, text,
+            None if fence is None else subscription.id, fence, priority
+        )
+
+    def owns(self, subscription):
+        """Проверяет, что подписку обслуживает этот процесс."""
+        return all(owner.owns(subscription.id) for owner in self.owners)
+
+    def send(self, chat_id, text, timeout=None):
+        """Отправляет сообщение из журнала в чат chat_id."""
+        token = send_timeout.set(timeout)
+        try:
+            with use_subscription(Subscription(chat_id, None)), tracer.span(
+                'send_message', self.cycle, chat_id=chat_id
+            ) as span:
+                sent = send_message(self.bot, text)
+                if span is not None:
+                    span.set(sent=sent)
+                return sent
+        finally:
+            send_timeout.reset(token)
+
+    def on_error(self, stage, item, error):
+        """Логирует ошибку стадии и сообщает о ней в чат подписки.
+
+        Повторы ошибки с тем же отпечатком копятся в ErrorAlerter
+        и уходят одной сводкой за интервал.
+        """
+        subscription = item[0]
+        self.states[subscription].consecutive_errors += 1
+        usage.record(subscription.id, errors=1)
+        logger.error(STAGE_ERROR_MESSAGE.format(
+            stage, subscription.chat_id, error
+        ))
+        error_fingerprint = self.alerts.record(
+            subscription.chat_id, error, stage
+        )
+        if error_fingerprint is not None:
+            usage.record(subscription.id, messages=1)
+            self.notify(
+                make_key(
+                    subscription.chat_id, *error_fingerprint, time.time()
+                ),
+                subscription.chat_id,
+                GENERIC_ERROR_MESSAGE.format(error),
+                priority=PRIORITY_ALERT
+            )
+
+    def flush_alerts(self):
+        """Ставит в журнал сводки по накопившимся повторам ошибок."""
+        for summary in self.alerts.flush():
+            self.notify(
+                make_key(summary.chat_id, *summary.fingerprint, time.time()),
+                summary.chat_id,
+                summary.text,
+                priority=PRIORITY_ALERT
+            )
+
+    def fetch_history(self, subscription):
+        """Запрашивает все работы подписки для догрузки истории.
+
+        Уведомлений не отправляет и состояние подписки не меняет;
+        работы с неизвестным статусом пропускаются. Для подписки,
+        заблокированной квотой, возвращает None.
+        """
+        if usage.blocked_until(subscription.id) is not None:
+            return None
+        with use_subscription(subscription):
+            homeworks = check_response(get_api_answer(0))
+        records = []
+        for homework in homeworks:
+            try:
+                records.append(parse_homework(homework))
+            except (KeyError, ValueError) as error:
+                logger.debug(error)
+        return records
+
+    def refresh(self, subscription):
+        """Запрашивает статус подписки вне расписания.
+
+        Если последняя работа известна, запрашиваются только изменения
+        с from_date подписки: этот вызов выполняется в потоке бота.
+        Пока она неизвестна, запрос идёт с from_date = 0 - работа может
+        быть старше окна, с которого начат опрос (см. App.catch_up).
+        """
+        state = self.states[subscription]
+        from_date = state.from_date if state.last is not None else 0
+        with use_subscription(subscription):
+            homeworks = check_response(get_api_answer(from_date))
+        if homeworks:
+            state.last = parse_homework(homeworks[0])
+        state.checked = time.time()
+
+    def remember_latest(self, subscription, record):
+        """Запоминает последнюю работу, найденную догрузкой истории."""
+        state = self.states.get(subscription)
+        if state is not None and state.last is None:
+            state.last = record
+
+    def status_reply(self, chat_id, ttl):
+        """Готовит ответ на /status из последнего известного состояния.
+
+        API запрашивается, только если состояние старше ttl секунд и
+        подписка не заблокирована квотой; если запрос не удался,
+        отвечаем тем, что есть.
+        """
+        replies = []
+        for subscription in list(self.chats.get(str(chat_id), ())):
+            state = self.states.get(subscription)
+            if state is None:
+                continue
             if (
-                error_message != last_message_cache
-                and send_message(bot, error_message)
+                (state.checked is None or time.time() - state.checked > ttl)
+                and usage.blocked_until(subscription.id) is None
             ):
-                last_message_cache = error_message
+                try:
+                    self.refresh(subscription)
+                except Exception as error:
+                    logger.error(STATUS_REFRESH_ERROR.format(chat_id, error))
+            if state.last is None:
+                replies.append(STATUS_UNKNOWN)
+                continue
+            replies.append(STATUS_REPLY.format(
+                render_status(state.last),
+                time.strftime(
+                    STATUS_TIME_FORMAT, time.localtime(state.checked)
+                )
+            ))
+        return '\n\n'.join(replies) or STATUS_NOT_SUBSCRIBED
+
+    def essential(self, subscription):
+        """Проверяет, есть ли у подписки работа на проверке.
+
+        Такие подписки при перегрузке опрашиваются первыми и без
+        растяжения пауз: по ним ждут уведомления прямо сейчас.
+        """
+        last = self.states[subscription].last
+        return last is not None and STATUSES[last.status] == 'reviewing'
+
+    def next_delay(self, subscription, policy, stretch=1):
+        """Возвращает паузу до следующего опроса подписки.
+
+        При перегрузке пауза второстепенной подписки умножается
+        на stretch. Подписка, превысившая квоту, опрашивается не раньше
+        конца блокировки.
+        """
+        state = self.states[subscription]
+        delay = policy.next_delay(state.consecutive_errors, state.active)
+        if stretch > 1 and not self.essential(subscription):
+            delay *= stretch
+        blocked_until = usage.blocked_until(subscription.id)
+        if blocked_until is not None:
+            delay = max(delay, blocked_until - time.time())
+        return delay
+
+
+def report_pipeline(pipeline):
+    """Логирует глубину очередей и выгружает её в метрики."""
+    load_settings()
+    stats = pipeline.stats()
+    for stage in stats:
+        metrics.set('pipeline_queue_depth', stage.depth, stage=stage.name)
+        metrics.set('pipeline_queue_peak', stage.peak, stage=stage.name)
+        metrics.set('pipeline_busy_seconds', stage.busy, stage=stage.name)
+    logger.debug(PIPELINE_STATS_MESSAGE.format('; '.join(
+        STAGE_STATS_MESSAGE.format(
+            stage.name, stage.depth, stage.peak, stage.workers,
+            stage.processed, stage.busy
+        )
+        for stage in stats
+    )))
+    if METRICS_FILE:
+        metrics.write_textfile(METRICS_FILE)
+
+
+def load_registry():
+    """Возвращает подписки из SUBSCRIPTIONS_FILE или из окружения."""
+    load_settings()
+    return load_subscriptions(
+        SUBSCRIPTIONS_FILE, Subscription(TELEGRAM_CHAT_ID, PRACTICUM_TOKEN)
+    )
+
+
+def hold_leases(subscriptions, shard):
+    """Берёт аренду подписок, если реплик несколько."""
+    load_settings()
+    if not LEASE_BACKEND:
+        return None
+    from leases import LeaseKeeper, make_backend
+    return LeaseKeeper(
+        make_backend(LEASE_BACKEND),
+        lambda: [
+            subscription.id for subscription in subscriptions
+            if shard is None or shard.owns(subscription.id)
+        ],
+        LEASE_TTL
+    ).start()
+
+
+def open_history():
+    """Открывает журнал истории статусов, если задан HISTORY_FILE."""
+    load_settings()
+    if not HISTORY_FILE:
+        return None
+    from history import HistoryLog
+    return HistoryLog(HISTORY_FILE, HISTORY_RETENTION).start()
+
+
+def registry_mtime():
+    """Возвращает время изменения SUBSCRIPTIONS_FILE или None."""
+    load_settings()
+    try:
+        return os.stat(SUBSCRIPTIONS_FILE).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def join_shard():
+    """Подключает процесс к шарду, если он запущен супервизором."""
+    load_settings()
+    if not SHARD_WORKER_ID:
+        return None
+    from sharding import ShardMember, ShardStore
+    return ShardMember(ShardStore(SHARD_STORE), SHARD_WORKER_ID).start()
+
+
+class App:
+    """Контекст работающего бота: подписки, конвейер, журнал, расписание.
+
+    Создаётся в main(), поэтому импорт модуля ничего не читает,
+    не открывает и не запускает.
+    """
+
+    def __init__(self, bot):
+        """Читает настройки и реестр и собирает компоненты бота."""
+        load_settings()
+        self.policy = PollingPolicy(
+            RETRY_PERIOD, IDLE_RETRY_PERIOD, ERROR_BACKOFF, MAX_RETRY_PERIOD
+        )
+        self.subscriptions = load_registry()
+        shard = join_shard()
+        leases = hold_leases(self.subscriptions, shard)
+        self.poller = Poller(
+            bot,
+            {
+                subscription: SubscriptionState()
+                for subscription in self.subscriptions
+            },
+            Outbox(
+                OUTBOX_FILE, backlog_limit=OUTBOX_BACKLOG_LIMIT,
+                retention=OUTBOX_RETENTION
+            ),
+            (shard, leases), leases, open_history()
+        )
+        if ENGINE == 'threads':
+            self.pipeline = self.poller.build_engine(
+                ENGINE_WORKERS, TASK_DEADLINE
+            )
+        else:
+            self.pipeline = self.poller.build_pipeline(
+                parse_worker_counts(PIPELINE_WORKERS), PIPELINE_QUEUE_SIZE
+            )
+        tracer.configure(TRACE_SAMPLE_RATE, TRACE_FILE)
+        upstream.configure(
+            UPSTREAM_LIMIT_INITIAL, UPSTREAM_LIMIT_MIN, UPSTREAM_LIMIT_MAX,
+            UPSTREAM_LATENCY_TOLERANCE
+        )
+        usage.configure(Quota(
+            TENANT_QUOTA_REQUESTS, TENANT_QUOTA_BYTES, TENANT_QUOTA_ERRORS,
+            TENANT_QUOTA_MESSAGES, TENANT_QUOTA_WINDOW, TENANT_SUSPEND
+        ))
+        self.scheduler = Scheduler()
+        self.shedder = LoadShedder(SHED_LAG_THRESHOLD, SHED_MAX_STRETCH)
+        self.backfill = None
+        if self.poller.history is not None and BACKFILL_RATE:
+            self.backfill = Backfill(
+                self.poller.fetch_history, self.poller.history, BACKFILL_RATE,
+                pause=lambda: self.shedder.shedding,
+                latest=self.poller.remember_latest
+            )
+        for subscription in self.subscriptions:
+            self.catch_up(subscription)
+            self.scheduler.schedule(subscription, time.monotonic())
+        self.listener = None
+        self.registry_mtime = registry_mtime()
+        self.stopping = False
+        self.reload_requested = False
+        # Сигнал пришёл и ещё не прервал паузу основного цикла.
+        self.wakeup = threading.Event()
+        self._idle = False
+        self._signals = {}
+
+    def start(self):
+        """Запускает потоки конвейера, доставки и команд."""
+        self.poller.delivery.start()
+        self.pipeline.start()
+        if self.backfill is not None:
+            self.backfill.start()
+        if STATUS_COMMAND:
+            self.listen()
+        return self
+
+    def catch_up(self, subscription):
+        """Начинает опрос подписки без состояния с недавнего окна.
+
+        Первый запрос берёт только последние BACKFILL_WINDOW секунд,
+        поэтому свежие изменения уходят сразу, а не после выгрузки всей
+        истории. Более старая история, если ведётся журнал истории,
+        догружается в фоне без уведомлений.
+        """
+        state = self.poller.states[subscription]
+        if not BACKFILL_WINDOW or state.from_date:
+            return
+        state.from_date = int(time.time()) - BACKFILL_WINDOW
+        if self.backfill is not None:
+            self.backfill.add(subscription, state.from_date)
+
+    def listen(self):
+        """Принимает команду /status через long polling Telegram.
+
+        Получать обновления бота может только один процесс, поэтому
+        при нескольких процессах STATUS_COMMAND включают у одного.
+        """
+        bot = self.poller.bot
+        bot.register_message_handler(self.answer_status, commands=['status'])
+        self.listener = threading.Thread(
+            target=bot.infinity_polling, name='telegram-commands',
+            daemon=True
+        )
+        self.listener.start()
+
+    def answer_status(self, message):
+        """Отвечает на /status в чат, из которого пришла команда."""
+        self.poller.bot.send_message(
+            message.chat.id,
+            self.poller.status_reply(message.chat.id, STATUS_TTL)
+        )
+
+    def handle_signals(self):
+        """Ставит обработчики SIGTERM, SIGINT и SIGHUP.
+
+        SIGTERM и SIGINT останавливают бота, SIGHUP перечитывает реестр
+        подписок. Пауза между циклами прерывается сразу, а начатый цикл
+        опроса и доставки дорабатывается до конца.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for name in ('SIGTERM', 'SIGINT', 'SIGHUP'):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                self._signals[signum] = signal.signal(signum, self.on_signal)
+
+    def on_signal(self, signum, frame):
+        """Запоминает сигнал и прерывает паузу, если бот простаивает.
+
+        Исключение Wakeup бросается не больше одного раза за паузу:
+        флаг паузы снимается до него, поэтому следующий сигнал уже
+        не прервёт начатый цикл опроса или доставки.
+        """
+        logger.info(SIGNAL_RECEIVED.format(signal.Signals(signum).name))
+        if signum == getattr(signal, 'SIGHUP', None):
+            self.reload_requested = True
+        else:
+            self.stopping = True
+        self.wakeup.set()
+        if self._idle:
+            self._idle = False
+            raise Wakeup()
+
+    @contextmanager
+    def idle(self):
+        """Отмечает паузу, которую сигнал может прервать исключением Wakeup.
+
+        Пауза целиком, вместе с её началом и концом, должна быть внутри
+        try, перехватывающего Wakeup. Сигнал, пришедший во время цикла,
+        прерывает паузу ещё до её начала.
+        """
+        self._idle = True
+        try:
+            if self.wakeup.is_set():
+                raise Wakeup()
+            yield
         finally:
-            time.sleep(RETRY_PERIOD)
+            self.wakeup.clear()
+            self._idle = False
+
+    def reload_registry(self):
+        """Подхватывает изменения SUBSCRIPTIONS_FILE без перезапуска.
+
+        Запускаются только новые подписки и останавливаются только
+        удалённые; состояние остальных, включая from_date, сохраняется.
+        """
+        if not SUBSCRIPTIONS_FILE:
+            return
+        mtime = registry_mtime()
+        if not self.reload_requested and mtime == self.registry_mtime:
+            return
+        self.reload_requested = False
+        self.registry_mtime = mtime
+        try:
+            subscriptions = load_registry()
+        except (OSError, ValueError, KeyError) as error:
+            logger.error(REGISTRY_RELOAD_ERROR.format(error))
+            return
+        current, updated = set(self.subscriptions), set(subscriptions)
+        removed = [
+            subscription for subscription in self.subscriptions
+            if subscription not in updated
+        ]
+        added = [
+            subscription for subscription in subscriptions
+            if subscription not in current
+        ]
+        for subscription in removed:
+            self.scheduler.remove(subscription)
+            self.poller.remove(subscription)
+            if self.backfill is not None:
+                self.backfill.remove(subscription)
+        for subscription in added:
+            self.poller.add(subscription)
+            self.catch_up(subscription)
+            self.scheduler.schedule(subscription, time.monotonic())
+        # Список меняется на месте: по нему же аренда выбирает подписки.
+        self.subscriptions[:] = subscriptions
+        if added or removed:
+            logger.info(REGISTRY_RELOADED.format(len(added), len(removed)))
+
+    def pop_due(self, now):
+        """Снимает с расписания подписки, которые пора опросить.
+
+        По отставанию от расписания решает, сбрасывать ли нагрузку;
+        при перегрузке подписки с работами на проверке идут первыми.
+        """
+        popped = self.scheduler.pop_due(now)
+        self.observe_lag(max((now - due for _, due in popped), default=0))
+        due = [subscription for subscription, _ in popped]
+        if self.shedder.shedding:
+            due.sort(key=lambda subscription: not self.poller.essential(
+                subscription
+            ))
+        return due
+
+    def observe_lag(self, lag):
+        """Учитывает отставание цикла и сообщает о смене режима."""
+        shedding = self.shedder.shedding
+        stretch = self.shedder.observe(lag)
+        metrics.set('poll_lag_seconds', round(lag, 3))
+        metrics.set('load_shed_stretch', stretch)
+        if self.shedder.shedding and not shedding:
+            logger.warning(LOAD_SHEDDING_STARTED.format(lag, stretch))
+        elif shedding and not self.shedder.shedding:
+            logger.info(LOAD_SHEDDING_STOPPED)
+
+    def poll(self, due):
+        """Прогоняет подписки через конвейер и разбирает очередь Telegram.
+
+        Подписки, заблокированные квотой, пропускаются. Выбранный для
+        трассировки цикл записывается одной трассой с корневым спаном
+        poll_cycle. При перегрузке трассировка, выгрузка очередей
+        конвейера и файла учёта пропускаются. Очереди остальных
+        получателей разбирают их потоки доставки, чтобы недоступный
+        вебхук не задерживал цикл опроса.
+        """
+        shedding = self.shedder.shedding
+        with (
+            nullcontext() if shedding
+            else tracer.trace('poll_cycle', due=len(due))
+        ) as cycle:
+            self.poller.cycle = cycle
+            try:
+                for subscription in due:
+                    if (
+                        self.poller.owns(subscription)
+                        and usage.blocked_until(subscription.id) is None
+                    ):
+                        self.pipeline.submit((subscription, None))
+                self.pipeline.join()
+                self.poller.flush_alerts()
+                self.poller.delivery.flush_telegram()
+            finally:
+                self.poller.cycle = None
+        if shedding:
+            return
+        report_pipeline(self.pipeline)
+        if TENANT_USAGE_FILE:
+            usage.write(TENANT_USAGE_FILE)
+
+    def reschedule(self, due, now):
+        """Ставит опрошенные подписки в расписание; возвращает паузу."""
+        for subscription in due:
+            self.scheduler.schedule(
+                subscription,
+                now + self.poller.next_delay(
+                    subscription, self.policy, self.shedder.stretch
+                )
+            )
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            return RETRY_PERIOD
+        return max(0, round(next_due - now, 3))
+
+    def close(self):
+        """Останавливает потоки, закрывает хранилища и сохраняет счётчики."""
+        if self.listener is not None:
+            self.poller.bot.stop_polling()
+            self.listener.join(5)
+        if self.backfill is not None:
+            self.backfill.stop()
+        self.pipeline.close()
+        self.poller.delivery.stop()
+        self.poller.outbox.close()
+        if self.poller.history is not None:
+            self.poller.history.close()
+        for owner in self.poller.owners:
+            owner.stop()
+        if TENANT_USAGE_FILE:
+            usage.write(TENANT_USAGE_FILE)
+        if METRICS_FILE:
+            metrics.write_textfile(METRICS_FILE)
+        for signum, handler in self._signals.items():
+            signal.signal(signum, handler)
+        self._signals.clear()
+
+
+def main():
+    """Основная логика работы бота."""
+    load_settings()
+    setup_logger()
+    check_tokens()
+    from telebot import TeleBot
+    from transport import TelegramSession
+    session = TelegramSession(
+        TELEGRAM_POOL_SIZE, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT
+    ).install()
+    bot = TeleBot(token=TELEGRAM_TOKEN)
+    app = App(bot).start()
+    app.handle_signals()
+
+    try:
+        while not app.stopping:
+            app.reload_registry()
+            now = time.monotonic()
+            due = app.pop_due(now)
+            try:
+                app.poll(due)
+            except Exception as error:
+                logger.error(GENERIC_ERROR_MESSAGE.format(error))
+            finally:
+                delay = app.reschedule(due, now)
+            try:
+                with app.idle():
+                    time.sleep(delay)
+            except Wakeup:
+                pass
+    finally:
+        app.close()
+        session.close()
 
 
 if __name__ == '__main__':
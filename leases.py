@@ -0,0 +1,340 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    resource TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    token INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notified (
+    resource TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+"""
+
+# Продление и освобождение аренды в Redis: проверка владельца и действие
+# одним скриптом, чтобы между ними аренду не успели перехватить.
+RENEW_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value and string.match(value, '^(.*):%d+$') == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return value
+end
+return false
+"""
+RELEASE_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value and string.match(value, '^(.*):%d+$') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+UNKNOWN_BACKEND = 'Неизвестное хранилище аренды: {}'
+UNKNOWN_SCRIPT = 'Скрипт не поддерживается заменителем Redis'
+LEASE_ACQUIRED = 'Получена аренда {} с токеном {}'
+LEASE_LOST = 'Потеряна аренда {}'
+
+
+def default_owner():
+    """Имя реплики: машина и номер процесса."""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class SqliteLeaseBackend:
+    """Аренды с токенами ограждения в SQLite."""
+
+    def __init__(self, path):
+        """Открывает базу аренд path в режиме WAL."""
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+
+    def acquire(self, resource, owner, ttl):
+        """Берёт или продлевает аренду; возвращает токен или None.
+
+        Токен растёт при каждой смене владельца, поэтому прежний
+        владелец по своему токену узнаёт, что аренду уже перехватили.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            row = self._connection.execute(
+                'SELECT owner, token, expires FROM leases WHERE resource = ?',
+                (resource,)
+            ).fetchone()
+            if row is None:
+                token = 1
+            elif row[0] == owner and row[2] > now:
+                token = row[1]
+            elif row[2] <= now:
+                token = row[1] + 1
+            else:
+                return None
+            self._connection.execute(
+                'INSERT OR REPLACE INTO leases '
+                '(resource, owner, token, expires) VALUES (?, ?, ?, ?)',
+                (resource, owner, token, now + ttl)
+            )
+        return token
+
+    def release(self, resource, owner):
+        """Освобождает аренду, если она принадлежит owner."""
+        with self._lock:
+            self._connection.execute(
+                'UPDATE leases SET expires = 0 '
+                'WHERE resource = ? AND owner = ?',
+                (resource, owner)
+            )
+
+    def is_valid(self, resource, token):
+        """Проверяет, что токен не устарел."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT token FROM leases WHERE resource = ?', (resource,)
+            ).fetchone()
+        return row is not None and row[0] == token
+
+    def remember(self, resource, key):
+        """Запоминает ключ последнего доставленного уведомления подписки."""
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO notified (resource, key) '
+                'VALUES (?, ?)',
+                (resource, key)
+            )
+
+    def last_notified(self, resource):
+        """Возвращает ключ последнего доставленного уведомления или None."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT key FROM notified WHERE resource = ?', (resource,)
+            ).fetchone()
+        return row and row[0]
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class RedisLeaseBackend:
+    """Аренды в Redis или в совместимом с ним хранилище.
+
+    Аренда - ключ lease:<ресурс> со значением "владелец:токен" и сроком
+    жизни, токены берутся из счётчика lease:<ресурс>:fence. Ключ
+    последнего доставленного уведомления хранится в lease:<ресурс>:notified.
+    """
+
+    def __init__(self, client):
+        """Работает через клиент redis-py или MemoryRedis."""
+        self.client = client
+
+    def acquire(self, resource, owner, ttl):
+        """Берёт или продлевает аренду; возвращает токен или None."""
+        key = f'lease:{resource}'
+        milliseconds = int(ttl * 1000)
+        value = _decode(self.client.eval(
+            RENEW_SCRIPT, 1, key, owner, milliseconds
+        ))
+        if value is not None:
+            return int(value.rpartition(':')[2])
+        if self.client.get(key) is not None:
+            return None
+        token = self.client.incr(f'{key}:fence')
+        if self.client.set(key, f'{owner}:{token}', nx=True, px=milliseconds):
+            return token
+        return None
+
+    def release(self, resource, owner):
+        """Освобождает аренду, если она принадлежит owner."""
+        self.client.eval(RELEASE_SCRIPT, 1, f'lease:{resource}', owner)
+
+    def is_valid(self, resource, token):
+        """Проверяет, что токен не устарел."""
+        key = f'lease:{resource}'
+        value = _decode(self.client.get(key))
+        if value is not None:
+            return int(value.rpartition(':')[2]) == token
+        return int(_decode(self.client.get(f'{key}:fence')) or 0) == token
+
+    def remember(self, resource, key):
+        """Запоминает ключ последнего доставленного уведомления подписки."""
+        self.client.set(f'lease:{resource}:notified', key)
+
+    def last_notified(self, resource):
+        """Возвращает ключ последнего доставленного уведомления или None."""
+        return _decode(self.client.get(f'lease:{resource}:notified'))
+
+
+class MemoryRedis:
+    """Заменитель Redis в памяти процесса с нужным подмножеством команд."""
+
+    def __init__(self, clock=time.monotonic):
+        """Сроки жизни ключей отсчитываются по часам clock."""
+        self.clock = clock
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """GET."""
+        with self._lock:
+            self._expire(name)
+            return self._data.get(name)
+
+    def set(self, name, value, nx=False, px=None):
+        """SET с поддержкой NX и PX."""
+        with self._lock:
+            self._expire(name)
+            if nx and name in self._data:
+                return None
+            self._data[name] = value
+            self._expires.pop(name, None)
+            if px is not None:
+                self._expires[name] = self.clock() + px / 1000
+            return True
+
+    def incr(self, name):
+        """INCR."""
+        with self._lock:
+            self._expire(name)
+            self._data[name] = int(self._data.get(name, 0)) + 1
+            return self._data[name]
+
+    def pexpire(self, name, milliseconds):
+        """PEXPIRE."""
+        with self._lock:
+            self._expire(name)
+            if name not in self._data:
+                return False
+            self._expires[name] = self.clock() + milliseconds / 1000
+            return True
+
+    def delete(self, name):
+        """DEL."""
+        with self._lock:
+            self._expires.pop(name, None)
+            return int(self._data.pop(name, None) is not None)
+
+    def eval(self, script, numkeys, name, owner, *args):
+        """EVAL для скриптов продления и освобождения аренды."""
+        if script not in (RENEW_SCRIPT, RELEASE_SCRIPT):
+            raise NotImplementedError(UNKNOWN_SCRIPT)
+        with self._lock:
+            self._expire(name)
+            value = self._data.get(name)
+            if value is None or value.rpartition(':')[0] != owner:
+                return None if script == RENEW_SCRIPT else 0
+            if script == RENEW_SCRIPT:
+                self._expires[name] = self.clock() + int(args[0]) / 1000
+                return value
+            self._expires.pop(name, None)
+            del self._data[name]
+            return 1
+
+    def _expire(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= self.clock():
+            del self._expires[name]
+            self._data.pop(name, None)
+
+
+def make_backend(url):
+    """Создаёт хранилище аренды по адресу.
+
+    sqlite:///path - файл SQLite, redis://... - сервер Redis (нужен
+    пакет redis), memory:// - заменитель Redis в памяти процесса.
+    """
+    if url.startswith('sqlite:///'):
+        return SqliteLeaseBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        import redis
+        return RedisLeaseBackend(redis.Redis.from_url(url))
+    if url.startswith('memory://'):
+        return RedisLeaseBackend(MemoryRedis())
+    raise ValueError(UNKNOWN_BACKEND.format(url))
+
+
+class LeaseKeeper:
+    """Держит аренду подписок, которые должна обслуживать эта реплика.
+
+    Фоновый поток каждые ttl/3 секунд продлевает имеющиеся аренды
+    и пытается взять освободившиеся, поэтому после падения владельца
+    подписка переходит к другой реплике примерно за ttl секунд.
+    Аренда считается своей, только пока не истёк её срок по местным
+    часам, даже если поток продления завис.
+    """
+
+    def __init__(self, backend, resources, ttl=60, owner=None):
+        """Берёт аренды в backend для подписок, которые возвращает resources.
+
+        owner по умолчанию - хост и pid процесса.
+        """
+        self.backend = backend
+        self.resources = resources
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='leases', daemon=True
+        )
+
+    def start(self):
+        """Берёт аренды и запускает их продление."""
+        self.refresh()
+        self._thread.start()
+        return self
+
+    def refresh(self):
+        """Продлевает и берёт аренды для текущего списка подписок."""
+        for resource in self.resources():
+            deadline = time.monotonic() + self.ttl
+            token = self.backend.acquire(resource, self.owner, self.ttl)
+            with self._lock:
+                previous = self._held.pop(resource, None)
+                if token is not None:
+                    self._held[resource] = (token, deadline)
+            if token is not None and previous is None:
+                logger.info(LEASE_ACQUIRED.format(resource, token))
+            elif token is None and previous is not None:
+                logger.warning(LEASE_LOST.format(resource))
+
+    def token(self, resource):
+        """Возвращает токен действующей аренды или None."""
+        with self._lock:
+            token, deadline = self._held.get(resource, (None, 0))
+        return token if deadline > time.monotonic() else None
+
+    def owns(self, resource):
+        """Проверяет, что реплика сейчас владеет подпиской."""
+        return self.token(resource) is not None
+
+    def stop(self):
+        """Останавливает продление и освобождает аренды."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(5)
+        with self._lock:
+            held, self._held = list(self._held), {}
+        for resource in held:
+            self.backend.release(resource, self.owner)
+
+    def _run(self):
+        while not self._stopped.wait(self.ttl / 3):
+            try:
+                self.refresh()
+            except Exception as error:
+                logger.error(error, exc_info=True)
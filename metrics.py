@@ -0,0 +1,52 @@
+import os
+import threading
+
+
+class Metrics:
+    """Потокобезопасный реестр числовых метрик процесса."""
+
+    def __init__(self):
+        """Создаёт пустой реестр."""
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, name, value, **labels):
+        """Устанавливает значение метрики-датчика."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def incr(self, name, value=1, **labels):
+        """Увеличивает счётчик."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, name, **labels):
+        """Возвращает текущее значение метрики или 0."""
+        with self._lock:
+            return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = []
+        for (name, labels), value in items:
+            if labels:
+                name += '{' + ','.join(
+                    f'{label}="{label_value}"'
+                    for label, label_value in labels
+                ) + '}'
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Атомарно записывает метрики в файл для node_exporter."""
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temporary_path, path)
+
+
+registry = Metrics()
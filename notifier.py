@@ -0,0 +1,195 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry as metrics
+from outbox import DEFAULT_SINK, PRIORITY_STATUS, DeliveryWorker, make_key
+
+UNKNOWN_SINK = 'Неизвестный получатель уведомлений: {}'
+SINK_TARGET_MISSING = 'Для получателя {} не задан адрес'
+
+
+class Sink:
+    """Получатель уведомлений со своим пулом, таймаутом и числом попыток.
+
+    target(chat_id, text, timeout) отправляет сообщение и возвращает
+    истину при успехе; timeout - таймаут одной попытки в секундах.
+    """
+
+    def __init__(
+        self, name, target=None, workers=1, timeout=None, max_attempts=20
+    ):
+        """Очередь получателя в журнале уведомлений называется name."""
+        self.name = name
+        self.target = target
+        self.workers = workers
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def send(self, chat_id, text):
+        """Отправляет одно сообщение с таймаутом получателя."""
+        return self.target(chat_id, text, self.timeout)
+
+
+class WebhookSink(Sink):
+    """POST JSON {"chat_id": ..., "text": ...} на адрес url."""
+
+    def __init__(self, url, name='webhook', workers=4, timeout=10,
+                 max_attempts=5):
+        """Сообщения отправляются POST-запросом на url."""
+        super().__init__(name, None, workers, timeout, max_attempts)
+        self.url = url
+
+    def send(self, chat_id, text):
+        """Отправляет сообщение на вебхук; ответ 2xx - успех."""
+        import requests
+        response = requests.post(
+            self.url, json={'chat_id': chat_id, 'text': text},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return True
+
+
+class FileSink(Sink):
+    """Дописывает сообщения в файл по одной JSON-строке."""
+
+    def __init__(self, path, name='file', workers=1, timeout=None,
+                 max_attempts=3):
+        """Сообщения дописываются в файл path."""
+        super().__init__(name, None, workers, timeout, max_attempts)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, chat_id, text):
+        """Дописывает сообщение в файл."""
+        line = json.dumps(
+            {'chat_id': chat_id, 'text': text}, ensure_ascii=False
+        )
+        with self._lock, open(self.path, 'a', encoding='utf-8') as sink_file:
+            sink_file.write(line + '\n')
+        return True
+
+
+OPTIONS = {'workers': int, 'timeout': float, 'attempts': int, 'name': str}
+
+
+def parse_sinks(spec, telegram):
+    """Собирает получателей из строки NOTIFY_SINKS.
+
+    Получатели перечисляются через запятую в виде вид[=адрес] с
+    необязательными параметрами через точку с запятой, например
+    "telegram,webhook=https://example.com/hook;workers=8;timeout=5,
+    file=notifications.jsonl". Параметры: workers, timeout, attempts
+    и name. telegram(chat_id, text, timeout) отправляет в Telegram.
+    """
+    sinks = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        head, *options = entry.split(';')
+        kind, _, target = head.partition('=')
+        settings = {}
+        for option in options:
+            option, _, value = option.partition('=')
+            settings[option.strip()] = OPTIONS[option.strip()](value)
+        if 'attempts' in settings:
+            settings['max_attempts'] = settings.pop('attempts')
+        kind = kind.strip()
+        if kind == DEFAULT_SINK:
+            sinks.append(Sink(
+                settings.pop('name', DEFAULT_SINK), telegram, **settings
+            ))
+        elif kind in ('webhook', 'file'):
+            if not target:
+                raise ValueError(SINK_TARGET_MISSING.format(kind))
+            sink_class = WebhookSink if kind == 'webhook' else FileSink
+            sinks.append(sink_class(target.strip(), **settings))
+        else:
+            raise ValueError(UNKNOWN_SINK.format(kind))
+    return sinks
+
+
+class Notifier:
+    """Рассылает уведомление всем получателям через журнал.
+
+    Для каждого получателя в журнал пишется своя строка, и её доставляет
+    свой поток со своим пулом, поэтому медленный или недоступный
+    получатель не задерживает остальных, а повторы идут только к нему.
+    Задержка от постановки в журнал до доставки копится в метриках
+    notify_latency_seconds_sum и notify_latency_seconds_count
+    с меткой sink. on_sent(resource, key) узнаёт о доставке в Telegram
+    сообщений, записанных с арендой: ключ строки Telegram совпадает
+    с ключом события.
+    """
+
+    def __init__(self, outbox, sinks, fence=None, on_sent=None):
+        """Заводит поток доставки для каждого получателя из sinks."""
+        self.outbox = outbox
+        self.sinks = sinks
+        self.workers = [
+            DeliveryWorker(
+                outbox, sink.send, fence=fence, sink=sink.name,
+                workers=sink.workers, max_attempts=sink.max_attempts,
+                observe=self._observer(sink.name),
+                on_sent=on_sent if sink.name == DEFAULT_SINK else None
+            )
+            for sink in sinks
+        ]
+
+    @staticmethod
+    def _observer(name):
+        def observe(latency):
+            metrics.incr('notify_latency_seconds_sum', latency, sink=name)
+            metrics.incr('notify_latency_seconds_count', sink=name)
+        return observe
+
+    def start(self):
+        """Запускает потоки доставки всех получателей."""
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def put(self, key, chat_id, text, resource=None, fence=None,
+            priority=PRIORITY_STATUS):
+        """Ставит сообщение в очередь каждого получателя и будит потоки.
+
+        Ключ строки Telegram совпадает с ключом события, у остальных
+        получателей к нему добавляется имя получателя.
+        """
+        for sink, worker in zip(self.sinks, self.workers):
+            self.outbox.put(
+                key if sink.name == DEFAULT_SINK else make_key(key, sink.name),
+                chat_id, text, resource, fence, sink.name, priority
+            )
+            worker.notify()
+
+    def notify(self):
+        """Будит потоки доставки всех получателей."""
+        for worker in self.workers:
+            worker.notify()
+
+    def flush(self):
+        """Синхронно отправляет всё, что уже можно отправить.
+
+        Получатели разбираются параллельно, так что вызов длится
+        столько, сколько самый медленный из них, а не их сумму.
+        """
+        if len(self.workers) == 1:
+            return self.workers[0].flush()
+        with ThreadPoolExecutor(len(self.workers)) as executor:
+            return sum(executor.map(DeliveryWorker.flush, self.workers))
+
+    def flush_telegram(self, limit=50):
+        """Синхронно отправляет в Telegram до limit готовых сообщений.
+
+        Остальных получателей разбирают их потоки доставки: медленный
+        вебхук не должен задерживать того, кто вызвал разбор.
+        """
+        for sink, worker in zip(self.sinks, self.workers):
+            if sink.name == DEFAULT_SINK:
+                return worker.flush(limit)
+        return 0
+
+    def stop(self):
+        """Останавливает потоки доставки."""
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from concurrency import RateLimiter
+from subscriptions import load_subscriptions
+
+TOKEN_REJECTED = 'токен отклонён API Практикума (код {})'
+CHAT_UNAVAILABLE = 'чат недоступен боту: {}'
+PROBE_FAILED = 'не удалось проверить {}: {}'
+
+# Коды ответов, которые однозначно означают неверные данные подписки.
+REJECTED_TOKEN_CODES = (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN)
+REJECTED_CHAT_CODES = (HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN)
+
+# token_valid и chat_valid: True, False или None, если проверить не удалось.
+Check = namedtuple(
+    'Check', ('subscription', 'token_valid', 'chat_valid', 'errors')
+)
+OnboardingReport = namedtuple(
+    'OnboardingReport', ('checks', 'known', 'added', 'elapsed')
+)
+
+
+class InvalidCredentials(Exception):
+    """API однозначно отверг токен или чат подписки."""
+
+    pass
+
+
+def practicum_probe(endpoint, timeout=10):
+    """Проверка токена: запрос статусов с from_date, равным текущему моменту.
+
+    Такой ответ почти всегда пуст и обходится API дешевле обычного опроса.
+    """
+    def probe(token):
+        import requests
+        response = requests.get(
+            endpoint, headers={'Authorization': f'OAuth {token}'},
+            params={'from_date': int(time.time())}, timeout=timeout
+        )
+        if response.status_code in REJECTED_TOKEN_CODES:
+            raise InvalidCredentials(
+                TOKEN_REJECTED.format(response.status_code)
+            )
+        response.raise_for_status()
+    return probe
+
+
+def telegram_probe(bot):
+    """Проверка чата через getChat: сообщение в чат не отправляется."""
+    def probe(chat_id):
+        try:
+            bot.get_chat(chat_id)
+        except Exception as error:
+            if getattr(error, 'error_code', None) in REJECTED_CHAT_CODES:
+                raise InvalidCredentials(CHAT_UNAVAILABLE.format(error))
+            raise
+    return probe
+
+
+def run_probe(probe, value, limiter, name, errors):
+    """Вызывает проверку под ограничением частоты; True, False или None."""
+    limiter.acquire()
+    try:
+        probe(value)
+    except InvalidCredentials as error:
+        errors.append(str(error))
+        return False
+    except Exception as error:
+        errors.append(PROBE_FAILED.format(name, error))
+        return None
+    return True
+
+
+def validate(candidates, check_token, check_chat, workers=8,
+             token_limiter=None, chat_limiter=None):
+    """Параллельно проверяет токены и чаты подписок.
+
+    Чат проверяется, только если токен не отвергнут, поэтому заведомо
+    неверные подписки не расходуют лимит Telegram.
+    """
+    token_limiter = token_limiter or RateLimiter()
+    chat_limiter = chat_limiter or RateLimiter()
+
+    def check(subscription):
+        errors = []
+        token_valid = run_probe(
+            check_token, subscription.token, token_limiter, 'токен', errors
+        )
+        chat_valid = None
+        if token_valid is not False:
+            chat_valid = run_probe(
+                check_chat, subscription.chat_id, chat_limiter, 'чат',
+                errors
+            )
+        return Check(subscription, token_valid, chat_valid, errors)
+
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(check, candidates))
+
+
+def write_registry(path, subscriptions):
+    """Записывает реестр подписок атомарно: через файл и переименование."""
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as registry_file:
+        json.dump([
+            {'chat_id': subscription.chat_id, 'token': subscription.token}
+            for subscription in subscriptions
+        ], registry_file, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
+
+
+def write_report(path, checks):
+    """Сохраняет результаты проверки в JSON без токенов в открытом виде."""
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump([
+            {
+                'chat_id': check.subscription.chat_id,
+                'subscription': check.subscription.id,
+                'token_valid': check.token_valid,
+                'chat_valid': check.chat_valid,
+                'errors': check.errors,
+            }
+            for check in checks
+        ], report_file, ensure_ascii=False, indent=2)
+
+
+def onboard(candidates_path, registry_path, check_token, check_chat,
+            workers=8, token_limiter=None, chat_limiter=None):
+    """Проверяет подписки из файла и дописывает в реестр только верные.
+
+    Подписки, уже записанные в реестр, повторно не проверяются.
+    Реестр заменяется атомарно, поэтому работающий бот подхватывает
+    его целиком (см. App.reload_registry).
+    """
+    started = time.monotonic()
+    registry = []
+    if os.path.exists(registry_path):
+        registry = load_subscriptions(registry_path, None)
+    known = set(registry)
+    candidates = list(dict.fromkeys(
+        load_subscriptions(candidates_path, None)
+    ))
+    registered = sum(subscription in known for subscription in candidates)
+    candidates = [
+        subscription for subscription in candidates
+        if subscription not in known
+    ]
+    checks = validate(
+        candidates, check_token, check_chat, workers, token_limiter,
+        chat_limiter
+    )
+    added = [
+        check.subscription for check in checks
+        if check.token_valid and check.chat_valid
+    ]
+    if added:
+        write_registry(registry_path, registry + added)
+    return OnboardingReport(
+        checks, registered, len(added), time.monotonic() - started
+    )
@@ -0,0 +1,474 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    sent REAL,
+    dead REAL,
+    last_error TEXT,
+    resource TEXT,
+    fence INTEGER,
+    sink TEXT NOT NULL DEFAULT 'telegram',
+    priority INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent, dead, id);
+CREATE INDEX IF NOT EXISTS outbox_sink_pending
+    ON outbox (sink, sent, dead, id);
+CREATE INDEX IF NOT EXISTS outbox_priority_pending
+    ON outbox (sink, sent, dead, priority, id);
+CREATE INDEX IF NOT EXISTS outbox_lane_pending
+    ON outbox (sink, chat_id, priority, sent, dead, next_attempt, id);
+"""
+MIGRATIONS = {
+    'resource': 'ALTER TABLE outbox ADD COLUMN resource TEXT',
+    'fence': 'ALTER TABLE outbox ADD COLUMN fence INTEGER',
+    'sink': (
+        "ALTER TABLE outbox ADD COLUMN sink TEXT NOT NULL DEFAULT 'telegram'"
+    ),
+    'priority': (
+        'ALTER TABLE outbox ADD COLUMN priority INTEGER NOT NULL DEFAULT 0'
+    ),
+    'claimed_by': 'ALTER TABLE outbox ADD COLUMN claimed_by TEXT',
+    'claimed_until': 'ALTER TABLE outbox ADD COLUMN claimed_until REAL',
+}
+DEFAULT_SINK = 'telegram'
+# Классы сообщений: меньшее значение доставляется раньше.
+PRIORITY_STATUS = 0
+PRIORITY_ALERT = 1
+
+DELIVERY_FAILED = 'Не удалось доставить сообщение {} (попытка {}): {}'
+DELIVERY_GAVE_UP = 'Сообщение {} не доставлено после {} попыток: {}'
+SEND_RETURNED_FALSE = 'отправка не подтверждена'
+FENCED = 'устаревший токен аренды {}'
+BACKLOG_SHED = 'Очередь переполнена, сообщение ({}) в чат {} для {}'
+REPORT_FAILED = 'Не удалось отметить доставку сообщения {}: {}'
+PURGED = 'Из журнала уведомлений удалено старых сообщений: {}'
+
+
+def make_key(*parts):
+    """Строит ключ идемпотентности из частей события."""
+    return hashlib.sha1(
+        '\x1f'.join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+class Outbox:
+    """Журнал исходящих уведомлений в SQLite.
+
+    Событие записывается до попытки отправки, поэтому перезапуск его
+    не теряет. Ключ идемпотентности не даёт повторно поставить в очередь
+    уже известное событие, даже если после перезапуска оно будет
+    обнаружено заново. Перед отправкой сообщение захватывается одним
+    условным UPDATE на claim_ttl секунд, поэтому процессы, работающие
+    с одним файлом, не отправляют его дважды. Дубль возможен, только
+    если процесс упадёт между успешной отправкой и отметкой о ней.
+    Доставленные и снятые с доставки сообщения хранятся retention
+    секунд, затем purge() их удаляет.
+    """
+
+    def __init__(
+        self, path, retry_delay=30, max_retry_delay=3600, max_attempts=20,
+        backlog_limit=None, claim_ttl=60, retention=None
+    ):
+        """Открывает журнал path в режиме WAL и обновляет схему.
+
+        retry_delay и max_retry_delay - первая и наибольшая пауза перед
+        повтором, claim_ttl - срок захвата сообщения в секундах.
+        """
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.backlog_limit = backlog_limit
+        self.claim_ttl = claim_ttl
+        self.retention = retention
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._drain_locks = {}
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._migrate()
+        self._connection.executescript(SCHEMA)
+
+    def _migrate(self):
+        columns = {
+            row[1] for row in self._connection.execute(
+                'PRAGMA table_info(outbox)'
+            )
+        }
+        if not columns:
+            return
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self._connection.execute(statement)
+
+    def put(
+        self, key, chat_id, text, resource=None, fence=None,
+        sink=DEFAULT_SINK, priority=PRIORITY_STATUS
+    ):
+        """Ставит сообщение в очередь; False, если ключ уже встречался.
+
+        resource и fence - подписка и токен аренды, под которым событие
+        обнаружено; перед отправкой токен проверяется повторно. sink -
+        получатель, у каждого своя очередь доставки. priority - класс
+        сообщения (PRIORITY_STATUS, PRIORITY_ALERT).
+
+        Если в очереди получателя уже backlog_limit сообщений, сообщение
+        ниже PRIORITY_STATUS не добавляется: оно заменяет текст ещё не
+        доставленного сообщения того же класса в этот чат, а если такого
+        нет - отбрасывается. Уведомления о статусах принимаются всегда.
+        """
+        chat_id = str(chat_id)
+        if (
+            priority > PRIORITY_STATUS and self.backlog_limit is not None
+            and self.pending_count(sink) >= self.backlog_limit
+        ):
+            return self._collapse(chat_id, text, sink, priority)
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT OR IGNORE INTO outbox '
+                '(key, chat_id, text, created, resource, fence, sink, '
+                'priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    key, chat_id, text, time.time(), resource, fence, sink,
+                    priority
+                )
+            )
+        return cursor.rowcount == 1
+
+    def _collapse(self, chat_id, text, sink, priority):
+        with self._lock:
+            cursor = self._connection.execute(
+                'UPDATE outbox SET text = ? WHERE id = ('
+                'SELECT MAX(id) FROM outbox WHERE sent IS NULL '
+                'AND dead IS NULL AND sink = ? AND chat_id = ? '
+                'AND priority = ?)',
+                (text, sink, chat_id, priority)
+            )
+        outcome = 'collapsed' if cursor.rowcount else 'dropped'
+        metrics.incr(f'outbox_{outcome}', sink=sink, priority=priority)
+        logger.warning(BACKLOG_SHED.format(outcome, chat_id, sink))
+        return False
+
+    def pending(self, limit=100, sink=None):
+        """Возвращает недоставленные сообщения по классам и по порядку."""
+        query = (
+            'SELECT id, chat_id, text, attempts, next_attempt, '
+            'resource, fence, created, priority FROM outbox '
+            'WHERE sent IS NULL AND dead IS NULL'
+        )
+        if sink is None:
+            values = (limit,)
+        else:
+            query += ' AND sink = ?'
+            values = (sink, limit)
+        with self._lock:
+            return self._connection.execute(
+                query + ' ORDER BY priority, id LIMIT ?', values
+            ).fetchall()
+
+    def ready(self, now, limit=100, sink=None):
+        """Возвращает сообщения, которые можно отправить в момент now.
+
+        Очередь чата в классе сообщений (полоса) стоит за первым
+        сообщением, попытка которого ещё не наступила или которое
+        отправляет другой процесс. Такие сообщения и всё, что за ними
+        в той же полосе, отсеиваются запросом до LIMIT. Поэтому ждущие
+        повтора чаты не занимают место остальных.
+        """
+        query = (
+            'SELECT id, chat_id, text, attempts, next_attempt, '
+            'resource, fence, created, priority, key FROM outbox AS message '
+            'WHERE sent IS NULL AND dead IS NULL AND next_attempt <= ? '
+            'AND (claimed_until IS NULL OR claimed_until <= ? '
+            'OR claimed_by = ?)'
+        )
+        values = [now, now, self.owner]
+        if sink is not None:
+            query += ' AND sink = ?'
+            values.append(sink)
+        query += (
+            ' AND NOT EXISTS (SELECT 1 FROM outbox AS waiting '
+            'WHERE waiting.sink = message.sink '
+            'AND waiting.chat_id = message.chat_id '
+            'AND waiting.priority = message.priority '
+            'AND waiting.sent IS NULL AND waiting.dead IS NULL '
+            'AND waiting.id < message.id AND (waiting.next_attempt > ? '
+            'OR (waiting.claimed_until > ? AND waiting.claimed_by != ?)))'
+            ' ORDER BY priority, id LIMIT ?'
+        )
+        values += [now, now, self.owner, limit]
+        with self._lock:
+            return self._connection.execute(query, values).fetchall()
+
+    def pending_count(self, sink=None):
+        """Возвращает число недоставленных сообщений."""
+        query = (
+            'SELECT COUNT(*) FROM outbox WHERE sent IS NULL AND dead IS NULL'
+        )
+        values = ()
+        if sink is not None:
+            query += ' AND sink = ?'
+            values = (sink,)
+        with self._lock:
+            return self._connection.execute(query, values).fetchone()[0]
+
+    def claim(self, message_id):
+        """Захватывает сообщение для отправки; False, если оно уже занято.
+
+        Захват - один UPDATE с условием, поэтому из нескольких процессов
+        с общим файлом сообщение получает ровно один.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                'UPDATE outbox SET claimed_by = ?, claimed_until = ? '
+                'WHERE id = ? AND sent IS NULL AND dead IS NULL '
+                'AND (claimed_until IS NULL OR claimed_until <= ? '
+                'OR claimed_by = ?)',
+                (self.owner, now + self.claim_ttl, message_id, now,
+                 self.owner)
+            )
+        return cursor.rowcount == 1
+
+    def mark_sent(self, message_id):
+        """Отмечает сообщение доставленным."""
+        with self._lock:
+            self._connection.execute(
+                'UPDATE outbox SET sent = ? WHERE id = ?',
+                (time.time(), message_id)
+            )
+
+    def mark_dead(self, message_id, error):
+        """Снимает сообщение с доставки без повторных попыток."""
+        with self._lock:
+            self._connection.execute(
+                'UPDATE outbox SET dead = ?, last_error = ? WHERE id = ?',
+                (time.time(), str(error), message_id)
+            )
+
+    def mark_failed(self, message_id, attempts, error, max_attempts=None):
+        """Откладывает следующую попытку с экспоненциальной паузой."""
+        now = time.time()
+        if attempts >= (max_attempts or self.max_attempts):
+            logger.error(DELIVERY_GAVE_UP.format(message_id, attempts, error))
+            query = (
+                'UPDATE outbox SET attempts = ?, dead = ?, last_error = ? '
+                'WHERE id = ?'
+            )
+            values = (attempts, now, str(error), message_id)
+        else:
+            delay = min(
+                self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay
+            )
+            query = (
+                'UPDATE outbox SET attempts = ?, next_attempt = ?, '
+                'last_error = ?, claimed_until = NULL WHERE id = ?'
+            )
+            values = (attempts, now + delay, str(error), message_id)
+        with self._lock:
+            self._connection.execute(query, values)
+
+    def purge(self, sink=None):
+        """Удаляет сообщения, доставленные или снятые раньше retention.
+
+        Недоставленные сообщения не трогаются. Возвращает число
+        удалённых строк.
+        """
+        if self.retention is None:
+            return 0
+        cutoff = time.time() - self.retention
+        query = 'DELETE FROM outbox WHERE (sent < ? OR dead < ?)'
+        values = [cutoff, cutoff]
+        if sink is not None:
+            query += ' AND sink = ?'
+            values.append(sink)
+        with self._lock:
+            removed = self._connection.execute(query, values).rowcount
+        if removed:
+            metrics.incr('outbox_purged', removed, sink=sink or 'all')
+            logger.info(PURGED.format(removed))
+        return removed
+
+    def drain(
+        self, send, limit=100, fence=None, sink=None, executor=None,
+        max_attempts=None, observe=None, on_sent=None
+    ):
+        """Отправляет все сообщения, срок попытки которых наступил.
+
+        Сначала отправляются сообщения более важного класса. Внутри
+        класса сообщения одного чата уходят строго по порядку: если
+        очередное не доставлено или его попытка ещё не наступила,
+        следующие сообщения этого класса в этот чат ждут. Очереди
+        разных получателей sink разбираются независимо. Если задана
+        функция fence, сообщения с устаревшим токеном аренды
+        не отправляются: подписку уже обслуживает другая реплика.
+        С executor чаты обслуживаются параллельно его потоками. observe
+        получает задержку доставки каждого сообщения в секундах,
+        on_sent(resource, key) вызывается после доставки сообщения,
+        записанного с арендой. Возвращает число доставленных.
+        """
+        with self._lock:
+            lock = self._drain_locks.setdefault(sink, threading.Lock())
+        with lock:
+            chats = {}
+            for message in self.ready(time.time(), limit, sink):
+                chats.setdefault(message[1], []).append(message)
+
+            def deliver(messages):
+                return self._deliver_chat(
+                    messages, send, fence, max_attempts, observe, on_sent
+                )
+
+            if executor is None:
+                return sum(map(deliver, chats.values()))
+            return sum(executor.map(deliver, chats.values()))
+
+    def _deliver_chat(
+        self, messages, send, fence, max_attempts, observe, on_sent
+    ):
+        delivered = 0
+        for (
+            message_id, chat_id, text, attempts, _, resource, token, created,
+            _, key
+        ) in messages:
+            if not self.claim(message_id):
+                break
+            if (
+                fence is not None and token is not None
+                and not fence(resource, token)
+            ):
+                self.mark_dead(message_id, FENCED.format(token))
+                continue
+            try:
+                if not send(chat_id, text):
+                    raise RuntimeError(SEND_RETURNED_FALSE)
+            except Exception as error:
+                logger.warning(DELIVERY_FAILED.format(
+                    message_id, attempts + 1, error
+                ))
+                self.mark_failed(
+                    message_id, attempts + 1, error, max_attempts
+                )
+                break
+            self.mark_sent(message_id)
+            delivered += 1
+            if observe is not None:
+                observe(time.time() - created)
+            if on_sent is not None and resource is not None:
+                self._report_sent(on_sent, resource, key)
+        return delivered
+
+    @staticmethod
+    def _report_sent(on_sent, resource, key):
+        try:
+            on_sent(resource, key)
+        except Exception as error:
+            logger.warning(REPORT_FAILED.format(key, error))
+
+    def close(self):
+        """Закрывает базу."""
+        with self._lock:
+            self._connection.close()
+
+
+class DeliveryWorker:
+    """Фоновый поток, который разбирает журнал уведомлений.
+
+    Просыпается по notify() после постановки нового сообщения и раз
+    в interval секунд - для повторных попыток, не дожидаясь опроса API.
+    Если задан sink, разбирает только очередь этого получателя; при
+    workers > 1 чаты обслуживаются параллельно собственным пулом. Раз
+    в purge_interval секунд удаляет из журнала старые доставленные
+    и снятые сообщения своей очереди.
+    """
+
+    def __init__(
+        self, outbox, send, interval=5, fence=None, sink=None, workers=1,
+        max_attempts=None, observe=None, on_sent=None, purge_interval=3600
+    ):
+        """Без notify() журнал разбирается раз в interval секунд."""
+        self.outbox = outbox
+        self.send = send
+        self.interval = interval
+        self.purge_interval = purge_interval
+        self._purged = None
+        self.fence = fence
+        self.sink = sink
+        self.max_attempts = max_attempts
+        self.observe = observe
+        self.on_sent = on_sent
+        name = 'delivery' if sink is None else f'delivery-{sink}'
+        self._executor = None
+        if workers > 1:
+            self._executor = ThreadPoolExecutor(workers, name)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=name, daemon=True
+        )
+
+    def start(self):
+        """Запускает поток доставки."""
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Сообщает потоку, что в журнале появились сообщения."""
+        self._wakeup.set()
+
+    def flush(self, limit=100):
+        """Синхронно отправляет до limit сообщений, которые уже пора."""
+        return self.outbox.drain(
+            self.send, limit, fence=self.fence, sink=self.sink,
+            executor=self._executor, max_attempts=self.max_attempts,
+            observe=self.observe, on_sent=self.on_sent
+        )
+
+    def stop(self, timeout=5):
+        """Останавливает поток после последнего разбора журнала."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.purge()
+            except Exception as error:
+                logger.error(error, exc_info=True)
+
+    def purge(self):
+        """Чистит журнал, если с прошлой чистки прошло purge_interval."""
+        now = time.monotonic()
+        if self._purged is not None and now - self._purged < (
+            self.purge_interval
+        ):
+            return 0
+        self._purged = now
+        return self.outbox.purge(self.sink)
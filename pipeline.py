@@ -0,0 +1,259 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import ContextVar
+
+StageStats = namedtuple(
+    'StageStats', ('name', 'workers', 'depth', 'peak', 'processed', 'busy')
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+DEADLINE_EXCEEDED = 'Срок задачи истёк перед стадией {}'
+ON_ERROR_FAILED = 'Не удалось обработать ошибку стадии {}: {}'
+
+# Момент time.monotonic(), к которому должна завершиться текущая задача
+# ThreadPoolEngine, или None. Обработчики по нему ограничивают таймауты.
+current_deadline = ContextVar('current_deadline', default=None)
+
+
+def report_error(on_error, stage_name, item, error):
+    """Передаёт ошибку стадии в on_error; его собственная ошибка логируется.
+
+    Иначе поток стадии погиб бы, не отметив элемент обработанным,
+    и join ждал бы его вечно.
+    """
+    try:
+        on_error(stage_name, item, error)
+    except Exception as failure:
+        logger.error(ON_ERROR_FAILED.format(stage_name, failure),
+                     exc_info=True)
+
+
+class Stage:
+    """Стадия конвейера: обработчик и число потоков, которые его выполняют.
+
+    Обработчик получает элемент и возвращает элемент для следующей
+    стадии или None, если дальше передавать нечего.
+    """
+
+    def __init__(self, name, handler, workers=1):
+        """Счётчики загрузки стадии начинаются с нуля."""
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.processed = 0
+        self.busy = 0.0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+
+class Pipeline:
+    """Цепочка стадий, связанных ограниченными очередями.
+
+    Если очередь следующей стадии заполнена, поток предыдущей стадии
+    ждёт - так медленная стадия притормаживает поставщиков, а не копит
+    бесконечный буфер. Исключения обработчиков передаются в on_error.
+    """
+
+    def __init__(self, stages, on_error, maxsize=100):
+        """Очередь перед каждой стадией вмещает maxsize элементов."""
+        self.stages = stages
+        self.on_error = on_error
+        self.queues = [queue.Queue(maxsize) for _ in stages]
+        self.threads = []
+
+    def start(self):
+        """Запускает потоки всех стадий."""
+        for index, stage in enumerate(self.stages):
+            threads = [
+                threading.Thread(
+                    target=self._work, args=(index,),
+                    name=f'{stage.name}-{number}', daemon=True
+                )
+                for number in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            self.threads.append(threads)
+        return self
+
+    def submit(self, item):
+        """Передаёт элемент первой стадии; ждёт, если её очередь полна."""
+        self._put(0, item)
+
+    def join(self):
+        """Ждёт, пока все переданные элементы пройдут конвейер."""
+        for stage_queue in self.queues:
+            stage_queue.join()
+
+    def close(self, timeout=5):
+        """Останавливает потоки после обработки уже принятых элементов.
+
+        Стадии останавливаются по порядку, чтобы каждая успела принять
+        всё, что ей передала предыдущая.
+        """
+        deadline = time.monotonic() + timeout
+        for stage_queue, threads in zip(self.queues, self.threads):
+            for _ in threads:
+                stage_queue.put(_STOP)
+            for thread in threads:
+                thread.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        """Возвращает глубину очередей и загрузку каждой стадии."""
+        return [
+            StageStats(
+                stage.name, stage.workers, stage_queue.qsize(), stage.peak,
+                stage.processed, stage.busy
+            )
+            for stage, stage_queue in zip(self.stages, self.queues)
+        ]
+
+    def _put(self, index, item):
+        stage_queue = self.queues[index]
+        stage_queue.put(item)
+        stage = self.stages[index]
+        with stage.lock:
+            stage.peak = max(stage.peak, stage_queue.qsize())
+
+    def _work(self, index):
+        stage = self.stages[index]
+        stage_queue = self.queues[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            item = stage_queue.get()
+            if item is _STOP:
+                stage_queue.task_done()
+                return
+            started = time.monotonic()
+            try:
+                try:
+                    result = stage.handler(item)
+                except Exception as error:
+                    result = None
+                    report_error(self.on_error, stage.name, item, error)
+                # Время ожидания места в следующей очереди не считается
+                # занятостью стадии, иначе узким местом выглядели бы
+                # поставщики.
+                with stage.lock:
+                    stage.processed += 1
+                    stage.busy += time.monotonic() - started
+                if result is not None and not is_last:
+                    self._put(index + 1, result)
+            finally:
+                stage_queue.task_done()
+
+
+class ThreadPoolEngine:
+    """Выполняет все стадии одного элемента подряд в потоке пула.
+
+    Та же цепочка обработчиков, что и у Pipeline, но без очередей между
+    стадиями: каждый элемент занимает один поток от первой стадии до
+    последней. Подходит для синхронного стека, где почти всё время
+    уходит на ожидание сети. У каждой задачи есть срок deadline секунд:
+    стадия, до которой дошли позже срока, не запускается, а join
+    не ждёт задачи дольше их срока. Элемент, задача которого ещё
+    выполняется, повторно не принимается. initializer вызывается
+    в каждом потоке пула при его запуске.
+    """
+
+    def __init__(self, stages, on_error, workers=8, deadline=None,
+                 initializer=None):
+        """Пул из workers потоков; без deadline у задач нет срока."""
+        self.stages = stages
+        self.on_error = on_error
+        self.workers = workers
+        self.deadline = deadline
+        self.initializer = initializer
+        self.executor = None
+        self.timed_out = 0
+        self._lock = threading.Lock()
+        self._running = {}
+
+    def start(self):
+        """Запускает пул потоков."""
+        self.executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix='engine',
+            initializer=self.initializer
+        )
+        return self
+
+    def submit(self, item):
+        """Ставит элемент в пул; False, если он ещё обрабатывается."""
+        deadline = None
+        if self.deadline is not None:
+            deadline = time.monotonic() + self.deadline
+        with self._lock:
+            if item in self._running:
+                return False
+            future = self._running[item] = self.executor.submit(
+                self._run, item, deadline
+            )
+            stage = self.stages[0]
+            stage.peak = max(stage.peak, len(self._running))
+        future.add_done_callback(lambda _: self._finish(item))
+        return True
+
+    def _finish(self, item):
+        with self._lock:
+            self._running.pop(item, None)
+
+    def _run(self, item, deadline):
+        token = current_deadline.set(deadline)
+        try:
+            for stage in self.stages:
+                if deadline is not None and time.monotonic() > deadline:
+                    report_error(self.on_error, stage.name, item, TimeoutError(
+                        DEADLINE_EXCEEDED.format(stage.name)
+                    ))
+                    return
+                started = time.monotonic()
+                try:
+                    result = stage.handler(item)
+                except Exception as error:
+                    report_error(self.on_error, stage.name, item, error)
+                    return
+                finally:
+                    with stage.lock:
+                        stage.processed += 1
+                        stage.busy += time.monotonic() - started
+                if result is None:
+                    return
+                item = result
+        finally:
+            current_deadline.reset(token)
+
+    def join(self):
+        """Ждёт принятые задачи, но не дольше их срока."""
+        with self._lock:
+            futures = list(self._running.values())
+        not_done = wait(futures, self.deadline).not_done
+        self.timed_out += len(not_done)
+        return not not_done
+
+    def close(self, timeout=5):
+        """Дожидается начатых задач и останавливает пул."""
+        if self.executor is None:
+            return
+        with self._lock:
+            futures = list(self._running.values())
+        wait(futures, timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Возвращает загрузку стадий; глубина - число задач в работе."""
+        with self._lock:
+            running = len(self._running)
+        return [
+            StageStats(
+                stage.name, self.workers, running if index == 0 else 0,
+                stage.peak, stage.processed, stage.busy
+            )
+            for index, stage in enumerate(self.stages)
+        ]
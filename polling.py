@@ -0,0 +1,118 @@
+import heapq
+import itertools
+
+
+class PollingPolicy:
+    """Определяет паузу до следующего опроса API.
+
+    interval - обычный период опроса, idle_interval - период, когда
+    у студента нет работ на проверке. После ошибок пауза растёт
+    в error_backoff раз за каждую ошибку подряд, но не выше max_interval.
+    """
+
+    def __init__(
+        self, interval, idle_interval=None, error_backoff=1.0,
+        max_interval=None
+    ):
+        """Без idle_interval период опроса всегда равен interval."""
+        self.interval = interval
+        self.idle_interval = (
+            interval if idle_interval is None else idle_interval
+        )
+        self.error_backoff = error_backoff
+        self.max_interval = max_interval
+
+    def next_delay(self, consecutive_errors=0, active=True):
+        """Возвращает паузу в секундах до следующего опроса."""
+        delay = self.interval if active else self.idle_interval
+        if consecutive_errors:
+            delay *= self.error_backoff ** consecutive_errors
+            if self.max_interval is not None:
+                delay = min(delay, max(self.max_interval, self.interval))
+        return delay
+
+
+class Scheduler:
+    """Очередь опросов, упорядоченная по времени следующего запуска.
+
+    Время передаётся снаружи, поэтому одна и та же очередь работает
+    и с реальными часами, и в виртуальном времени симулятора.
+    """
+
+    def __init__(self):
+        """Создаёт пустую очередь."""
+        self._heap = []
+        self._due = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        """Число подписок в очереди."""
+        return len(self._due)
+
+    def __contains__(self, key):
+        """Стоит ли опрос key в очереди."""
+        return key in self._due
+
+    def schedule(self, key, due):
+        """Назначает (или переносит) опрос key на момент due."""
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._counter), key))
+
+    def remove(self, key):
+        """Снимает key с расписания."""
+        self._due.pop(key, None)
+
+    def next_due(self):
+        """Возвращает время ближайшего опроса или None."""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Извлекает все ключи, время опроса которых уже наступило."""
+        due_keys = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due_keys
+            due, _, key = heapq.heappop(self._heap)
+            del self._due[key]
+            due_keys.append((key, due))
+
+    def _discard_stale(self):
+        while self._heap:
+            due, _, key = self._heap[0]
+            if self._due.get(key) == due:
+                return
+            heapq.heappop(self._heap)
+
+
+class LoadShedder:
+    """Обнаруживает перегрузку по отставанию опроса от расписания.
+
+    Отставание цикла - насколько позже назначенного начался опрос самой
+    просроченной подписки. Пока оно больше threshold, множитель пауз
+    второстепенных подписок stretch удваивается (не выше max_stretch),
+    а когда отставание падает ниже половины threshold - уменьшается
+    вдвое до 1. Разные пороги не дают множителю скакать каждый цикл.
+    """
+
+    def __init__(self, threshold=30, max_stretch=8):
+        """Порог отставания threshold задаётся в секундах."""
+        self.threshold = threshold
+        self.max_stretch = max_stretch
+        self.stretch = 1
+        self.lag = 0
+
+    @property
+    def shedding(self):
+        """Сбрасывается ли сейчас второстепенная работа."""
+        return self.stretch > 1
+
+    def observe(self, lag):
+        """Учитывает отставание цикла и возвращает новый множитель."""
+        self.lag = lag
+        if lag > self.threshold:
+            self.stretch = min(self.stretch * 2, self.max_stretch)
+        elif lag < self.threshold / 2:
+            self.stretch = max(self.stretch // 2, 1)
+        return self.stretch
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# Что учитывается по каждому арендатору (подписке).
+USAGE_FIELDS = ('requests', 'bytes', 'errors', 'messages')
+
+QUOTA_EXCEEDED = (
+    'Подписка {} превысила квоту {} ({} за окно {} с), '
+    'опрос приостановлен на {:.0f} с'
+)
+
+
+class Quota(namedtuple(
+    'Quota', USAGE_FIELDS + ('window', 'suspend'),
+    defaults=(None, None, None, None, 3600, 86400)
+)):
+    """Квоты арендатора на окно window секунд; None - без ограничения.
+
+    Превысивший квоту запросов, байтов или сообщений ждёт конца окна,
+    превысивший квоту ошибок приостанавливается на suspend секунд.
+    """
+
+    __slots__ = ()
+
+
+class TenantUsage:
+    """Счётчики одного арендатора: за всё время и за текущее окно.
+
+    totals и current - списки в порядке USAGE_FIELDS.
+    """
+
+    __slots__ = ('totals', 'current', 'window_start', 'blocked_until',
+                 'reason')
+
+    def __init__(self, now):
+        """Первое окно начинается в момент now."""
+        self.totals = [0] * len(USAGE_FIELDS)
+        self.current = [0] * len(USAGE_FIELDS)
+        self.window_start = now
+        self.blocked_until = None
+        self.reason = None
+
+    def as_dict(self):
+        """Возвращает счётчики в виде словаря для отчёта."""
+        usage = dict(zip(USAGE_FIELDS, self.totals))
+        usage['blocked_until'] = self.blocked_until
+        usage['reason'] = self.reason
+        return usage
+
+
+class UsageLedger:
+    """Потокобезопасный учёт запросов, трафика, ошибок и сообщений.
+
+    Арендатор - идентификатор подписки. Квоты проверяются при каждой
+    записи: превысивший квоту арендатор блокируется до времени
+    blocked_until, а опрос его подписки откладывается.
+    """
+
+    def __init__(self, quota=None, clock=time.time):
+        """Без quota учёт ведётся без ограничений."""
+        self.quota = quota or Quota()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._tenants = {}
+
+    def configure(self, quota):
+        """Задаёт квоты для последующих записей."""
+        self.quota = quota
+
+    def clear(self):
+        """Забывает всех арендаторов."""
+        with self._lock:
+            self._tenants.clear()
+
+    def record(self, tenant, **amounts):
+        """Учитывает расход арендатора; возвращает превышенную квоту."""
+        now = self.clock()
+        quota = self.quota
+        with self._lock:
+            usage = self._tenants.get(tenant)
+            if usage is None:
+                usage = self._tenants[tenant] = TenantUsage(now)
+            elif now - usage.window_start >= quota.window:
+                usage.current = [0] * len(USAGE_FIELDS)
+                usage.window_start = now
+            for field, amount in amounts.items():
+                index = USAGE_FIELDS.index(field)
+                usage.totals[index] += amount
+                usage.current[index] += amount
+            if usage.blocked_until is not None and usage.blocked_until > now:
+                return None
+            exceeded = next(
+                (
+                    field for field, used, limit in zip(
+                        USAGE_FIELDS, usage.current, quota[:4]
+                    )
+                    if limit is not None and used >= limit
+                ),
+                None
+            )
+            if exceeded is None:
+                return None
+            usage.blocked_until = (
+                now + quota.suspend if exceeded == 'errors'
+                else usage.window_start + quota.window
+            )
+            usage.reason = exceeded
+            delay = usage.blocked_until - now
+        metrics.incr('tenant_quota_exceeded', quota=exceeded)
+        logger.warning(QUOTA_EXCEEDED.format(
+            tenant, exceeded, getattr(quota, exceeded), quota.window, delay
+        ))
+        return exceeded
+
+    def blocked_until(self, tenant):
+        """Возвращает время конца блокировки арендатора или None."""
+        with self._lock:
+            usage = self._tenants.get(tenant)
+            if usage is None or usage.blocked_until is None:
+                return None
+            if usage.blocked_until <= self.clock():
+                return None
+            return usage.blocked_until
+
+    def get(self, tenant):
+        """Возвращает счётчики арендатора за всё время."""
+        with self._lock:
+            usage = self._tenants.get(tenant)
+            return None if usage is None else usage.as_dict()
+
+    def snapshot(self):
+        """Возвращает счётчики всех арендаторов: tenant -> словарь."""
+        with self._lock:
+            return {
+                tenant: usage.as_dict()
+                for tenant, usage in self._tenants.items()
+            }
+
+    def write(self, path):
+        """Сохраняет снимок счётчиков в JSON атомарно."""
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as usage_file:
+            json.dump(self.snapshot(), usage_file)
+        os.replace(temporary, path)
+
+
+def read_usage(path):
+    """Читает снимок счётчиков, сохранённый UsageLedger.write."""
+    with open(path, encoding='utf-8') as usage_file:
+        return json.load(usage_file)
+
+
+def top_consumers(snapshot, by='requests', count=10):
+    """Возвращает count арендаторов с наибольшим расходом by."""
+    return sorted(
+        snapshot.items(), key=lambda item: item[1][by], reverse=True
+    )[:count]
+
+
+ledger = UsageLedger()
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from http import HTTPStatus
+
+RECORD_SEPARATORS = (',', ':')
+
+ReplayStats = namedtuple(
+    'ReplayStats', ('records', 'messages', 'errors', 'elapsed')
+)
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+class TrafficRecorder:
+    """Дописывает сырые ответы API в файл по одному JSON на строку."""
+
+    def __init__(self, path):
+        """Открывает файл path на дозапись."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, params, response, elapsed):
+        """Сохраняет ответ API вместе с параметрами и временем запроса."""
+        line = json.dumps(
+            {
+                'ts': time.time(),
+                'elapsed': round(elapsed, 6),
+                'params': params,
+                'status': int(response.status_code),
+                'body': response.text,
+            },
+            ensure_ascii=False,
+            separators=RECORD_SEPARATORS,
+        )
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        """Закрывает файл записи."""
+        with self._lock:
+            self._file.close()
+
+
+def get_recorder(path):
+    """Возвращает общий для процесса рекордер для файла path."""
+    with _recorders_lock:
+        if path not in _recorders:
+            _recorders[path] = TrafficRecorder(path)
+        return _recorders[path]
+
+
+def read_records(path):
+    """Последовательно читает записи из файла; битые строки пропускает."""
+    with open(path, encoding='utf-8') as records_file:
+        for line in records_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Хвост файла мог не дописаться при аварийной остановке.
+                continue
+
+
+def replay(path, sink, realtime=False, sleep=time.sleep):
+    """Прогоняет записанные ответы через check_response и parse_status.
+
+    В режиме realtime сохраняются исходные интервалы между ответами,
+    иначе записи подаются с максимально возможной скоростью.
+    """
+    from homework import check_response, parse_status
+
+    records = messages = errors = 0
+    previous_ts = None
+    started = time.monotonic()
+    for record in read_records(path):
+        if realtime and previous_ts is not None:
+            sleep(max(0, record['ts'] - previous_ts))
+        previous_ts = record['ts']
+        records += 1
+        if record['status'] != HTTPStatus.OK:
+            errors += 1
+            continue
+        try:
+            homeworks = check_response(json.loads(record['body']))
+            for homework in homeworks:
+                sink(parse_status(homework))
+                messages += 1
+        except (ValueError, KeyError, TypeError):
+            errors += 1
+    return ReplayStats(records, messages, errors, time.monotonic() - started)
@@ -0,0 +1,52 @@
+import calendar
+import sys
+import time
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def parse_timestamp(value):
+    """Переводит время из ответа API в секунды эпохи или None."""
+    try:
+        return calendar.timegm(time.strptime(value, TIMESTAMP_FORMAT))
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(value):
+    """Обратное к parse_timestamp: секунды эпохи в строку API."""
+    if value is None:
+        return None
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(value))
+
+
+class HomeworkRecord:
+    """Сжатая запись о работе вместо словаря из ответа API.
+
+    status - индекс статуса в кортеже известных статусов, updated -
+    время обновления в секундах эпохи. Имя интернируется: у подписок
+    одного курса имена работ совпадают.
+    """
+
+    __slots__ = ('name', 'status', 'updated')
+
+    def __init__(self, name, status, updated=None):
+        """Без updated время обновления считается неизвестным."""
+        self.name = sys.intern(name) if type(name) is str else name
+        self.status = status
+        self.updated = updated
+
+    def __eq__(self, other):
+        """Записи равны, если совпадают имя, статус и время."""
+        if not isinstance(other, HomeworkRecord):
+            return NotImplemented
+        return (self.name, self.status, self.updated) == (
+            other.name, other.status, other.updated
+        )
+
+    def __repr__(self):
+        """Представление, по которому запись можно воссоздать."""
+        return (
+            f'HomeworkRecord({self.name!r}, {self.status!r}, '
+            f'{self.updated!r})'
+        )
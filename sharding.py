@@ -0,0 +1,254 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    subscription_id TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL
+);
+"""
+
+WORKER_RESTARTED = 'Процесс {} завершился с кодом {}, перезапускаю'
+REBALANCED = 'Перераспределено подписок: {} (живых процессов: {})'
+REGISTRY_UNREADABLE = 'Не удалось перечитать реестр подписок: {}'
+
+
+def ring_hash(value):
+    """Положение значения на кольце хешей."""
+    return int.from_bytes(
+        hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big'
+    )
+
+
+class HashRing:
+    """Консистентное хеширование подписок по процессам.
+
+    У каждого процесса replicas виртуальных точек на кольце, поэтому
+    при добавлении или удалении процесса переезжает примерно 1/N подписок.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        """Расставляет точки процессов nodes на кольце."""
+        self._points = sorted(
+            (ring_hash(f'{node}#{replica}'), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._points]
+
+    def node_for(self, key):
+        """Возвращает процесс, которому принадлежит ключ."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key))
+        return self._points[index % len(self._points)][1]
+
+
+class ShardStore:
+    """Общее хранилище назначений и пульса процессов в SQLite.
+
+    Живым считается процесс, обновлявший пульс не позже ttl секунд
+    назад: пульс служит арендой на все назначенные ему подписки.
+    """
+
+    def __init__(self, path, ttl=30):
+        """Открывает общую базу path в режиме WAL."""
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+
+    def heartbeat(self, worker_id):
+        """Продлевает аренду процесса."""
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) '
+                'ON CONFLICT (worker_id) DO UPDATE SET heartbeat = ?',
+                (worker_id, time.time(), time.time())
+            )
+
+    def live_workers(self):
+        """Возвращает процессы с действующей арендой."""
+        with self._lock:
+            return sorted(row[0] for row in self._connection.execute(
+                'SELECT worker_id FROM workers WHERE heartbeat >= ?',
+                (time.time() - self.ttl,)
+            ))
+
+    def owned(self, worker_id):
+        """Возвращает идентификаторы подписок, назначенных процессу."""
+        with self._lock:
+            return {row[0] for row in self._connection.execute(
+                'SELECT subscription_id FROM assignments WHERE worker_id = ?',
+                (worker_id,)
+            )}
+
+    def assignments(self):
+        """Возвращает все назначения подписка -> процесс."""
+        with self._lock:
+            return dict(self._connection.execute(
+                'SELECT subscription_id, worker_id FROM assignments'
+            ))
+
+    def rebalance(self, subscription_ids):
+        """Назначает подписки живым процессам; возвращает число переездов.
+
+        Меняются только строки подписок, владелец которых на кольце
+        изменился, а подписки, которых больше нет, удаляются.
+        """
+        ring = HashRing(self.live_workers())
+        current = self.assignments()
+        moves = []
+        for subscription_id in subscription_ids:
+            worker_id = ring.node_for(subscription_id)
+            if worker_id is not None and current.get(
+                subscription_id
+            ) != worker_id:
+                moves.append((subscription_id, worker_id))
+        removed = set(current) - set(subscription_ids)
+        with self._lock, self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO assignments '
+                '(subscription_id, worker_id) VALUES (?, ?)', moves
+            )
+            self._connection.executemany(
+                'DELETE FROM assignments WHERE subscription_id = ?',
+                [(subscription_id,) for subscription_id in removed]
+            )
+        return len(moves)
+
+    def close(self):
+        """Закрывает базу."""
+        with self._lock:
+            self._connection.close()
+
+
+class ShardMember:
+    """Участие процесса опроса в шарде.
+
+    Фоновый поток продлевает аренду процесса и обновляет список
+    назначенных ему подписок, так что проверка owns() не ходит в базу.
+    """
+
+    def __init__(self, store, worker_id):
+        """Сведения о подписках приходят только после start()."""
+        self.store = store
+        self.worker_id = worker_id
+        self._owned = frozenset()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='shard-heartbeat', daemon=True
+        )
+
+    def start(self):
+        """Регистрирует процесс и запускает продление аренды."""
+        self.refresh()
+        self._thread.start()
+        return self
+
+    def refresh(self):
+        """Продлевает аренду и перечитывает назначения."""
+        self.store.heartbeat(self.worker_id)
+        self._owned = frozenset(self.store.owned(self.worker_id))
+
+    def owns(self, subscription_id):
+        """Проверяет, назначена ли подписка этому процессу."""
+        return subscription_id in self._owned
+
+    def stop(self):
+        """Останавливает продление аренды."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(5)
+
+    def _run(self):
+        while not self._stopped.wait(self.store.ttl / 3):
+            try:
+                self.refresh()
+            except sqlite3.Error as error:
+                logger.error(error, exc_info=True)
+
+
+def worker_path(path, worker_id):
+    """Добавляет идентификатор процесса к имени файла перед расширением.
+
+    Журналы уведомлений и истории держат индекс в памяти процесса, поэтому
+    у каждого исполнителя шарда свои файлы: outbox.sqlite3 превращается
+    в outbox.host-0.sqlite3. База в памяти (':memory:') не меняется.
+    """
+    if not path or path == ':memory:':
+        return path
+    root, extension = os.path.splitext(path)
+    return f'{root}.{worker_id}{extension}'
+
+
+def run_worker(worker_id, store_path):
+    """Запускает цикл опроса бота как процесс-исполнитель шарда."""
+    os.environ['SHARD_WORKER_ID'] = worker_id
+    os.environ['SHARD_STORE'] = store_path
+    import homework
+    homework.main()
+
+
+def supervise(workers, store_path, load_ids, interval=10, ttl=30):
+    """Запускает workers процессов опроса и распределяет между ними подписки.
+
+    load_ids() возвращает идентификаторы подписок из реестра; он
+    перечитывается на каждом круге, поэтому подписки, добавленные
+    после запуска, тоже назначаются. Если реестр не читается,
+    распределение идёт по прежнему списку. Упавшие процессы
+    перезапускаются. Процессы на других машинах, работающие с тем же
+    хранилищем, участвуют в распределении наравне с местными.
+    """
+    context = multiprocessing.get_context('spawn')
+    store = ShardStore(store_path, ttl)
+    processes = {}
+    subscription_ids = []
+    try:
+        while True:
+            for number in range(workers):
+                worker_id = f'{os.uname().nodename}-{number}'
+                process = processes.get(worker_id)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    logger.warning(WORKER_RESTARTED.format(
+                        worker_id, process.exitcode
+                    ))
+                # Пульс до старта, чтобы подписки назначились сразу.
+                store.heartbeat(worker_id)
+                processes[worker_id] = context.Process(
+                    target=run_worker, args=(worker_id, store_path),
+                    name=worker_id, daemon=True
+                )
+                processes[worker_id].start()
+            try:
+                subscription_ids = load_ids()
+            except (OSError, ValueError, KeyError) as error:
+                logger.error(REGISTRY_UNREADABLE.format(error))
+            moved = store.rebalance(subscription_ids)
+            if moved:
+                logger.info(REBALANCED.format(
+                    moved, len(store.live_workers())
+                ))
+            time.sleep(interval)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        store.close()
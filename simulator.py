@@ -0,0 +1,128 @@
+import json
+import random
+from collections import namedtuple
+from http import HTTPStatus
+
+import recorder
+from polling import Scheduler
+
+DAY = 24 * 60 * 60
+
+SimulationReport = namedtuple('SimulationReport', (
+    'api_calls', 'notifications', 'undelivered',
+    'mean_delay', 'p50_delay', 'p95_delay', 'max_delay',
+))
+
+
+def generate_timelines(
+    tenants, duration, seed=0, homeworks_per_tenant=3,
+    review_time=DAY, rejection_rate=0.3, fix_time=2 * DAY
+):
+    """Генерирует случайные истории смены статусов для tenants студентов.
+
+    Каждая история - отсортированный список пар (время, статус).
+    """
+    rng = random.Random(seed)
+    timelines = []
+    for _ in range(tenants):
+        events = []
+        for _ in range(homeworks_per_tenant):
+            moment = rng.uniform(0, duration)
+            while moment < duration:
+                events.append((moment, 'reviewing'))
+                moment += rng.expovariate(1 / review_time)
+                if rng.random() >= rejection_rate:
+                    events.append((moment, 'approved'))
+                    break
+                events.append((moment, 'rejected'))
+                moment += rng.expovariate(1 / fix_time)
+        timelines.append(sorted(
+            event for event in events if event[0] < duration
+        ))
+    return timelines
+
+
+def timeline_from_records(path):
+    """Восстанавливает историю статусов из файла рекордера.
+
+    Моментом смены статуса считается время первого ответа API,
+    в котором этот статус появился.
+    """
+    last_statuses = {}
+    events = []
+    start = None
+    for record in recorder.read_records(path):
+        if start is None:
+            start = record['ts']
+        if record['status'] != HTTPStatus.OK:
+            continue
+        try:
+            homeworks = json.loads(record['body']).get('homeworks', [])
+        except (ValueError, AttributeError):
+            continue
+        for homework in homeworks:
+            name = homework.get('homework_name')
+            status = homework.get('status')
+            if last_statuses.get(name) != status:
+                last_statuses[name] = status
+                events.append((record['ts'] - start, status))
+    return events
+
+
+def percentile(sorted_values, fraction):
+    """Возвращает перцентиль по заранее отсортированному списку."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def simulate(timelines, policy, duration, error_rate=0.0, seed=0):
+    """Прогоняет политику опроса по историям статусов в виртуальном времени.
+
+    Использует те же PollingPolicy и Scheduler, что и бот, и считает
+    число запросов к API и задержку уведомлений о смене статуса.
+    """
+    rng = random.Random(seed)
+    scheduler = Scheduler()
+    positions = [0] * len(timelines)
+    errors = [0] * len(timelines)
+    active = [True] * len(timelines)
+    for tenant in range(len(timelines)):
+        scheduler.schedule(tenant, rng.uniform(0, policy.interval))
+
+    api_calls = 0
+    delays = []
+    while True:
+        now = scheduler.next_due()
+        if now is None or now > duration:
+            break
+        for tenant, _ in scheduler.pop_due(now):
+            api_calls += 1
+            if error_rate and rng.random() < error_rate:
+                errors[tenant] += 1
+            else:
+                errors[tenant] = 0
+                events = timelines[tenant]
+                position = positions[tenant]
+                while position < len(events) and events[position][0] <= now:
+                    delays.append(now - events[position][0])
+                    active[tenant] = events[position][1] == 'reviewing'
+                    position += 1
+                positions[tenant] = position
+            scheduler.schedule(
+                tenant,
+                now + policy.next_delay(errors[tenant], active[tenant])
+            )
+
+    delays.sort()
+    total_events = sum(len(events) for events in timelines)
+    return SimulationReport(
+        api_calls=api_calls,
+        notifications=len(delays),
+        undelivered=total_events - len(delays),
+        mean_delay=sum(delays) / len(delays) if delays else 0.0,
+        p50_delay=percentile(delays, 0.5),
+        p95_delay=percentile(delays, 0.95),
+        max_delay=delays[-1] if delays else 0.0,
+    )
@@ -0,0 +1,55 @@
+import hashlib
+import json
+from collections import namedtuple
+
+
+class Subscription(namedtuple('Subscription', ('chat_id', 'token'))):
+    """Подписка: чат в Telegram и токен API Практикума студента."""
+
+    __slots__ = ()
+
+    @property
+    def headers(self):
+        """Заголовки запроса к API от имени студента."""
+        return {'Authorization': f'OAuth {self.token}'}
+
+    @property
+    def id(self):
+        """Устойчивый идентификатор подписки без токена в открытом виде."""
+        return hashlib.sha1(
+            f'{self.chat_id}:{self.token}'.encode('utf-8')
+        ).hexdigest()[:16]
+
+
+class SubscriptionState:
+    """Изменяемое состояние опроса одной подписки.
+
+    last - HomeworkRecord последней известной работы или None,
+    checked - время последнего успешного ответа API или None.
+    """
+
+    __slots__ = (
+        'from_date', 'consecutive_errors', 'active', 'last', 'checked'
+    )
+
+    def __init__(self):
+        """Новая подписка опрашивается с начала истории."""
+        self.from_date = 0
+        self.consecutive_errors = 0
+        self.active = True
+        self.last = None
+        self.checked = None
+
+
+def load_subscriptions(path, default):
+    """Читает подписки из JSON-файла или возвращает подписку по умолчанию.
+
+    Файл содержит список объектов с ключами chat_id и token.
+    """
+    if not path:
+        return [default]
+    with open(path, encoding='utf-8') as registry_file:
+        return [
+            Subscription(str(entry['chat_id']), entry['token'])
+            for entry in json.load(registry_file)
+        ]
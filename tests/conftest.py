@@ -1,7 +1,11 @@
+import json
 import os
 import sys
+from datetime import timedelta
 
+import pytest
 import pytest_timeout
+import requests
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root_dir)
@@ -53,3 +57,90 @@ pytest_timeout.write = write_timeout_reasons
 os.environ['PRACTICUM_TOKEN'] = 'sometoken'
 os.environ['TELEGRAM_TOKEN'] = '1234:abcdefg'
 os.environ['TELEGRAM_CHAT_ID'] = '12345'
+os.environ['OUTBOX_FILE'] = ':memory:'
+
+
+class FakeResponse:
+    """Ответ requests.get с JSON-телом data."""
+
+    reason = ''
+    elapsed = timedelta(milliseconds=5)
+
+    def __init__(self, data=None, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.text = json.dumps(data)
+        self.content = self.text.encode('utf-8')
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+
+
+class Clock:
+    """Часы, которые идут, только когда тест двигает now."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Bot:
+    """Бот, запоминающий отправленные сообщения."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def write_registry(path, subscriptions, mtime=None):
+    path.write_text(json.dumps([
+        {'chat_id': subscription.chat_id, 'token': subscription.token}
+        for subscription in subscriptions
+    ]))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def subscriptions():
+    from subscriptions import Subscription
+    return [Subscription('12345', 'sometoken')]
+
+
+@pytest.fixture
+def registry(tmp_path, subscriptions):
+    path = tmp_path / 'subscriptions.json'
+    write_registry(path, subscriptions, 1000)
+    return path
+
+
+@pytest.fixture
+def app_settings():
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, registry, app_settings, monkeypatch, homework_module):
+    """Запущенный App с реестром registry и журналом во временном каталоге.
+
+    Модуль тестов меняет подписки и настройки, переопределяя фикстуры
+    subscriptions и app_settings.
+    """
+    homework_module.load_settings()
+    monkeypatch.setattr(homework_module, 'SUBSCRIPTIONS_FILE', str(registry))
+    monkeypatch.setattr(
+        homework_module, 'OUTBOX_FILE', str(tmp_path / 'outbox.sqlite3')
+    )
+    for name, value in app_settings.items():
+        monkeypatch.setattr(homework_module, name, value)
+    app = homework_module.App(Bot()).start()
+    yield app
+    app.close()
@@ -0,0 +1,67 @@
+from alerts import ErrorAlerter, fingerprint
+from conftest import Clock
+
+
+def raise_api_error(timestamp):
+    raise ConnectionError(f'Параметры запроса: {{"from_date": {timestamp}}}')
+
+
+def catch(func, *args):
+    try:
+        func(*args)
+    except Exception as error:
+        return error
+
+
+class TestErrorAlerter:
+
+    def test_fingerprint_ignores_error_text(self):
+        first = catch(raise_api_error, 1)
+        second = catch(raise_api_error, 2)
+        assert str(first) != str(second)
+        assert fingerprint(first, 'fetch') == fingerprint(second, 'fetch'), (
+            'Отпечаток должен зависеть от типа и места ошибки, '
+            'а не от её текста.'
+        )
+        assert fingerprint(ValueError('x'), 'fetch') != fingerprint(
+            first, 'fetch'
+        )
+
+    def test_repeats_are_collapsed_into_one_summary(self):
+        clock = Clock()
+        alerter = ErrorAlerter(interval=600, clock=clock)
+        assert alerter.record('1', catch(raise_api_error, 1), 'fetch')
+        for timestamp in range(2, 6):
+            clock.now += 60
+            assert alerter.record(
+                '1', catch(raise_api_error, timestamp), 'fetch'
+            ) is None, 'Повторы в пределах окна не отправляются сразу.'
+        assert alerter.flush() == []
+
+        clock.now = 600
+        summaries = alerter.flush()
+        assert len(summaries) == 1 and ' 4 раз' in summaries[0].text, (
+            'По истечении окна отправляется одна сводка с числом повторов.'
+        )
+        clock.now = 1200
+        assert alerter.flush() == []
+        assert alerter.record('1', catch(raise_api_error, 7), 'fetch')
+
+    def test_steady_outage_is_summarized_not_realerted(self):
+        clock = Clock()
+        alerter = ErrorAlerter(interval=3600, clock=clock)
+        alerts, summaries = [], []
+        # Порядок App.poll: ошибки цикла, затем сводки.
+        for timestamp in range(0, 3 * 3600 + 1, 600):
+            clock.now = timestamp
+            if alerter.record('1', catch(raise_api_error, timestamp), 'fetch'):
+                alerts.append(timestamp)
+            summaries += alerter.flush()
+        assert alerts == [0], (
+            'При непрерывном сбое сразу сообщается только первая ошибка.'
+        )
+        assert [' 5 раз' in summary.text for summary in summaries] == [
+            True, False, False
+        ] and all(' 6 раз' in summary.text for summary in summaries[1:]), (
+            'Повторы должны уходить сводкой раз в интервал.'
+        )
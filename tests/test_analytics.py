@@ -0,0 +1,92 @@
+import pytest
+
+import cli
+from history import HistoryLog
+from records import HomeworkRecord
+
+np = pytest.importorskip('numpy')
+import analytics  # noqa: E402
+
+DAY = analytics.PERIODS['day']
+START = 1700006400  # 2023-11-15T00:00:00Z
+FIRST = 'a1b2c3d4e5f60718'
+SECOND = '0f1e2d3c4b5a6978'
+
+
+@pytest.fixture
+def history_file(tmp_path, homework_module):
+    reviewing, approved, rejected = (
+        homework_module.STATUSES.index(status)
+        for status in ('reviewing', 'approved', 'rejected')
+    )
+    path = str(tmp_path / 'history.bin')
+    log = HistoryLog(path)
+    # Переходы двух работ перемежаются, как при живом опросе.
+    for subscription, name, status, updated in (
+        (FIRST, 'hw1.zip', reviewing, START),
+        (SECOND, 'hw1.zip', reviewing, START + 600),
+        (FIRST, 'hw1.zip', rejected, START + 3600),
+        (SECOND, 'hw1.zip', approved, START + 600 + 2 * 3600),
+        (FIRST, 'hw1.zip', reviewing, START + DAY),
+        (FIRST, 'hw1.zip', approved, START + DAY + 4 * 3600),
+        (FIRST, 'hw2.zip', approved, None),
+    ):
+        log.append(subscription, HomeworkRecord(name, status, updated))
+    log.close()
+    return path
+
+
+class TestAnalytics:
+
+    def test_review_turnaround(self, history_file, homework_module):
+        columns = analytics.load_columns(history_file)
+        assert len(columns.status) == 7
+        report = analytics.analyze(columns, homework_module.STATUSES)
+        assert (report.transitions, report.homeworks) == (7, 3)
+        assert (report.reviews, report.rejected) == (3, 1)
+        assert report.percentiles[50] == 2 * 3600
+        assert [
+            (period.start, period.reviews, period.rejected, period.mean)
+            for period in report.periods
+        ] == [
+            (START, 2, 1, 1.5 * 3600),
+            (START + DAY, 1, 0, 4 * 3600),
+        ]
+
+        recent = analytics.analyze(
+            columns, homework_module.STATUSES, since=START + DAY
+        )
+        assert (recent.reviews, recent.percentiles[50]) == (1, 4 * 3600)
+
+    def test_empty_history(self, tmp_path, homework_module):
+        path = str(tmp_path / 'history.bin')
+        HistoryLog(path).close()
+        report = analytics.analyze(
+            analytics.load_columns(path), homework_module.STATUSES
+        )
+        assert (report.transitions, report.reviews, report.periods) == (
+            0, 0, []
+        )
+
+    def test_reads_live_log_without_changing_it(self, history_file):
+        with open(history_file, 'ab') as history:
+            history.write(b'\x00' * 5)
+        with open(history_file, 'rb') as history:
+            content = history.read()
+        columns = analytics.load_columns(history_file)
+        assert len(columns.status) == 7
+        assert columns.homework.tolist() == [0, 0, 0, 0, 1, 1, 2]
+        with open(history_file, 'rb') as history:
+            assert history.read() == content
+
+    def test_missing_file_is_not_created(self, tmp_path):
+        path = tmp_path / 'history.bin'
+        with pytest.raises(FileNotFoundError):
+            analytics.load_columns(str(path))
+        assert not path.exists()
+
+    def test_cli(self, history_file, capsys):
+        assert cli.main(['analytics', history_file, '--period', 'week']) == 0
+        output = capsys.readouterr().out
+        assert 'проверок: 3, отклонено: 1 (33.3%)' in output
+        assert 'p50 2.0' in output
@@ -0,0 +1,134 @@
+import time
+
+import pytest
+import requests
+
+from backfill import Backfill
+from conftest import Bot, FakeResponse
+from history import HistoryLog
+from records import HomeworkRecord, format_timestamp
+from subscriptions import Subscription
+
+SUBSCRIPTION = Subscription('12345', 'sometoken')
+DAY = 86400
+
+
+class FakeApi:
+    """API, отдающий работы, обновлённые не раньше from_date."""
+
+    def __init__(self, homeworks):
+        self.homeworks = homeworks
+        self.calls = []
+
+    def get(self, *args, params=None, **kwargs):
+        from_date = params['from_date']
+        self.calls.append(from_date)
+        return FakeResponse({
+            'homeworks': [
+                {
+                    'homework_name': name, 'status': status,
+                    'date_updated': format_timestamp(updated),
+                }
+                for name, status, updated in self.homeworks
+                if updated >= from_date
+            ],
+            'current_date': int(time.time()),
+        })
+
+
+@pytest.fixture
+def history(tmp_path):
+    log = HistoryLog(str(tmp_path / 'history.bin'))
+    yield log
+    log.close()
+
+
+class TestBackfill:
+
+    def test_one_request_stores_only_older_records(self, history):
+        records = [
+            HomeworkRecord('hw3.zip', 1, 950),
+            HomeworkRecord('hw2.zip', 0, 700),
+            HomeworkRecord('hw1.zip', 0, 150),
+            HomeworkRecord('hw0.zip', 0, None),
+        ]
+        calls = []
+
+        def fetch(subscription):
+            calls.append(subscription)
+            return records
+
+        latest = []
+        backfill = Backfill(
+            fetch, history,
+            latest=lambda subscription, record: latest.append(record)
+        )
+        backfill.add(SUBSCRIPTION, 900)
+        while backfill.step():
+            pass
+        assert calls == [SUBSCRIPTION], (
+            'История подписки должна догружаться одним запросом.'
+        )
+        assert latest == [records[0]], (
+            'Самая новая работа нужна состоянию подписки, даже если '
+            'она старше окна опроса.'
+        )
+        assert sorted(
+            transition.name for transition in history.since(0)
+        ) == ['hw0.zip', 'hw1.zip', 'hw2.zip'], (
+            'Работы, обновлённые позже upper, догружать не нужно.'
+        )
+
+    def test_failing_subscription_is_abandoned(self, history):
+        def fetch(subscription):
+            raise requests.exceptions.ConnectionError('нет связи')
+
+        backfill = Backfill(fetch, history, max_failures=2)
+        backfill.add(SUBSCRIPTION, 900)
+        assert backfill.step() and backfill.pending == 1
+        assert backfill.step() and backfill.pending == 0
+        assert not backfill.step()
+
+    def test_cold_start_notifies_recent_and_backfills_history(
+            self, tmp_path, registry, monkeypatch, homework_module
+    ):
+        now = int(time.time())
+        api = FakeApi([
+            ('fresh.zip', 'reviewing', now - 3600),
+            ('month.zip', 'approved', now - 40 * DAY),
+            ('year.zip', 'rejected', now - 400 * DAY),
+        ])
+        monkeypatch.setattr(requests, 'get', api.get)
+        homework_module.load_settings()
+        monkeypatch.setattr(
+            homework_module, 'SUBSCRIPTIONS_FILE', str(registry)
+        )
+        monkeypatch.setattr(
+            homework_module, 'HISTORY_FILE', str(tmp_path / 'history.bin')
+        )
+        monkeypatch.setattr(homework_module, 'BACKFILL_RATE', 1000.0)
+        app = homework_module.App(Bot())
+        try:
+            cutoff = app.poller.states[SUBSCRIPTION].from_date
+            assert cutoff == pytest.approx(now - 7 * DAY, abs=5)
+            app.start()
+            app.poll(app.pop_due(time.monotonic()))
+            deadline = time.monotonic() + 1
+            while app.backfill.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert not app.backfill.pending
+            assert sorted(api.calls) == [0, cutoff], (
+                'Опрос должен начинаться с недавнего окна, а всю историю '
+                'догрузка должна запросить один раз.'
+            )
+            assert [text for _, text in app.poller.bot.sent] == [
+                homework_module.parse_status({
+                    'homework_name': 'fresh.zip', 'status': 'reviewing'
+                })
+            ], 'Догрузка истории не должна отправлять уведомлений.'
+            assert {
+                transition.name
+                for transition in app.poller.history.since(0)
+            } == {'fresh.zip', 'month.zip', 'year.zip'}
+        finally:
+            app.close()
@@ -0,0 +1,21 @@
+import benchmark
+
+
+class TestBenchmark:
+
+    def test_thread_pool_scales_with_workers(self):
+        results, connections = benchmark.run(
+            tenants=16, workers=(1, 8), latency=0.02
+        )
+        single, pooled = results
+        assert single.requests == pooled.requests == 16, (
+            'Каждая подписка должна быть опрошена ровно один раз.'
+        )
+        assert single.parallel == 1
+        assert 1 < pooled.parallel <= 8, (
+            'Пул должен ждать ответов API параллельно, но не больше '
+            'чем числом своих потоков.'
+        )
+        assert connections == 1 + 8, (
+            'Каждый поток пула должен переиспользовать своё соединение.'
+        )
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+import requests
+
+from concurrency import AdaptiveLimiter, RateLimiter
+from conftest import Clock
+from metrics import registry as metrics
+
+
+def call(limiter, clock, latency, overloaded=False):
+    started = limiter.acquire()
+    clock.now += latency
+    limiter.release(started, overloaded)
+
+
+class TestAdaptiveLimiter:
+
+    def test_limit_grows_while_latency_is_at_baseline(self):
+        clock = Clock()
+        limiter = AdaptiveLimiter(initial=2, maximum=4, clock=clock)
+        for _ in range(5):
+            call(limiter, clock, 0.1)
+        assert limiter.limit < 3, (
+            'Лимит, который не выбирается, расти не должен.'
+        )
+        for _ in range(10):
+            slots = [limiter.acquire() for _ in range(int(limiter.limit))]
+            clock.now += 0.1
+            for started in slots:
+                limiter.release(started)
+        assert limiter.limit == 4, 'Лимит растёт, но не выше максимума.'
+        assert metrics.get('upstream_concurrency_limit') == 4
+
+    def test_limit_shrinks_once_per_spike(self):
+        clock = Clock()
+        limiter = AdaptiveLimiter(
+            initial=16, minimum=2, clock=clock, name='test_spike'
+        )
+        call(limiter, clock, 0.1)
+        first, second = limiter.acquire(), limiter.acquire()
+        clock.now += 1
+        limiter.release(first)
+        assert limiter.limit == pytest.approx(8), (
+            'Всплеск задержки должен сразу уменьшать лимит вдвое.'
+        )
+        limiter.release(second)
+        assert limiter.limit == pytest.approx(8), (
+            'Запросы, начатые до уменьшения, не уменьшают лимит повторно.'
+        )
+        for _ in range(3):
+            call(limiter, clock, 0.1, overloaded=True)
+        assert limiter.limit == 2
+        assert metrics.get('test_spike_limit') == 2
+
+    def test_acquire_waits_for_free_slot(self):
+        limiter = AdaptiveLimiter(initial=1, name='test_wait')
+        started = limiter.acquire()
+        assert limiter.acquire(timeout=0.05) is None
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive()
+        limiter.release(started)
+        waiter.join(1)
+        assert not waiter.is_alive()
+        assert limiter.inflight == 1
+
+    def test_overloaded_api_shrinks_limit(self, monkeypatch, homework_module):
+        class Response:
+            status_code = 503
+            reason = 'Service Unavailable'
+            text = ''
+
+        limiter = AdaptiveLimiter(initial=8, name='test_api')
+        monkeypatch.setattr(homework_module, 'upstream', limiter)
+        monkeypatch.setattr(
+            requests, 'get', lambda *args, **kwargs: Response()
+        )
+        with pytest.raises(requests.exceptions.RequestException):
+            homework_module.get_api_answer(0)
+        assert (limiter.limit, limiter.inflight) == (4, 0)
+
+        def unavailable(*args, **kwargs):
+            raise requests.exceptions.ConnectionError('нет связи')
+
+        monkeypatch.setattr(requests, 'get', unavailable)
+        with pytest.raises(homework_module.ApiError):
+            homework_module.get_api_answer(0)
+        assert (limiter.limit, limiter.inflight) == (2, 0)
+
+
+class TestRateLimiter:
+
+    def test_calls_are_spaced(self):
+        sleeps = []
+        limiter = RateLimiter(10, clock=lambda: 100.0, sleep=sleeps.append)
+        for _ in range(3):
+            limiter.acquire()
+        assert sleeps == pytest.approx([0.1, 0.2])
@@ -0,0 +1,27 @@
+from conftest import Clock
+from dedupe import DedupeStore
+
+
+class TestDedupeStore:
+
+    def test_least_recently_used_key_is_evicted(self):
+        store = DedupeStore(max_entries=2)
+        store.add(('12345', 'hw1', 'approved'))
+        store.add(('12345', 'hw2', 'reviewing'))
+        assert ('12345', 'hw1', 'approved') in store
+        store.add(('12345', 'hw3', 'rejected'))
+        assert len(store) == 2, 'Хранилище не должно превышать max_entries.'
+        assert ('12345', 'hw2', 'reviewing') not in store, (
+            'Вытесняться должен ключ, к которому дольше всего не обращались.'
+        )
+        assert ('12345', 'hw1', 'approved') in store
+
+    def test_key_expires_after_ttl(self):
+        clock = Clock()
+        store = DedupeStore(ttl=60, clock=clock)
+        store.add('key')
+        clock.now = 30
+        assert 'key' in store
+        clock.now = 91
+        assert 'key' not in store, 'Запись должна забываться после ttl.'
+        assert len(store) == 0
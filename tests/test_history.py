@@ -0,0 +1,166 @@
+import threading
+
+import pytest
+
+import cli
+from conftest import Clock
+from history import ENTRY, HistoryLog, HistoryReader
+from outbox import Outbox
+from records import HomeworkRecord
+from subscriptions import Subscription, SubscriptionState
+
+FIRST = 'a1b2c3d4e5f60718'
+SECOND = '0f1e2d3c4b5a6978'
+
+
+class TestHistory:
+
+    def test_timeline_and_since_use_index(self, tmp_path):
+        clock = Clock(1000.0)
+        log = HistoryLog(str(tmp_path / 'history.bin'), clock=clock)
+        assert log.append(FIRST, HomeworkRecord('hw1.zip', 1, 100))
+        clock.now = 2000
+        assert log.append(SECOND, HomeworkRecord('hw1.zip', 1, 150))
+        clock.now = 3000
+        assert log.append(FIRST, HomeworkRecord('hw1.zip', 2, 200))
+        assert not log.append(FIRST, HomeworkRecord('hw1.zip', 2, 200)), (
+            'Повтор последнего статуса не должен попадать в историю.'
+        )
+
+        timeline = log.timeline(FIRST, 'hw1.zip')
+        assert [(item.status, item.updated) for item in timeline] == [
+            (1, 100), (2, 200)
+        ]
+        assert [item.subscription_id for item in log.since(2000)] == [
+            SECOND, FIRST
+        ]
+        assert log.since(3001) == []
+        assert log.timeline(FIRST, 'hw2.zip') == []
+        log.close()
+
+    def test_index_is_rebuilt_and_torn_tail_dropped(self, tmp_path):
+        path = str(tmp_path / 'history.bin')
+        log = HistoryLog(path, clock=Clock(1000.0))
+        log.append(FIRST, HomeworkRecord('hw1.zip', 0, None))
+        log.append(FIRST, HomeworkRecord('hw1.zip', 1, 300))
+        log.close()
+        with open(path, 'ab') as history_file:
+            history_file.write(b'\x00' * (ENTRY.size - 1))
+
+        log = HistoryLog(path, clock=Clock(1000.0))
+        assert len(log) == 2
+        assert log.timeline(FIRST, 'hw1.zip')[0].updated is None
+        assert log.append(FIRST, HomeworkRecord('hw1.zip', 2, 400))
+        log.close()
+        log = HistoryLog(path)
+        assert [
+            item.status for item in log.timeline(FIRST, 'hw1.zip')
+        ] == [0, 1, 2]
+        log.close()
+
+    def test_not_a_history_file(self, tmp_path):
+        path = tmp_path / 'other.bin'
+        path.write_bytes(b'something else')
+        with pytest.raises(ValueError):
+            HistoryLog(str(path))
+
+    def test_compaction_keeps_latest_status(self, tmp_path):
+        clock = Clock(1000.0)
+        log = HistoryLog(
+            str(tmp_path / 'history.bin'), retention=100, clock=clock
+        )
+        for status in range(3):
+            clock.now += 60
+            log.append(FIRST, HomeworkRecord('hw1.zip', status, status))
+        log.append(SECOND, HomeworkRecord('hw2.zip', 0, 0))
+
+        clock.now += 150
+        assert log.compact() == 2
+        assert [
+            item.status for item in log.timeline(FIRST, 'hw1.zip')
+        ] == [2]
+        assert len(log.timeline(SECOND, 'hw2.zip')) == 1
+        assert log.compact() == 0
+        log.close()
+
+    def test_appends_during_compaction_are_kept(self, tmp_path):
+        clock = Clock(1000.0)
+        log = HistoryLog(
+            str(tmp_path / 'history.bin'), retention=10, clock=clock
+        )
+        for status in range(200):
+            log.append(FIRST, HomeworkRecord('hw1.zip', status % 3, status))
+        clock.now += 100
+        writer = threading.Thread(target=lambda: [
+            log.append(SECOND, HomeworkRecord('hw2.zip', status % 3, status))
+            for status in range(200)
+        ])
+        writer.start()
+        log.compact()
+        writer.join()
+        assert len(log.timeline(FIRST, 'hw1.zip')) == 1
+        assert len(log.timeline(SECOND, 'hw2.zip')) == 200
+        log.close()
+
+    def test_cli_prints_timeline(self, tmp_path, capsys):
+        path = str(tmp_path / 'history.bin')
+        log = HistoryLog(path, clock=Clock(1618137069))
+        log.append(FIRST, HomeworkRecord('hw1.zip', 1, 1618137069))
+        log.close()
+        assert cli.main([
+            'history', path, '--subscription', FIRST, '--homework', 'hw1.zip'
+        ]) == 0
+        assert capsys.readouterr().out.split() == [
+            '2021-04-11T10:31:09Z', FIRST, 'hw1.zip', 'reviewing'
+        ]
+
+    def test_reader_leaves_live_log_untouched(self, tmp_path, capsys):
+        path = str(tmp_path / 'history.bin')
+        log = HistoryLog(path, clock=Clock(1618137069))
+        for number in range(5):
+            log.append(FIRST, HomeworkRecord(f'hw{number}.zip', 1, None))
+        # Живой бот дописывает запись, а CLI в это время читает журнал.
+        log._file.write(ENTRY.pack(0, 0, 0, bytes(8), 10))
+        log._file.flush()
+        with open(path, 'rb') as history_file:
+            content = history_file.read()
+
+        reader = HistoryReader(path)
+        assert [len(batch) for batch in reader.batches(size=2)] == [2, 2, 1]
+        detected = [item.detected for item in reader.entries()]
+        assert [item.name for item in reader.entries(detected[2])] == [
+            'hw3.zip', 'hw4.zip'
+        ]
+        assert cli.main(['history', path, '--homework', 'hw4.zip']) == 0
+        assert 'hw4.zip' in capsys.readouterr().out
+        with open(path, 'rb') as history_file:
+            assert history_file.read() == content
+        log.close()
+
+        missing = tmp_path / 'missing.bin'
+        with pytest.raises(FileNotFoundError):
+            cli.main(['history', str(missing)])
+        assert not missing.exists()
+
+    def test_poller_records_delivered_transitions(
+            self, tmp_path, homework_module, data_with_new_hw_status
+    ):
+        homework_module.load_settings()
+        subscription = Subscription('12345', 'sometoken')
+        log = HistoryLog(str(tmp_path / 'history.bin'))
+        poller = homework_module.Poller(
+            None, {subscription: SubscriptionState()}, Outbox(':memory:'),
+            history=log
+        )
+        for _ in range(2):
+            item = (subscription, data_with_new_hw_status)
+            for stage in (poller.validate, poller.diff, poller.render):
+                item = item and stage(item)
+            if item:
+                poller.deliver(item)
+        timeline = log.timeline(subscription.id, 'hw123.zip')
+        assert [
+            homework_module.STATUSES[item.status] for item in timeline
+        ] == ['approved']
+        poller.outbox.close()
+        log.close()
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Запас на медленные машины CI: с ранним импортом requests
+# и telebot модуль грузился около 200 мс.
+IMPORT_BUDGET_US = 100000
+PROBE = (
+    'import logging, sys\n'
+    'import homework\n'
+    'lazy = [name for name in ("requests", "telebot", "dotenv")'
+    ' if name in sys.modules]\n'
+    'print(lazy, len(logging.getLogger().handlers),'
+    ' len(homework.logger.handlers))\n'
+)
+
+# Функции и классы модуля сами загружают нужные им настройки.
+SETTINGS_PROBE = (
+    'import homework\n'
+    'from outbox import Outbox\n'
+    'homework.Poller(None, {}, Outbox(":memory:")).delivery.stop()\n'
+    'print(homework.open_history(), homework.join_shard(),'
+    ' homework.hold_leases([], None))\n'
+)
+
+
+def run_probe(*options, probe=PROBE):
+    return subprocess.run(
+        [sys.executable, *options, '-c', probe], cwd=ROOT_DIR,
+        capture_output=True, text=True, check=True
+    )
+
+
+class TestImport:
+
+    def test_import_has_no_side_effects(self):
+        log_file = os.path.join(ROOT_DIR, 'logfile.log')
+        existed = os.path.exists(log_file)
+        result = run_probe()
+        assert result.stdout.split() == ['[]', '0', '0']
+        assert os.path.exists(log_file) == existed
+
+    def test_import_time_budget(self):
+        result = run_probe('-X', 'importtime')
+        cumulative = [
+            int(line.split('|')[1])
+            for line in result.stderr.splitlines()
+            if line.split('|')[-1].strip() == 'homework'
+        ]
+        assert cumulative
+        assert cumulative[0] < IMPORT_BUDGET_US, (
+            f'Импорт homework занял {cumulative[0]} мкс'
+        )
+
+    def test_functions_load_settings_themselves(self):
+        result = run_probe(probe=SETTINGS_PROBE)
+        assert result.stdout.split() == ['None', 'None', 'None']
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from conftest import Bot
+from leases import (
+    LeaseKeeper, MemoryRedis, RedisLeaseBackend, SqliteLeaseBackend
+)
+from outbox import Outbox
+from records import HomeworkRecord
+from subscriptions import Subscription, SubscriptionState
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SqliteLeaseBackend(str(tmp_path / 'leases.sqlite3'))
+    return RedisLeaseBackend(MemoryRedis())
+
+
+class TestLeases:
+
+    def test_fencing_token_grows_on_failover(self, backend):
+        assert backend.acquire('subscription', 'replica-a', 0.05) == 1
+        assert backend.acquire('subscription', 'replica-b', 0.05) is None, (
+            'Пока аренда действует, другая реплика не может её взять.'
+        )
+        assert backend.acquire('subscription', 'replica-a', 0.05) == 1
+        time.sleep(0.1)
+        assert backend.acquire('subscription', 'replica-b', 10) == 2
+        assert not backend.is_valid('subscription', 1), (
+            'Токен прежнего владельца должен считаться устаревшим.'
+        )
+        assert backend.is_valid('subscription', 2)
+
+    def test_keeper_hands_over_released_subscription(self, backend):
+        first = LeaseKeeper(backend, lambda: ['s1'], owner='replica-a')
+        second = LeaseKeeper(backend, lambda: ['s1'], owner='replica-b')
+        first.refresh()
+        second.refresh()
+        assert first.owns('s1') and not second.owns('s1')
+        first.stop()
+        second.refresh()
+        assert second.owns('s1')
+
+    def test_outbox_drops_message_with_stale_token(self, backend):
+        backend.acquire('s1', 'replica-a', 0.05)
+        outbox = Outbox(':memory:')
+        outbox.put('key', '12345', 'Работа проверена', 's1', 1)
+        time.sleep(0.1)
+        backend.acquire('s1', 'replica-b', 10)
+        sent = []
+        outbox.drain(
+            lambda chat_id, text: sent.append(text) or True,
+            fence=backend.is_valid
+        )
+        assert sent == [], (
+            'Реплика, потерявшая аренду, не должна отправлять уведомления.'
+        )
+        assert outbox.pending_count() == 0
+
+    def test_renew_fails_after_takeover(self):
+        client = MemoryRedis()
+        backend = RedisLeaseBackend(client)
+        assert backend.acquire('s1', 'replica-a', 10) == 1
+        client.set('lease:s1', 'replica-b:2')
+        assert backend.acquire('s1', 'replica-a', 10) is None, (
+            'Продление чужой аренды должно не удаваться.'
+        )
+        backend.release('s1', 'replica-a')
+        assert client.get('lease:s1') == 'replica-b:2', (
+            'Освобождать можно только свою аренду.'
+        )
+
+    def test_last_notified_key_survives_failover(self, backend):
+        backend.acquire('s1', 'replica-a', 0.05)
+        outbox = Outbox(':memory:')
+        outbox.put('key', '12345', 'Работа проверена', 's1', 1)
+        assert outbox.drain(
+            lambda chat_id, text: True, fence=backend.is_valid,
+            on_sent=backend.remember
+        ) == 1
+        assert backend.last_notified('s1') == 'key', (
+            'Новый владелец подписки должен знать, что уже доставлено.'
+        )
+        assert backend.last_notified('s2') is None
+
+    def test_new_owner_does_not_renotify(self, homework_module):
+        homework_module.load_settings()
+        backend = RedisLeaseBackend(MemoryRedis())
+        subscription = Subscription('12345', 'sometoken')
+        record = HomeworkRecord('hw123.zip', 1, 1000)
+        pollers = []
+        for owner in ('replica-a', 'replica-b'):
+            keeper = LeaseKeeper(
+                backend, lambda: [subscription.id], ttl=0.05, owner=owner
+            )
+            pollers.append(homework_module.Poller(
+                Bot(), {subscription: SubscriptionState()}, Outbox(':memory:'),
+                leases=keeper
+            ))
+        first, second = pollers
+        first.leases.refresh()
+        item = first.diff((subscription, (None, record)))
+        first.deliver(first.render(item))
+        assert first.delivery.flush() == 1
+        time.sleep(0.1)
+        second.leases.refresh()
+        assert second.leases.owns(subscription.id)
+        assert second.diff((subscription, (None, record))) is None, (
+            'Новый владелец не должен повторять уже доставленное '
+            'уведомление.'
+        )
@@ -0,0 +1,87 @@
+import signal
+import time
+
+import pytest
+
+from conftest import write_registry
+from subscriptions import Subscription
+
+FIRST = Subscription('1', 'first-token')
+SECOND = Subscription('2', 'second-token')
+
+
+@pytest.fixture
+def subscriptions():
+    return [FIRST]
+
+
+class TestLifecycle:
+
+    def test_registry_is_reloaded_incrementally(self, app, registry):
+        app.poller.states[FIRST].from_date = 1234
+        app.reload_registry()
+        assert app.subscriptions == [FIRST]
+
+        write_registry(registry, [FIRST, SECOND], 2000)
+        app.reload_registry()
+        assert app.subscriptions == [FIRST, SECOND]
+        assert app.poller.states[FIRST].from_date == 1234, (
+            'Состояние оставшихся подписок не должно сбрасываться.'
+        )
+        assert SECOND in app.scheduler
+        assert app.poller.chats['2'] == [SECOND]
+
+        write_registry(registry, [SECOND], 3000)
+        app.reload_registry()
+        assert app.subscriptions == [SECOND]
+        assert FIRST not in app.poller.states
+        assert FIRST not in app.scheduler
+        assert '1' not in app.poller.chats
+
+    def test_broken_registry_keeps_subscriptions(self, app, registry):
+        registry.write_text('[{"chat_id": ')
+        app.reload_registry()
+        assert app.subscriptions == [FIRST]
+
+    def test_signal_interrupts_only_idle_pause(self, app, homework_module):
+        app.handle_signals()
+        started = time.monotonic()
+        with pytest.raises(homework_module.Wakeup):
+            with app.idle():
+                signal.raise_signal(signal.SIGHUP)
+                time.sleep(5)
+        assert time.monotonic() - started < 1
+        assert app.reload_requested and not app.stopping
+
+        app.reload_requested = False
+        signal.raise_signal(signal.SIGTERM)
+        assert app.stopping, 'Сигнал во время цикла только запоминается.'
+        with pytest.raises(homework_module.Wakeup):
+            with app.idle():
+                time.sleep(5)
+
+        app.close()
+        assert signal.getsignal(signal.SIGTERM) is not app.on_signal, (
+            'После остановки прежние обработчики должны вернуться.'
+        )
+
+    def test_late_signal_does_not_escape_pause(
+            self, app, homework_module, monkeypatch
+    ):
+        clear = app.wakeup.clear
+
+        def signal_while_finishing_pause():
+            monkeypatch.setattr(app.wakeup, 'clear', clear)
+            app.on_signal(signal.SIGHUP, None)
+
+        monkeypatch.setattr(app.wakeup, 'clear', signal_while_finishing_pause)
+        with pytest.raises(homework_module.Wakeup):
+            with app.idle():
+                time.sleep(0)
+        app.on_signal(signal.SIGHUP, None)
+        assert app.reload_requested, (
+            'Сигнал после паузы только запоминается и не прерывает цикл.'
+        )
+        with pytest.raises(homework_module.Wakeup):
+            with app.idle():
+                time.sleep(5)
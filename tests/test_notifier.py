@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+
+import pytest
+
+from metrics import registry as metrics
+from notifier import FileSink, Notifier, Sink, parse_sinks
+from outbox import Outbox, make_key
+
+
+def telegram(chat_id, text, timeout):
+    return True
+
+
+class TestNotifier:
+
+    def test_parse_sinks(self):
+        sinks = parse_sinks(
+            'telegram;timeout=3,'
+            'webhook=https://example.com/hook;workers=8;attempts=2,'
+            'file=notifications.jsonl;name=archive',
+            telegram
+        )
+        assert [sink.name for sink in sinks] == [
+            'telegram', 'webhook', 'archive'
+        ]
+        assert sinks[0].timeout == 3
+        assert (sinks[1].url, sinks[1].workers, sinks[1].max_attempts) == (
+            'https://example.com/hook', 8, 2
+        )
+        assert sinks[2].path == 'notifications.jsonl'
+        with pytest.raises(ValueError):
+            parse_sinks('webhook', telegram)
+        with pytest.raises(ValueError):
+            parse_sinks('email=user@example.com', telegram)
+
+    def test_slow_sink_does_not_block_others(self):
+        outbox = Outbox(':memory:')
+        release = threading.Event()
+        fast = []
+
+        def slow(chat_id, text, timeout):
+            release.wait(1)
+            return True
+
+        def quick(chat_id, text, timeout):
+            fast.append(text)
+            return True
+
+        notifier = Notifier(
+            outbox, [Sink('slow', slow), Sink('telegram', quick)]
+        ).start()
+        try:
+            notifier.put('key', '1', 'текст')
+            deadline = time.monotonic() + 0.5
+            while not fast and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert fast == ['текст'], (
+                'Медленный получатель не должен задерживать остальных.'
+            )
+            assert outbox.pending_count('slow') == 1
+        finally:
+            release.set()
+            notifier.stop()
+        assert outbox.pending_count() == 0
+        outbox.close()
+
+    def test_retry_budget_and_key_are_per_sink(self):
+        outbox = Outbox(':memory:', retry_delay=0)
+        sent = []
+
+        def failing(chat_id, text, timeout):
+            raise ConnectionError('вебхук недоступен')
+
+        def ok(chat_id, text, timeout):
+            sent.append(timeout)
+            return True
+
+        notifier = Notifier(outbox, [
+            Sink('telegram', ok, timeout=7),
+            Sink('webhook', failing, max_attempts=2),
+        ])
+        notifier.put('key', '1', 'текст')
+        assert not outbox.put(make_key('key', 'webhook'), '1', 'текст'), (
+            'Ключ строки получателя должен включать его имя.'
+        )
+        notifier.flush()
+        notifier.flush()
+        assert sent == [7], 'Повторы не должны доходить до других получателей.'
+        assert outbox.pending_count() == 0, (
+            'После исчерпания своих попыток сообщение снимается с доставки.'
+        )
+        notifier.flush()
+        outbox.close()
+
+    def test_poll_flushes_only_telegram(self):
+        outbox = Outbox(':memory:')
+        sent = []
+        webhook_calls = []
+
+        def ok(chat_id, text, timeout):
+            sent.append(text)
+            return True
+
+        def slow(chat_id, text, timeout):
+            webhook_calls.append(text)
+            time.sleep(5)
+
+        notifier = Notifier(
+            outbox, [Sink('telegram', ok), Sink('webhook', slow)]
+        )
+        notifier.put('key', '1', 'текст')
+        started = time.monotonic()
+        assert notifier.flush_telegram() == 1
+        assert time.monotonic() - started < 1
+        assert sent == ['текст'] and webhook_calls == [], (
+            'Медленный получатель разбирается своим потоком, а не '
+            'в цикле опроса.'
+        )
+        assert outbox.pending_count(sink='webhook') == 1
+        outbox.close()
+
+    def test_file_sink_and_latency_metrics(self, tmp_path):
+        path = tmp_path / 'notifications.jsonl'
+        outbox = Outbox(':memory:')
+        count = metrics.get('notify_latency_seconds_count', sink='file')
+        notifier = Notifier(outbox, [FileSink(str(path))])
+        notifier.put('a', '1', 'первое')
+        notifier.put('b', '2', 'второе')
+        assert notifier.flush() == 2
+        assert [
+            json.loads(line) for line in path.read_text().splitlines()
+        ] == [
+            {'chat_id': '1', 'text': 'первое'},
+            {'chat_id': '2', 'text': 'второе'},
+        ]
+        assert metrics.get(
+            'notify_latency_seconds_count', sink='file'
+        ) == count + 2
+        assert metrics.get('notify_latency_seconds_sum', sink='file') >= 0
+        outbox.close()
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import FakeResponse
+import onboarding
+from subscriptions import Subscription, load_subscriptions
+
+
+def write_candidates(path, subscriptions):
+    path.write_text(json.dumps([
+        {'chat_id': subscription.chat_id, 'token': subscription.token}
+        for subscription in subscriptions
+    ]))
+    return str(path)
+
+
+class TestOnboarding:
+
+    def test_only_valid_subscriptions_reach_registry(self, tmp_path):
+        existing = Subscription('1', 'known')
+        registry = str(tmp_path / 'subscriptions.json')
+        onboarding.write_registry(registry, [existing])
+        candidates = [existing] + [
+            Subscription(str(number), f'token{number}')
+            for number in range(2, 42)
+        ]
+        candidates.append(Subscription('100', 'bad'))
+        candidates.append(Subscription('101', 'flaky'))
+        candidates.append(Subscription('404', 'token404'))
+        active = []
+        peak = []
+        chats = []
+        lock = threading.Lock()
+
+        def check_token(token):
+            with lock:
+                active.append(token)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(token)
+            if token == 'bad':
+                raise onboarding.InvalidCredentials('401')
+            if token == 'flaky':
+                raise requests.exceptions.ConnectionError('таймаут')
+
+        def check_chat(chat_id):
+            chats.append(chat_id)
+            if chat_id == '404':
+                raise onboarding.InvalidCredentials('chat not found')
+
+        started = time.monotonic()
+        report = onboarding.onboard(
+            write_candidates(tmp_path / 'candidates.json', candidates),
+            registry, check_token, check_chat, workers=16
+        )
+        assert time.monotonic() - started < 0.5
+        assert max(peak) > 1, 'Токены должны проверяться параллельно.'
+        assert (len(report.checks), report.known, report.added) == (
+            43, 1, 40
+        )
+        assert '100' not in chats, (
+            'Чат с отвергнутым токеном проверять не нужно.'
+        )
+        registered = load_subscriptions(registry, None)
+        assert registered[0] == existing
+        assert len(registered) == 41
+        assert {'100', '101', '404'}.isdisjoint(
+            subscription.chat_id for subscription in registered
+        )
+        flaky = next(
+            check for check in report.checks
+            if check.subscription.token == 'flaky'
+        )
+        assert flaky.token_valid is None and flaky.chat_valid is True
+
+        onboarding.write_report(str(tmp_path / 'report.json'), report.checks)
+        assert 'flaky' not in (tmp_path / 'report.json').read_text(), (
+            'Токены не должны попадать в отчёт.'
+        )
+
+    def test_practicum_probe(self, monkeypatch):
+        calls = []
+
+        def get(url, headers, params, timeout):
+            calls.append(params)
+            return FakeResponse(
+                status_code=401 if 'bad' in headers['Authorization'] else 200
+            )
+
+        monkeypatch.setattr(requests, 'get', get)
+        probe = onboarding.practicum_probe('https://example.com/api/')
+        probe('good')
+        with pytest.raises(onboarding.InvalidCredentials):
+            probe('bad')
+        assert calls[0]['from_date'] >= time.time() - 5
@@ -0,0 +1,201 @@
+import sqlite3
+
+from metrics import registry as metrics
+from outbox import PRIORITY_ALERT, DeliveryWorker, Outbox, make_key
+
+
+class TestOutbox:
+
+    def test_event_survives_restart_and_is_not_duplicated(self, tmp_path):
+        path = str(tmp_path / 'outbox.sqlite3')
+        key = make_key('12345', 'hw123.zip', 'approved')
+        outbox = Outbox(path)
+        assert outbox.put(key, '12345', 'Работа проверена')
+        outbox.close()
+
+        outbox = Outbox(path)
+        assert not outbox.put(key, '12345', 'Работа проверена'), (
+            'Повторно обнаруженное событие не должно попадать в журнал.'
+        )
+        sent = []
+        assert outbox.drain(lambda chat_id, text: sent.append(text) or 1) == 1
+        assert outbox.drain(lambda chat_id, text: sent.append(text) or 1) == 0
+        assert sent == ['Работа проверена'], (
+            'Сообщение из журнала должно быть доставлено ровно один раз.'
+        )
+        outbox.close()
+
+    def test_failed_message_is_retried_in_chat_order(self):
+        outbox = Outbox(':memory:', retry_delay=0)
+        outbox.put('a', '1', 'первое')
+        outbox.put('b', '1', 'второе')
+        outbox.put('c', '2', 'другой чат')
+
+        def failing_for_first_chat(chat_id, text):
+            if chat_id == '1':
+                raise ConnectionError('Telegram недоступен')
+            return True
+
+        assert outbox.drain(failing_for_first_chat) == 1
+        assert outbox.pending_count() == 2
+
+        sent = []
+        outbox.drain(lambda chat_id, text: sent.append(text) or True)
+        assert sent == ['первое', 'второе'], (
+            'Сообщения одного чата должны доставляться по порядку '
+            'и повторяться без нового опроса API.'
+        )
+
+    def test_retry_backlog_does_not_starve_other_chats(self):
+        outbox = Outbox(':memory:', retry_delay=3600)
+        for number in range(100):
+            outbox.put(f'blocked-{number}', f'blocked-{number}', 'текст')
+        outbox.drain(lambda chat_id, text: False)
+        outbox.put('fresh', 'healthy', 'свежее')
+
+        sent = []
+        delivered = outbox.drain(
+            lambda chat_id, text: sent.append((chat_id, text)) or True
+        )
+        assert (delivered, sent) == (1, [('healthy', 'свежее')]), (
+            'Сообщения, ждущие повтора, не должны занимать лимит разбора.'
+        )
+
+    def test_shared_file_sends_claimed_message_once(self, tmp_path):
+        path = str(tmp_path / 'outbox.sqlite3')
+        first, second = Outbox(path), Outbox(path)
+        first.put('a', '12345', 'Работа проверена')
+        sent = []
+
+        def send(chat_id, text):
+            sent.append(text)
+            # Второй процесс разбирает журнал, пока первый отправляет.
+            assert second.drain(lambda *args: sent.append(args) or 1) == 0
+            return True
+
+        assert first.drain(send) == 1
+        assert second.drain(lambda *args: sent.append(args) or 1) == 0
+        assert sent == ['Работа проверена'], (
+            'Захваченное одним процессом сообщение другой отправлять '
+            'не должен.'
+        )
+        first.close()
+        second.close()
+
+    def test_failed_message_claim_is_released(self, tmp_path):
+        path = str(tmp_path / 'outbox.sqlite3')
+        first = Outbox(path, retry_delay=0)
+        second = Outbox(path, retry_delay=0)
+        first.put('a', '12345', 'Работа проверена')
+        assert first.drain(lambda *args: False) == 0
+        assert second.drain(lambda *args: True) == 1, (
+            'После неудачной попытки сообщение может отправить любой '
+            'процесс.'
+        )
+        first.close()
+        second.close()
+
+    def test_message_is_dead_after_max_attempts(self):
+        outbox = Outbox(':memory:', retry_delay=0, max_attempts=2)
+        outbox.put('a', '1', 'текст')
+        outbox.drain(lambda chat_id, text: False)
+        outbox.drain(lambda chat_id, text: False)
+        assert outbox.pending_count() == 0
+
+    def test_status_goes_ahead_of_alerts(self):
+        outbox = Outbox(':memory:', retry_delay=60)
+        outbox.put('e1', '1', 'ошибка 1', priority=PRIORITY_ALERT)
+        outbox.put('e2', '1', 'ошибка 2', priority=PRIORITY_ALERT)
+        outbox.put('s1', '1', 'проверена')
+        outbox.put('s2', '1', 'принята')
+        sent = []
+        outbox.drain(lambda chat_id, text: sent.append(text) or True)
+        assert sent == ['проверена', 'принята', 'ошибка 1', 'ошибка 2'], (
+            'Статусы должны уходить раньше ошибок, '
+            'а внутри класса - по порядку.'
+        )
+
+        outbox.put('e3', '1', 'ошибка 3', priority=PRIORITY_ALERT)
+        outbox.drain(lambda chat_id, text: False)
+        outbox.put('s3', '1', 'отклонена')
+        sent.clear()
+        outbox.drain(lambda chat_id, text: sent.append(text) or True)
+        assert sent == ['отклонена'], (
+            'Отложенная ошибка не должна задерживать новый статус.'
+        )
+
+    def test_alerts_are_collapsed_or_dropped_under_backlog(self):
+        outbox = Outbox(':memory:', backlog_limit=3)
+        outbox.put('s1', '1', 'статус 1')
+        assert outbox.put('e1', '1', 'ошибка 1', priority=PRIORITY_ALERT)
+        outbox.put('s2', '2', 'статус 2')
+        collapsed = metrics.get(
+            'outbox_collapsed', sink='telegram', priority=PRIORITY_ALERT
+        )
+        assert not outbox.put('e2', '1', 'ошибка 2', priority=PRIORITY_ALERT)
+        assert not outbox.put('e3', '2', 'ошибка 3', priority=PRIORITY_ALERT)
+        assert outbox.put('s3', '2', 'статус 3'), (
+            'Уведомления о статусах принимаются всегда.'
+        )
+        assert metrics.get(
+            'outbox_collapsed', sink='telegram', priority=PRIORITY_ALERT
+        ) == collapsed + 1
+        sent = []
+        outbox.drain(lambda chat_id, text: sent.append(text) or True)
+        assert sorted(sent) == ['ошибка 2', 'статус 1', 'статус 2', 'статус 3']
+
+    def test_old_sent_and_dead_messages_are_purged(self, tmp_path):
+        path = str(tmp_path / 'outbox.sqlite3')
+        outbox = Outbox(path, retention=100, max_attempts=1)
+        outbox.put('sent', '1', 'доставлено')
+        outbox.put('dead', '2', 'не доставлено')
+        outbox.put('webhook', '1', 'доставлено', sink='webhook')
+        outbox.drain(lambda chat_id, text: chat_id == '1')
+        outbox.drain(lambda chat_id, text: True, sink='webhook')
+        outbox.put('fresh', '1', 'только что')
+        outbox.drain(lambda chat_id, text: True)
+        outbox.put('pending', '2', 'ждёт')
+        connection = sqlite3.connect(path)
+        connection.execute(
+            'UPDATE outbox SET sent = sent - 200, dead = dead - 200 '
+            "WHERE key != 'fresh'"
+        )
+        connection.commit()
+        connection.close()
+
+        worker = DeliveryWorker(outbox, None, sink='telegram')
+        assert worker.purge() == 2
+        assert worker.purge() == 0, (
+            'Чистка не должна повторяться чаще purge_interval.'
+        )
+        assert not outbox.put('fresh', '1', 'только что'), (
+            'Недавно доставленное сообщение должно оставаться в журнале.'
+        )
+        assert outbox.put('sent', '1', 'доставлено')
+        assert [row[2] for row in outbox.pending(sink='telegram')] == [
+            'ждёт', 'доставлено'
+        ]
+        assert outbox.purge('webhook') == 1
+        outbox.close()
+
+    def test_priority_column_is_migrated(self, tmp_path):
+        path = str(tmp_path / 'outbox.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.execute(
+            'CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'key TEXT NOT NULL UNIQUE, chat_id TEXT NOT NULL, '
+            'text TEXT NOT NULL, created REAL NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'next_attempt REAL NOT NULL DEFAULT 0, sent REAL, dead REAL, '
+            'last_error TEXT)'
+        )
+        connection.execute(
+            "INSERT INTO outbox (key, chat_id, text, created) "
+            "VALUES ('old', '1', 'старое', 0)"
+        )
+        connection.commit()
+        connection.close()
+        outbox = Outbox(path)
+        outbox.put('e', '1', 'ошибка', priority=PRIORITY_ALERT)
+        assert [row[2] for row in outbox.pending()] == ['старое', 'ошибка']
+        outbox.close()
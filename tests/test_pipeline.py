@@ -0,0 +1,158 @@
+import threading
+import time
+
+from pipeline import Pipeline, Stage, ThreadPoolEngine, current_deadline
+
+
+class TestPipeline:
+
+    def test_items_pass_all_stages_and_errors_are_reported(self):
+        delivered = []
+        errors = []
+
+        def validate(item):
+            if item < 0:
+                raise ValueError(item)
+            return item
+
+        pipeline = Pipeline(
+            [
+                Stage('double', lambda item: item * 2, workers=2),
+                Stage('validate', validate),
+                Stage('deliver', delivered.append),
+            ],
+            on_error=lambda stage, item, error: errors.append((stage, item)),
+            maxsize=2,
+        ).start()
+        try:
+            for item in (1, 2, -3, 4):
+                pipeline.submit(item)
+            pipeline.join()
+        finally:
+            pipeline.close()
+        assert sorted(delivered) == [2, 4, 8]
+        assert errors == [('validate', -6)], (
+            'Исключение стадии должно передаваться в on_error '
+            'вместе с названием стадии и элементом.'
+        )
+        assert [stage.processed for stage in pipeline.stats()] == [4, 4, 3]
+
+    def test_failing_error_handler_does_not_hang_join(self):
+        delivered = []
+
+        def fail(item):
+            if item < 0:
+                raise ValueError(item)
+            return item
+
+        def broken_on_error(stage, item, error):
+            raise RuntimeError('база заблокирована')
+
+        pipeline = Pipeline(
+            [Stage('validate', fail), Stage('deliver', delivered.append)],
+            on_error=broken_on_error,
+        ).start()
+        try:
+            for item in (-1, 2):
+                pipeline.submit(item)
+            pipeline.join()
+        finally:
+            pipeline.close()
+        assert delivered == [2], (
+            'Поток стадии должен пережить ошибку в on_error.'
+        )
+
+        engine = ThreadPoolEngine(
+            [Stage('validate', fail), Stage('deliver', delivered.append)],
+            on_error=broken_on_error, workers=1,
+        ).start()
+        try:
+            engine.submit(-1)
+            engine.submit(3)
+            assert engine.join()
+        finally:
+            engine.close()
+        assert delivered == [2, 3]
+
+    def test_full_queue_applies_backpressure(self):
+        release = threading.Event()
+        pipeline = Pipeline(
+            [Stage('slow', lambda item: release.wait())],
+            on_error=None,
+            maxsize=1,
+        ).start()
+        pipeline.submit(1)
+        pipeline.submit(2)
+        producer = threading.Thread(target=pipeline.submit, args=(3,))
+        producer.start()
+        producer.join(0.2)
+        assert producer.is_alive(), (
+            'Поставщик должен ждать, пока в ограниченной очереди '
+            'не освободится место.'
+        )
+        assert pipeline.stats()[0].peak == 1
+        release.set()
+        producer.join()
+        pipeline.join()
+        pipeline.close()
+
+    def test_engine_runs_all_stages_in_one_task(self):
+        delivered = []
+        errors = []
+        threads = set()
+
+        def double(item):
+            threads.add(threading.current_thread().name)
+            if item < 0:
+                raise ValueError(item)
+            return item * 2
+
+        def deliver(item):
+            assert current_deadline.get() is not None
+            delivered.append(item)
+
+        engine = ThreadPoolEngine(
+            [Stage('double', double), Stage('deliver', deliver)],
+            on_error=lambda stage, item, error: errors.append((stage, item)),
+            workers=4, deadline=1,
+            initializer=lambda: threads.add('init'),
+        ).start()
+        try:
+            for item in (1, 2, -3, 4):
+                engine.submit(item)
+            assert engine.join()
+        finally:
+            engine.close()
+        assert sorted(delivered) == [2, 4, 8]
+        assert errors == [('double', -3)]
+        assert 'init' in threads
+        assert [stage.processed for stage in engine.stats()] == [4, 3]
+
+    def test_engine_deadline_and_duplicate_items(self):
+        release = threading.Event()
+        errors = []
+        engine = ThreadPoolEngine(
+            [
+                Stage('slow', lambda item: release.wait(1) and item),
+                Stage('deliver', lambda item: None),
+            ],
+            on_error=lambda stage, item, error: errors.append(
+                (stage, type(error))
+            ),
+            workers=1, deadline=0.1,
+        ).start()
+        try:
+            assert engine.submit('a')
+            assert not engine.submit('a'), (
+                'Элемент, который ещё обрабатывается, не принимается повторно.'
+            )
+            started = time.monotonic()
+            assert not engine.join()
+            assert time.monotonic() - started < 0.5, (
+                'join не должен ждать задачу дольше её срока.'
+            )
+            assert engine.timed_out == 1
+            release.set()
+        finally:
+            engine.close()
+        assert errors == [('deliver', TimeoutError)]
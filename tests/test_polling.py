@@ -0,0 +1,108 @@
+import logging
+
+import pytest
+
+from polling import LoadShedder, PollingPolicy, Scheduler
+from records import HomeworkRecord
+from subscriptions import Subscription
+import simulator
+
+REVIEWING = Subscription('1', 'reviewing-token')
+APPROVED = Subscription('2', 'approved-token')
+FRESH = Subscription('3', 'fresh-token')
+
+
+@pytest.fixture
+def subscriptions():
+    return [FRESH, APPROVED, REVIEWING]
+
+
+@pytest.fixture
+def app_settings():
+    return {'SHED_LAG_THRESHOLD': 10.0}
+
+
+@pytest.fixture
+def app(app, homework_module):
+    states = app.poller.states
+    states[REVIEWING].last = HomeworkRecord(
+        'hw1.zip', homework_module.STATUSES.index('reviewing')
+    )
+    states[APPROVED].last = HomeworkRecord(
+        'hw2.zip', homework_module.STATUSES.index('approved')
+    )
+    return app
+
+
+class TestPolling:
+
+    def test_policy_backoff_is_capped(self):
+        policy = PollingPolicy(600, 1800, error_backoff=2, max_interval=3600)
+        assert policy.next_delay() == 600
+        assert policy.next_delay(active=False) == 1800
+        assert policy.next_delay(consecutive_errors=1) == 1200
+        assert policy.next_delay(consecutive_errors=10) == 3600, (
+            'Пауза после ошибок не должна превышать max_interval.'
+        )
+
+    def test_scheduler_reschedule_and_remove(self):
+        scheduler = Scheduler()
+        scheduler.schedule('a', 10)
+        scheduler.schedule('b', 5)
+        scheduler.schedule('a', 1)
+        scheduler.schedule('c', 2)
+        scheduler.remove('c')
+        assert scheduler.next_due() == 1
+        assert scheduler.pop_due(6) == [('a', 1), ('b', 5)], (
+            'Перенесённый опрос должен выполняться один раз, '
+            'а снятый с расписания - не выполняться.'
+        )
+        assert len(scheduler) == 0
+
+    def test_simulation_trades_calls_for_delay(self):
+        duration = 2 * simulator.DAY
+        timelines = simulator.generate_timelines(20, duration, seed=1)
+        fast = simulator.simulate(timelines, PollingPolicy(300), duration)
+        slow = simulator.simulate(timelines, PollingPolicy(1200), duration)
+        assert fast.api_calls > slow.api_calls
+        assert fast.mean_delay < slow.mean_delay
+        assert slow.max_delay <= 1200, (
+            'Задержка уведомления не может превышать период опроса.'
+        )
+
+    def test_shedder_stretches_with_hysteresis(self):
+        shedder = LoadShedder(threshold=10, max_stretch=8)
+        assert [shedder.observe(lag) for lag in (20, 20, 20, 20)] == [
+            2, 4, 8, 8
+        ]
+        assert shedder.observe(7) == 8, (
+            'Отставание между порогами не должно менять множитель.'
+        )
+        assert [shedder.observe(0) for _ in range(3)] == [4, 2, 1]
+        assert not shedder.shedding
+
+    def test_overload_stretches_only_idle_subscriptions(
+            self, app, homework_module, caplog
+    ):
+        for subscription in (FRESH, APPROVED, REVIEWING):
+            app.scheduler.schedule(subscription, 100)
+        with caplog.at_level(logging.WARNING):
+            due = app.pop_due(130)
+        assert app.shedder.shedding
+        assert 'отстаёт от расписания' in caplog.text
+        assert due[0] == REVIEWING, (
+            'При перегрузке первой опрашивается подписка с работой '
+            'на проверке.'
+        )
+        for subscription in due:
+            app.poller.states[subscription].active = False
+        app.reschedule(due, 130)
+        scheduled = dict(app.scheduler.pop_due(float('inf')))
+        idle = app.policy.next_delay(active=False)
+        assert scheduled[REVIEWING] == 130 + idle
+        assert scheduled[APPROVED] == scheduled[FRESH] == 130 + 2 * idle
+
+        app.pop_due(131)
+        assert app.shedder.stretch == 1, (
+            'Когда опрос догнал расписание, паузы восстанавливаются.'
+        )
@@ -0,0 +1,113 @@
+import pytest
+import requests
+
+import cli
+from conftest import Clock, FakeResponse
+from outbox import Outbox
+from polling import PollingPolicy
+from quotas import Quota, UsageLedger, read_usage, top_consumers
+from subscriptions import Subscription, SubscriptionState
+
+SUBSCRIPTION = Subscription('12345', 'sometoken')
+
+
+class TestUsageLedger:
+
+    def test_request_quota_throttles_until_window_end(self):
+        clock = Clock(1000.0)
+        ledger = UsageLedger(Quota(requests=3, window=100), clock)
+        for _ in range(2):
+            assert ledger.record('a', requests=1) is None
+        assert ledger.record('a', requests=1) == 'requests'
+        assert ledger.blocked_until('a') == 1100
+        assert ledger.blocked_until('b') is None
+        clock.now = 1100
+        assert ledger.blocked_until('a') is None
+        assert ledger.record('a', requests=1) is None, (
+            'В новом окне счётчики квоты начинаются заново.'
+        )
+        assert ledger.get('a')['requests'] == 4
+
+    def test_errors_suspend_tenant(self):
+        clock = Clock(1000.0)
+        ledger = UsageLedger(
+            Quota(errors=2, window=100, suspend=1000), clock
+        )
+        ledger.record('a', errors=1)
+        assert ledger.record('a', errors=1) == 'errors'
+        clock.now = 1500
+        assert ledger.blocked_until('a') == 2000, (
+            'Ошибки должны приостанавливать подписку дольше одного окна.'
+        )
+
+    def test_top_consumers_report(self, tmp_path, capsys):
+        ledger = UsageLedger(Quota(messages=1), Clock(1000.0))
+        ledger.record('quiet', requests=1, bytes=10)
+        ledger.record('noisy', requests=5, bytes=5000)
+        ledger.record('chatty', requests=2, messages=1)
+        path = str(tmp_path / 'usage.json')
+        ledger.write(path)
+        assert [tenant for tenant, _ in top_consumers(
+            read_usage(path), 'bytes', 2
+        )] == ['noisy', 'quiet']
+
+        assert cli.main(['tenants', path, '--top', '2']) == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[1].split()[:3] == ['noisy', '5', '5000']
+        assert lines[2].startswith('chatty')
+        assert 'messages до' in lines[2]
+
+
+class TestPollerQuotas:
+
+    @pytest.fixture
+    def ledger(self, monkeypatch, homework_module):
+        homework_module.load_settings()
+        ledger = UsageLedger(Quota(requests=2, errors=2, suspend=1000))
+        monkeypatch.setattr(homework_module, 'usage', ledger)
+        return ledger
+
+    def test_requests_and_bytes_are_accounted(
+            self, ledger, monkeypatch, homework_module
+    ):
+        monkeypatch.setattr(requests, 'get', lambda *args, **kwargs: (
+            FakeResponse({'homeworks': []})
+        ))
+        poller = homework_module.Poller(
+            None, {SUBSCRIPTION: SubscriptionState()}, Outbox(':memory:')
+        )
+        poller.fetch((SUBSCRIPTION, None))
+        assert ledger.get(SUBSCRIPTION.id)['bytes'] == 17
+        policy = PollingPolicy(600, 600, 1, 3600)
+        assert poller.next_delay(SUBSCRIPTION, policy) == 600
+        poller.fetch((SUBSCRIPTION, None))
+        assert ledger.blocked_until(SUBSCRIPTION.id) is not None
+        assert poller.next_delay(SUBSCRIPTION, policy) > 3000, (
+            'Подписка сверх квоты должна ждать конца окна.'
+        )
+        poller.outbox.close()
+
+    def test_failing_tenant_is_suspended(
+            self, ledger, monkeypatch, homework_module
+    ):
+        calls = []
+        monkeypatch.setattr(
+            requests, 'get', lambda *args, **kwargs: calls.append(kwargs)
+        )
+        poller = homework_module.Poller(
+            None, {SUBSCRIPTION: SubscriptionState()}, Outbox(':memory:')
+        )
+        for _ in range(2):
+            poller.on_error(
+                'fetch', (SUBSCRIPTION, None), ConnectionError('нет связи')
+            )
+        usage = ledger.get(SUBSCRIPTION.id)
+        assert (usage['errors'], usage['messages']) == (2, 1), (
+            'Повтор ошибки не отправляется сразу и не считается сообщением.'
+        )
+        assert usage['reason'] == 'errors'
+        assert poller.status_reply('12345', ttl=0) == (
+            homework_module.STATUS_UNKNOWN
+        )
+        assert calls == [], '/status не должен обходить блокировку.'
+        poller.outbox.close()
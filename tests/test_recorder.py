@@ -0,0 +1,53 @@
+from http import HTTPStatus
+
+import requests
+
+import recorder
+from conftest import FakeResponse
+
+
+class TestRecorder:
+
+    def test_record_and_replay(
+            self, monkeypatch, tmp_path, homework_module,
+            data_with_new_hw_status
+    ):
+        record_file = str(tmp_path / 'traffic.jsonl')
+        monkeypatch.setattr(homework_module, 'API_RECORD_FILE', record_file)
+        responses = [
+            FakeResponse(data_with_new_hw_status),
+            FakeResponse({'code': 'not_authenticated'},
+                         HTTPStatus.UNAUTHORIZED),
+        ]
+        monkeypatch.setattr(
+            requests, 'get', lambda *args, **kwargs: responses.pop(0)
+        )
+        homework_module.get_api_answer(0)
+        try:
+            homework_module.get_api_answer(0)
+        except Exception:
+            pass
+        recorder.get_recorder(record_file).close()
+
+        records = list(recorder.read_records(record_file))
+        assert [record['status'] for record in records] == [200, 401], (
+            'Рекордер должен сохранять каждый ответ API, включая ошибочные.'
+        )
+
+        messages = []
+        stats = recorder.replay(record_file, messages.append)
+        assert stats.records == 2 and stats.errors == 1
+        assert messages == [
+            homework_module.parse_status(
+                data_with_new_hw_status['homeworks'][0]
+            )
+        ], 'Воспроизведение должно пропускать ответы через parse_status.'
+
+    def test_read_records_skips_truncated_tail(self, tmp_path):
+        record_file = tmp_path / 'traffic.jsonl'
+        record_file.write_text(
+            '{"ts":1,"status":200,"body":"{}"}\n{"ts":2,"sta', encoding='utf-8'
+        )
+        assert len(list(recorder.read_records(str(record_file)))) == 1, (
+            'Недописанная последняя строка не должна ломать чтение записей.'
+        )
@@ -0,0 +1,82 @@
+import tracemalloc
+
+from records import HomeworkRecord, format_timestamp, parse_timestamp
+from subscriptions import Subscription, SubscriptionState
+
+TENANTS = 1000
+# Подписка, её состояние с последней работой и запись в словаре состояний.
+BYTES_PER_TENANT = 600
+
+
+def api_homework(number):
+    return {
+        'id': number,
+        'homework_name': 'username__hw_python_oop.zip',
+        'status': 'approved',
+        'reviewer_comment': 'Принято!',
+        'date_updated': f'2021-04-11T10:31:{number % 60:02d}Z',
+        'lesson_name': 'Проект спринта: Деплой бота'
+    }
+
+
+def measure(build):
+    tracemalloc.start()
+    try:
+        states = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(states) == TENANTS
+    return size / TENANTS
+
+
+class TestRecords:
+
+    def test_parse_homework(self, homework_module, data_with_new_hw_status):
+        homework = data_with_new_hw_status['homeworks'][0]
+        record = homework_module.parse_homework(homework)
+        assert record == HomeworkRecord(
+            'hw123.zip', homework_module.STATUSES.index('approved'),
+            parse_timestamp('2021-04-11T10:31:09Z')
+        )
+        assert format_timestamp(record.updated) == homework['date_updated']
+        assert homework_module.render_status(record) == (
+            homework_module.parse_status(homework)
+        )
+        assert not hasattr(record, '__dict__')
+        assert not hasattr(SubscriptionState(), '__dict__')
+
+    def test_parse_timestamp_tolerates_bad_values(self):
+        assert parse_timestamp(None) is None
+        assert parse_timestamp('вчера') is None
+        assert format_timestamp(None) is None
+
+    def test_memory_per_tenant(self, homework_module):
+        def compact():
+            states = {}
+            for number in range(TENANTS):
+                state = SubscriptionState()
+                state.from_date = 1618137069 + number
+                state.last = homework_module.parse_homework(
+                    api_homework(number)
+                )
+                states[Subscription(str(number), f'token-{number}')] = state
+            return states
+
+        def raw():
+            return {
+                Subscription(str(number), f'token-{number}'): {
+                    'from_date': 1618137069 + number,
+                    'last': api_homework(number),
+                    'message': homework_module.parse_status(
+                        api_homework(number)
+                    ),
+                }
+                for number in range(TENANTS)
+            }
+
+        compact_size = measure(compact)
+        assert compact_size < BYTES_PER_TENANT, (
+            f'Состояние подписки занимает {compact_size:.0f} байт'
+        )
+        assert compact_size < measure(raw) / 2
@@ -0,0 +1,106 @@
+import pytest
+
+import sharding
+from outbox import Outbox
+from records import HomeworkRecord
+from sharding import HashRing, ShardStore, worker_path
+from subscriptions import Subscription, SubscriptionState
+
+SUBSCRIPTION_IDS = [f'subscription-{number}' for number in range(1000)]
+
+
+class TestSharding:
+
+    def test_adding_node_moves_minimal_set(self):
+        before = HashRing(['a', 'b', 'c', 'd'])
+        after = HashRing(['a', 'b', 'c', 'd', 'e'])
+        moved = [
+            key for key in SUBSCRIPTION_IDS
+            if before.node_for(key) != after.node_for(key)
+        ]
+        assert all(after.node_for(key) == 'e' for key in moved), (
+            'При добавлении процесса подписки должны переезжать '
+            'только на новый процесс.'
+        )
+        assert len(moved) < len(SUBSCRIPTION_IDS) * 0.3
+
+    def test_store_rebalances_only_changed_owners(self, tmp_path):
+        store = ShardStore(str(tmp_path / 'shards.sqlite3'))
+        store.heartbeat('host-0')
+        store.heartbeat('host-1')
+        assert store.rebalance(SUBSCRIPTION_IDS) == len(SUBSCRIPTION_IDS)
+        assert store.rebalance(SUBSCRIPTION_IDS) == 0
+
+        store.heartbeat('host-2')
+        moved = store.rebalance(SUBSCRIPTION_IDS)
+        assert 0 < moved == len(store.owned('host-2'))
+        owned = [store.owned(f'host-{number}') for number in range(3)]
+        assert sum(map(len, owned)) == len(SUBSCRIPTION_IDS), (
+            'Каждая подписка должна принадлежать ровно одному процессу.'
+        )
+
+        store.rebalance(SUBSCRIPTION_IDS[:10])
+        assert len(store.assignments()) == 10
+        store.close()
+
+    def test_supervisor_assigns_subscriptions_added_later(
+            self, tmp_path, monkeypatch
+    ):
+        path = str(tmp_path / 'shards.sqlite3')
+        ShardStore(path).heartbeat('host-0')
+        registry = [['subscription-0'], ['subscription-0', 'subscription-1']]
+        rounds = []
+
+        def load_ids():
+            return registry[min(len(rounds), 1)]
+
+        def sleep(interval):
+            rounds.append(interval)
+            if len(rounds) == 2:
+                raise StopIteration
+
+        monkeypatch.setattr(sharding.time, 'sleep', sleep)
+        with pytest.raises(StopIteration):
+            sharding.supervise(0, path, load_ids)
+        store = ShardStore(path)
+        assert store.owned('host-0') == {'subscription-0', 'subscription-1'}, (
+            'Подписки, добавленные в реестр после запуска, тоже должны '
+            'назначаться.'
+        )
+        store.close()
+
+    def test_worker_files_are_separate(self):
+        assert worker_path('/data/history.bin', 'host-0') == (
+            '/data/history.host-0.bin'
+        )
+        assert worker_path('metrics.prom', 'host-1') == 'metrics.host-1.prom'
+        assert worker_path(':memory:', 'host-0') == ':memory:'
+        assert worker_path(None, 'host-0') is None
+
+    def test_moved_subscription_is_not_notified_twice(
+            self, tmp_path, homework_module
+    ):
+        homework_module.load_settings()
+        assert 'OUTBOX_FILE' not in homework_module.WORKER_FILES
+        path = str(tmp_path / 'outbox.sqlite3')
+        subscription = Subscription('12345', 'sometoken')
+        record = HomeworkRecord('hw123.zip', 1, 1000)
+        sent = []
+
+        class Bot:
+            def send_message(self, chat_id, text):
+                sent.append(text)
+
+        for _ in ('host-0', 'host-1'):
+            # Каждый исполнитель начинает с пустым состоянием подписки.
+            poller = homework_module.Poller(
+                Bot(), {subscription: SubscriptionState()}, Outbox(path)
+            )
+            item = poller.diff((subscription, (None, record)))
+            poller.deliver(poller.render(item))
+            poller.delivery.flush()
+            poller.outbox.close()
+        assert len(sent) == 1, (
+            'Подписка, переехавшая к другому исполнителю, не должна '
+            'получать уведомление повторно.'
+        )
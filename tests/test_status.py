@@ -0,0 +1,150 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from conftest import FakeResponse
+from outbox import Outbox
+from records import HomeworkRecord, format_timestamp
+from subscriptions import Subscription, SubscriptionState
+
+SUBSCRIPTION = Subscription('12345', 'sometoken')
+
+
+class CommandBot:
+    def __init__(self):
+        self.handlers = []
+        self.sent = []
+        self.stopped = threading.Event()
+
+    def register_message_handler(self, handler, commands=None):
+        self.handlers.append((handler, commands))
+
+    def infinity_polling(self):
+        self.stopped.wait(5)
+
+    def stop_polling(self):
+        self.stopped.set()
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture
+def poller(homework_module):
+    homework_module.load_settings()
+    poller = homework_module.Poller(
+        CommandBot(), {SUBSCRIPTION: SubscriptionState()}, Outbox(':memory:')
+    )
+    yield poller
+    poller.outbox.close()
+
+
+@pytest.fixture
+def api_calls(monkeypatch, data_with_new_hw_status):
+    calls = []
+
+    def get(*args, **kwargs):
+        calls.append(kwargs)
+        return FakeResponse(data_with_new_hw_status)
+
+    monkeypatch.setattr(requests, 'get', get)
+    return calls
+
+
+class TestStatusCommand:
+
+    def test_fresh_state_is_answered_from_cache(
+            self, poller, api_calls, homework_module
+    ):
+        state = poller.states[SUBSCRIPTION]
+        state.last = HomeworkRecord(
+            'hw1.zip', homework_module.STATUSES.index('reviewing')
+        )
+        state.checked = time.time() - 10
+        reply = poller.status_reply(12345, ttl=600)
+        assert api_calls == [], 'Свежее состояние не должно запрашивать API.'
+        assert homework_module.HOMEWORK_VERDICTS['reviewing'] in reply
+        assert time.strftime(
+            homework_module.STATUS_TIME_FORMAT,
+            time.localtime(state.checked)
+        ) in reply
+
+    def test_stale_state_is_refreshed(
+            self, poller, api_calls, homework_module
+    ):
+        reply = poller.status_reply('12345', ttl=600)
+        assert len(api_calls) == 1
+        assert api_calls[0]['headers'] == SUBSCRIPTION.headers
+        assert homework_module.HOMEWORK_VERDICTS['approved'] in reply
+        poller.status_reply('12345', ttl=600)
+        assert len(api_calls) == 1, (
+            'Повторный запрос в пределах TTL должен браться из кэша.'
+        )
+
+    def test_refresh_asks_only_for_recent_changes(self, poller, api_calls):
+        state = poller.states[SUBSCRIPTION]
+        state.from_date = 1000
+        poller.status_reply('12345', ttl=600)
+        assert api_calls[-1]['params'] == {'from_date': 0}, (
+            'Пока последняя работа неизвестна, нужна вся история.'
+        )
+        state.checked = None
+        poller.status_reply('12345', ttl=600)
+        assert api_calls[-1]['params'] == {'from_date': 1000}
+
+    def test_homework_older_than_window_is_reported(
+            self, poller, monkeypatch, homework_module
+    ):
+        updated = int(time.time()) - 30 * 86400
+
+        def get(*args, params=None, **kwargs):
+            return FakeResponse({
+                'homeworks': [{
+                    'homework_name': 'hw1.zip', 'status': 'approved',
+                    'date_updated': format_timestamp(updated),
+                }] if updated >= params['from_date'] else [],
+                'current_date': int(time.time()),
+            })
+
+        monkeypatch.setattr(requests, 'get', get)
+        state = poller.states[SUBSCRIPTION]
+        # Так подписку без состояния начинает опрашивать App.catch_up.
+        state.from_date = int(time.time()) - homework_module.BACKFILL_WINDOW
+        assert homework_module.HOMEWORK_VERDICTS['approved'] in (
+            poller.status_reply('12345', ttl=600)
+        ), 'Работа старше окна опроса тоже должна попадать в /status.'
+
+    def test_refresh_error_and_unknown_chat(
+            self, poller, monkeypatch, homework_module
+    ):
+        def unavailable(*args, **kwargs):
+            raise requests.exceptions.ConnectionError('API недоступен')
+
+        monkeypatch.setattr(requests, 'get', unavailable)
+        assert poller.status_reply('12345', ttl=600) == (
+            homework_module.STATUS_UNKNOWN
+        )
+        assert poller.status_reply('999', ttl=600) == (
+            homework_module.STATUS_NOT_SUBSCRIBED
+        )
+
+    def test_app_answers_status_command(
+            self, monkeypatch, api_calls, homework_module
+    ):
+        homework_module.load_settings()
+        monkeypatch.setattr(homework_module, 'STATUS_COMMAND', True)
+        bot = CommandBot()
+        app = homework_module.App(bot).start()
+        try:
+            [(handler, commands)] = bot.handlers
+            assert commands == ['status']
+            handler(SimpleNamespace(chat=SimpleNamespace(id=12345)))
+        finally:
+            app.close()
+        [(chat_id, text)] = bot.sent
+        assert chat_id == 12345
+        assert homework_module.HOMEWORK_VERDICTS['approved'] in text
+        assert not app.listener.is_alive()
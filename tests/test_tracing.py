@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+import requests
+
+from conftest import FakeResponse
+from tracing import Tracer, tracer
+
+
+class Exporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(list(spans))
+
+
+def read_spans(path):
+    lines = path.read_text().splitlines()
+    return [
+        span
+        for line in lines
+        for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0][
+            'spans'
+        ]
+    ], len(lines)
+
+
+@pytest.fixture
+def app_settings(tmp_path, monkeypatch, data_with_new_hw_status):
+    monkeypatch.setattr(
+        requests, 'get',
+        lambda *args, **kwargs: FakeResponse(data_with_new_hw_status)
+    )
+    yield {
+        'TRACE_SAMPLE_RATE': 1.0,
+        'TRACE_FILE': str(tmp_path / 'traces.jsonl'),
+    }
+    tracer.configure(0.0, None)
+
+
+class TestTracing:
+
+    def test_unsampled_cycle_creates_no_spans(self):
+        exporter = Exporter()
+        sampler = Tracer(0.25, exporter, sample=lambda: 0.5)
+        with sampler.trace('poll_cycle') as root:
+            with sampler.span('fetch') as span:
+                assert root is None and span is None
+        assert exporter.traces == []
+
+    def test_spans_are_nested_and_errors_recorded(self):
+        exporter = Exporter()
+        sampler = Tracer(0.25, exporter, sample=lambda: 0.1)
+        with pytest.raises(ValueError):
+            with sampler.trace('poll_cycle') as root:
+                with sampler.span('fetch') as fetch:
+                    with sampler.span('http_request'):
+                        pass
+                with sampler.span('diff', root):
+                    raise ValueError('boom')
+        [spans] = exporter.traces
+        by_name = {span.name: span for span in spans}
+        assert by_name['http_request'].parent_id == fetch.span_id
+        assert by_name['fetch'].parent_id == root.span_id
+        assert by_name['poll_cycle'].parent_id is None
+        assert {span.trace.trace_id for span in spans} == {
+            root.trace.trace_id
+        }
+        assert by_name['diff'].as_otlp()['status'] == {
+            'code': 2, 'message': 'ValueError: boom'
+        }
+        assert by_name['poll_cycle'].error is not None, (
+            'Ошибка должна отмечаться и в корневом спане.'
+        )
+
+    def test_poll_cycle_is_exported_stage_by_stage(
+            self, app, tmp_path, homework_module
+    ):
+        app.poll(app.pop_due(time.monotonic()))
+        assert app.poller.bot.sent, 'Уведомление должно быть отправлено.'
+
+        spans, traces = read_spans(tmp_path / 'traces.jsonl')
+        assert traces == 1, 'Цикл опроса - одна трасса.'
+        by_name = {span['name']: span for span in spans}
+        for name in (
+            'poll_cycle', 'fetch', 'get_api_answer', 'upstream_wait',
+            'http_request', 'check_response', 'parse_status',
+            'dedupe_check', 'send_message',
+        ):
+            assert name in by_name, f'Нет спана {name}.'
+        assert len({span['traceId'] for span in spans}) == 1
+        root = by_name['poll_cycle']
+        assert 'parentSpanId' not in root
+        assert by_name['fetch']['parentSpanId'] == root['spanId']
+        assert by_name['send_message']['parentSpanId'] == root['spanId']
+        assert (
+            by_name['http_request']['parentSpanId']
+            == by_name['get_api_answer']['spanId']
+        )
+        attributes = {
+            attribute['key']: attribute['value']
+            for attribute in by_name['http_request']['attributes']
+        }
+        assert attributes['http.response.status_code'] == {
+            'intValue': '200'
+        }
+        assert attributes['http.time_to_headers_ms'] == {'doubleValue': 5.0}
+        for span in spans:
+            assert int(span['endTimeUnixNano']) >= int(
+                span['startTimeUnixNano']
+            )
@@ -0,0 +1,113 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from transport import TelegramSession
+
+telebot = pytest.importorskip('telebot')
+from telebot import apihelper  # noqa: E402
+
+REPLY = json.dumps({'ok': True, 'result': {
+    'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+    'text': 'текст',
+}}).encode('utf-8')
+
+
+class TelegramStub:
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with lock:
+                    stub.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(REPLY)))
+                self.end_headers()
+                self.wfile.write(REPLY)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/bot{{0}}/{{1}}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = TelegramStub()
+    monkeypatch.setattr(apihelper, 'API_URL', stub.api_url)
+    yield stub
+    stub.close()
+
+
+class TestTelegramSession:
+
+    def test_sends_share_pooled_connections(self, stub):
+        session = TelegramSession(pool_size=4, read_timeout=7).install()
+        bot = telebot.TeleBot('1234:abcdefg')
+        errors = []
+
+        def burst(chat_id):
+            try:
+                for _ in range(10):
+                    bot.send_message(chat_id, 'текст')
+            except Exception as error:
+                errors.append(error)
+
+        try:
+            assert apihelper.READ_TIMEOUT == 7
+            threads = [
+                threading.Thread(target=burst, args=(chat_id,))
+                for chat_id in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            session.close()
+        assert errors == []
+        assert stub.requests == 80
+        assert stub.connections <= 4, (
+            'Отправки во все чаты должны идти через общий ограниченный пул '
+            'поддерживаемых соединений.'
+        )
+
+    def test_close_restores_telebot_defaults(self):
+        sender = apihelper.CUSTOM_REQUEST_SENDER
+        timeout = apihelper.READ_TIMEOUT
+        session = TelegramSession(read_timeout=timeout + 1).install()
+        assert apihelper.CUSTOM_REQUEST_SENDER == session.request
+        session.close()
+        assert apihelper.CUSTOM_REQUEST_SENDER is sender
+        assert apihelper.READ_TIMEOUT == timeout
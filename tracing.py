@@ -0,0 +1,197 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'homework_bot'
+
+EXPORT_FAILED = 'Не удалось записать трассу в {}: {}'
+
+# Виды спанов и коды статуса в терминах OpenTelemetry.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# Спан, в котором сейчас выполняется код потока.
+current_span = ContextVar('current_span', default=None)
+
+
+class Trace:
+    """Спаны одного цикла опроса, собранные для выгрузки."""
+
+    __slots__ = ('trace_id', 'spans', 'lock')
+
+    def __init__(self):
+        """Создаёт трассу со случайным идентификатором."""
+        self.trace_id = f'{random.getrandbits(128):032x}'
+        self.spans = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    """Участок работы с временем начала и конца в наносекундах."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start',
+                 'end', 'attributes', 'error')
+
+    def __init__(self, trace, name, parent_id=None, kind=SPAN_KIND_INTERNAL,
+                 attributes=None):
+        """Открывает спан name в трассе trace под parent_id."""
+        self.trace = trace
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set(self, **attributes):
+        """Добавляет атрибуты спана."""
+        self.attributes.update(attributes)
+
+    def finish(self):
+        """Закрывает спан и отдаёт его трассе."""
+        self.end = time.time_ns()
+        with self.trace.lock:
+            self.trace.spans.append(self)
+
+    def as_otlp(self):
+        """Возвращает спан в JSON-кодировке OTLP."""
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [
+                {'key': key, 'value': otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id is not None:
+            span['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            span['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return span
+
+
+def otlp_value(value):
+    """Кодирует значение атрибута как AnyValue OTLP."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class FileExporter:
+    """Дописывает трассы в файл, по строке ExportTraceServiceRequest.
+
+    Формат совпадает с файловым экспортёром OpenTelemetry Collector,
+    так что файл читается его otlpjsonfile-приёмником и Jaeger.
+    """
+
+    def __init__(self, path):
+        """Трассы дописываются в файл path."""
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        """Записывает спаны одной трассы."""
+        line = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [{
+                'key': 'service.name',
+                'value': otlp_value(SERVICE_NAME),
+            }]},
+            'scopeSpans': [{
+                'scope': {'name': SERVICE_NAME},
+                'spans': [span.as_otlp() for span in spans],
+            }],
+        }]}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as trace_file:
+                trace_file.write(line + '\n')
+
+
+class Tracer:
+    """Трассировка циклов опроса с выборкой в начале трассы.
+
+    Решение, записывать ли цикл, принимается один раз при открытии
+    корневого спана: с вероятностью rate. Для невыбранного цикла
+    span() ничего не создаёт, так что при rate 0 трассировка почти
+    ничего не стоит. Трасса выгружается целиком, когда закрывается
+    корневой спан.
+    """
+
+    def __init__(self, rate=0.0, exporter=None, sample=random.random):
+        """Без exporter трассы не выгружаются."""
+        self.rate = rate
+        self.exporter = exporter
+        self.sample = sample
+
+    def configure(self, rate, path):
+        """Задаёт долю записываемых циклов и файл для трасс."""
+        self.rate = rate
+        self.exporter = FileExporter(path) if path else None
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Открывает корневой спан; отдаёт его или None, если не выбран."""
+        if self.exporter is None or not self.sample() < self.rate:
+            yield None
+            return
+        trace = Trace()
+        try:
+            with self._activate(
+                Span(trace, name, attributes=attributes)
+            ) as root:
+                yield root
+        finally:
+            try:
+                self.exporter.export(trace.spans)
+                metrics.incr('traces_exported')
+            except OSError as error:
+                logger.error(EXPORT_FAILED.format(self.exporter.path, error))
+
+    @contextmanager
+    def span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, **attributes):
+        """Открывает дочерний спан текущего спана или parent.
+
+        parent передают явно, когда работа продолжается в другом потоке.
+        """
+        parent = parent or current_span.get()
+        if parent is None:
+            yield None
+            return
+        with self._activate(Span(
+            parent.trace, name, parent.span_id, kind, attributes
+        )) as span:
+            yield span
+
+    @staticmethod
+    @contextmanager
+    def _activate(span):
+        token = current_span.set(span)
+        try:
+            yield span
+        except Exception as error:
+            span.error = f'{type(error).__name__}: {error}'
+            raise
+        finally:
+            current_span.reset(token)
+            span.finish()
+
+
+tracer = Tracer()
@@ -0,0 +1,57 @@
+class TelegramSession:
+    """Общая для процесса сессия с пулом соединений к api.telegram.org.
+
+    По умолчанию telebot заводит отдельную сессию в каждом потоке
+    и пересоздаёт её раз в SESSION_TIME_TO_LIVE секунд, так что при
+    всплеске уведомлений каждый поток доставки заново открывает
+    TLS-соединение. install() направляет все запросы telebot через
+    одну сессию: соединения поддерживаются между отправками во все чаты,
+    а их число ограничено pool_size - поток, которому не хватило
+    соединения, ждёт свободное, а не открывает новое.
+    """
+
+    def __init__(self, pool_size=16, connect_timeout=5, read_timeout=30,
+                 retries=0):
+        """Таймауты задаются в секундах.
+
+        retries - повторы неудачного соединения на уровне urllib3.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True,
+            max_retries=retries
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._previous = None
+
+    def request(self, method, url, **kwargs):
+        """Выполняет запрос telebot (подпись CUSTOM_REQUEST_SENDER)."""
+        return self.session.request(method, url, **kwargs)
+
+    def install(self):
+        """Подключает сессию и таймауты к telebot."""
+        from telebot import apihelper
+        self._previous = (
+            apihelper.CUSTOM_REQUEST_SENDER, apihelper.CONNECT_TIMEOUT,
+            apihelper.READ_TIMEOUT
+        )
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+        apihelper.CONNECT_TIMEOUT = self.connect_timeout
+        apihelper.READ_TIMEOUT = self.read_timeout
+        return self
+
+    def close(self):
+        """Возвращает прежние настройки telebot и закрывает соединения."""
+        if self._previous is not None:
+            from telebot import apihelper
+            (
+                apihelper.CUSTOM_REQUEST_SENDER, apihelper.CONNECT_TIMEOUT,
+                apihelper.READ_TIMEOUT
+            ) = self._previous
+            self._previous = None
+        self.session.close()